@@ -0,0 +1,35 @@
+import threading
+
+
+class InMemoryRepository:
+    """
+    Dict-backed stand-in for Repository with the same write/lookup
+    contract, so benchmarks measure the request path without a database.
+    """
+    def __init__(self):
+        self.search_cache = None
+        self.index_filter = None
+        self._rows = {}  # national_id_index -> (id, national_id_blob)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def save_user_profile(self, national_id_blob, national_id_index):
+        with self._lock:
+            if national_id_index in self._rows:
+                raise ValueError("National ID already exists")
+            self._rows[national_id_index] = (self._next_id, national_id_blob)
+            self._next_id += 1
+
+    def save_user_profiles(self, rows) -> set:
+        inserted = set()
+        with self._lock:
+            for national_id_blob, national_id_index in rows:
+                if national_id_index not in self._rows:
+                    self._rows[national_id_index] = (self._next_id, national_id_blob)
+                    self._next_id += 1
+                    inserted.add(national_id_index)
+        return inserted
+
+    def find_by_hash(self, national_id_index):
+        row = self._rows.get(national_id_index)
+        return [row] if row is not None else []
@@ -0,0 +1,245 @@
+"""
+Latency benchmarks for the crypto primitives and the request hot paths.
+
+    python benchmarks/run_benchmarks.py --iterations 2000 --output results.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json --tolerance 0.25
+
+Without DATABASE_URL the end-to-end cases run against an in-memory
+repository; with it they go through the real Repository and Postgres.
+Keys are generated for the run unless PRIVATE_KEY_CONTENT / DEK_KEY /
+HMAC_KEY are already set. Results are JSON with p50/p95/p99 per case in
+microseconds. With --baseline, any case whose p50 or p95 is more than
+--tolerance slower than the baseline is reported and the exit code is 1.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import platform
+import statistics
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, '..', 'src'))
+sys.path.append(script_dir)
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+COMPARED_METRICS = ("p50_us", "p95_us")
+
+
+def setup_keys():
+    """Generates throwaway keys for any that are not configured."""
+    if not os.getenv("PRIVATE_KEY_CONTENT"):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        os.environ["PRIVATE_KEY_CONTENT"] = key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ).decode()
+        os.environ.setdefault("PRIVATE_KEY_PATH", "does-not-exist.pem")
+    os.environ.setdefault("DEK_KEY", base64.b64encode(os.urandom(32)).decode())
+    os.environ.setdefault("HMAC_KEY", base64.b64encode(os.urandom(32)).decode())
+
+
+class PayloadFactory:
+    """Builds hybrid RSA-OAEP + AES-GCM payloads the way the frontend does."""
+    def __init__(self, public_key_pem: str):
+        self.public_key = serialization.load_pem_public_key(public_key_pem.encode())
+
+    def make(self, plaintext: str) -> dict:
+        key = AESGCM.generate_key(bit_length=256)
+        iv = os.urandom(12)
+        ciphertext = AESGCM(key).encrypt(iv, plaintext.encode(), None)
+        wrapped = self.public_key.encrypt(
+            key,
+            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+        )
+        return {
+            "national_id": base64.b64encode(ciphertext).decode(),
+            "encrypted_key": base64.b64encode(wrapped).decode(),
+            "iv": base64.b64encode(iv).decode(),
+        }
+
+
+def national_ids(count: int, start: int = 0) -> list:
+    return [f"{n:013d}" for n in range(start, start + count)]
+
+
+def summarize(samples_ns: list, items_per_sample=1) -> dict:
+    """items_per_sample is a count shared by every sample or a list with one count per sample."""
+    if isinstance(items_per_sample, int):
+        items_per_sample = [items_per_sample] * len(samples_ns)
+    samples = sorted(samples_ns)
+    n = len(samples)
+    items = sum(items_per_sample)
+
+    def pct(p):
+        return samples[min(n - 1, int(round(p / 100 * (n - 1))))] / 1000
+
+    total_s = sum(samples) / 1e9
+    return {
+        "samples": n,
+        "items_per_sample": round(items / n, 2) if n else 0,
+        "p50_us": round(pct(50), 2),
+        "p95_us": round(pct(95), 2),
+        "p99_us": round(pct(99), 2),
+        "mean_us": round(statistics.fmean(samples) / 1000, 2),
+        "items_per_second": round(items / total_s, 1) if total_s else None,
+    }
+
+
+def measure(fn, args_list: list, warmup: int) -> list:
+    """Calls fn once per args tuple; the first warmup calls are not timed."""
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    clock = time.perf_counter_ns
+    for args in args_list[warmup:]:
+        started = clock()
+        fn(*args)
+        samples.append(clock() - started)
+    return samples
+
+
+def crypto_cases(crypto_service, factory: PayloadFactory, iterations: int, batch_size: int, warmup: int) -> dict:
+    ids = national_ids(iterations + warmup)
+    payloads = [factory.make(nid) for nid in ids]
+    blobs = crypto_service.encrypt_for_storage_many(ids)
+    results = {}
+
+    results["decrypt_transport_payload"] = summarize(measure(
+        crypto_service.decrypt_transport_payload,
+        [(p["national_id"], p["encrypted_key"], p["iv"]) for p in payloads], warmup))
+    results["encrypt_for_storage"] = summarize(measure(crypto_service.encrypt_for_storage, [(i,) for i in ids], warmup))
+    results["decrypt_from_storage"] = summarize(measure(crypto_service.decrypt_from_storage, [(b,) for b in blobs], warmup))
+    results["hash_for_index"] = summarize(measure(crypto_service.hash_for_index, [(i,) for i in ids], warmup))
+
+    # ceil(len(ids) / batch_size) batches; the last one may be short
+    starts = range(0, len(ids), batch_size)
+    id_batches = [(ids[i:i + batch_size],) for i in starts]
+    blob_batches = [(blobs[i:i + batch_size],) for i in starts]
+    payload_batches = [
+        ([(p["national_id"], p["encrypted_key"], p["iv"]) for p in payloads[i:i + batch_size]],)
+        for i in starts
+    ]
+    warm = min(warmup, 1, len(id_batches) - 1)
+    # Items in each timed (post-warmup) batch
+    sizes = [len(batch) for batch, in id_batches[warm:]]
+    results[f"decrypt_transport_payloads[{batch_size}]"] = summarize(
+        measure(crypto_service.decrypt_transport_payloads, payload_batches, warm), sizes)
+    results[f"encrypt_for_storage_many[{batch_size}]"] = summarize(
+        measure(crypto_service.encrypt_for_storage_many, id_batches, warm), sizes)
+    results[f"decrypt_from_storage_many[{batch_size}]"] = summarize(
+        measure(crypto_service.decrypt_from_storage_many, blob_batches, warm), sizes)
+    results[f"hash_for_index_many[{batch_size}]"] = summarize(
+        measure(crypto_service.hash_for_index_many, id_batches, warm), sizes)
+    return results
+
+
+def endpoint_cases(client, factory: PayloadFactory, iterations: int, warmup: int) -> dict:
+    # Fresh ids per run so submits never hit the duplicate path
+    ids = national_ids(iterations + warmup, start=int(time.time() * 1000) % 10**9 * 1000)
+    payloads = [factory.make(nid) for nid in ids]
+
+    def submit(payload):
+        resp = client.post('/api/v1/submit-user-profile', json=payload)
+        if resp.status_code != 200:
+            raise RuntimeError(f"submit failed with {resp.status_code}: {resp.get_data(as_text=True)}")
+
+    def search(nid):
+        resp = client.get(f'/api/v1/search?nid={nid}')
+        if resp.status_code != 200 or not resp.get_json():
+            raise RuntimeError(f"search failed with {resp.status_code}")
+
+    return {
+        "POST /submit-user-profile": summarize(measure(submit, [(p,) for p in payloads], warmup)),
+        "GET /search": summarize(measure(search, [(nid,) for nid in ids], warmup)),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns human-readable regressions of results against baseline."""
+    regressions = []
+    for case, base in baseline.get("results", {}).items():
+        current = results.get(case)
+        if current is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if base.get(metric) and current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{case}: {metric} {current[metric]:.1f}us vs baseline {base[metric]:.1f}us "
+                    f"({(current[metric] / base[metric] - 1) * 100:+.0f}%)"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark crypto primitives and request hot paths.")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--only", choices=["crypto", "endpoints"], help="Run one group of cases")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args(argv)
+
+    # Per-call INFO logs would dominate the timings
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    setup_keys()
+
+    from app import create_app
+    from infrastructure.container import ServiceContainer
+    from memory_repository import InMemoryRepository
+
+    repository = None if os.getenv("DATABASE_URL") else InMemoryRepository()
+    services = ServiceContainer(repository=repository)
+    logging.getLogger().setLevel(logging.WARNING)
+    factory = PayloadFactory(services.crypto_service.get_public_key_pem())
+
+    results = {}
+    if args.only in (None, "crypto"):
+        results.update(crypto_cases(services.crypto_service, factory, args.iterations, args.batch_size, args.warmup))
+    if args.only in (None, "endpoints"):
+        app = create_app(services)
+        logging.getLogger().setLevel(logging.WARNING)
+        results.update(endpoint_cases(app.test_client(), factory, args.iterations, args.warmup))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repository": "postgres" if repository is None else "memory",
+            "storage_layout": services.crypto_service.storage_layout.name,
+            "iterations": args.iterations,
+            "batch_size": args.batch_size,
+        },
+        "results": results,
+    }
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(rendered + "\n")
+    else:
+        print(rendered)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
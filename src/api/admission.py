@@ -0,0 +1,78 @@
+"""
+Admission control hooks for the Flask app; see infrastructure.admission.
+
+Runs before the view, so a shed request costs no crypto or DB work. The
+gunicorn worker needs more threads than the admitted and queued requests
+(gthread), or requests wait in gunicorn's own unbounded backlog instead.
+"""
+import os
+import time
+import ipaddress
+from flask import current_app, g, jsonify, request
+from infrastructure.admission import AdmissionController, AdmissionRejected
+from infrastructure.metrics import METRICS
+
+# Flask endpoint -> admission class; anything else is never queued
+ROUTE_CLASSES = {
+    "ingress.secure_ingress": "submit",
+    "ingress.secure_ingress_batch": "submit_batch",
+    "ingress.open_transport_session": "transport_session",
+    "ingress.search": "search",
+    "ingress.search_batch": "search_batch",
+    "ingress.export_profiles": "export",
+}
+
+
+def install_admission(app, controller: AdmissionController):
+    app.extensions["admission"] = controller
+    # Set by the reverse proxy (nginx) and only trusted from its addresses
+    # ("10.0.0.2,172.18.0.0/16"); anyone else is keyed by the peer address
+    app.config.setdefault("ADMISSION_CLIENT_HEADER", os.getenv("ADMISSION_CLIENT_HEADER", "X-Real-IP"))
+    app.config.setdefault("ADMISSION_TRUSTED_PROXIES", parse_trusted_proxies(
+        os.getenv("ADMISSION_TRUSTED_PROXIES", "")))
+    app.before_request(_admit)
+    app.teardown_request(_release)
+    if METRICS.enabled:
+        METRICS.set_gauge_source("admission", controller.gauges)
+
+
+def parse_trusted_proxies(spec: str) -> tuple:
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip())
+
+
+def _trusted_proxy(addr: str) -> bool:
+    proxies = current_app.config["ADMISSION_TRUSTED_PROXIES"]
+    if not proxies or not addr:
+        return False
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def _client_id() -> str:
+    # A client connecting directly could otherwise pick a fresh header value per request
+    if _trusted_proxy(request.remote_addr):
+        return request.headers.get(current_app.config["ADMISSION_CLIENT_HEADER"]) or request.remote_addr
+    return request.remote_addr
+
+
+def _admit():
+    route = ROUTE_CLASSES.get(request.endpoint)
+    if route is None:
+        return None
+    try:
+        current_app.extensions["admission"].admit(route, _client_id())
+    except AdmissionRejected as e:
+        error = "Too many requests" if e.status_code == 429 else "Server busy, retry later"
+        return jsonify({"error": error}), e.status_code, {"Retry-After": str(e.retry_after)}
+    g.admission = (route, time.monotonic())
+    return None
+
+
+def _release(exc):
+    ticket = g.pop("admission", None)
+    if ticket is not None:
+        route, started = ticket
+        current_app.extensions["admission"].release(route, time.monotonic() - started)
@@ -0,0 +1,246 @@
+"""
+Async versions of the /api/v1 routes in api.ingress, served by asgi.py.
+
+Database I/O is awaited on the event loop. Crypto (RSA unwrap, AES-GCM,
+HMAC) runs in the app's crypto executor so it never blocks the loop.
+"""
+import os
+import json
+import asyncio
+import logging
+import contextvars
+from pydantic import ValidationError
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from commands.submit_data import SubmitBatchCommandHandler, prepare_submit
+from queries.search_data import SearchBatchQueryHandler, unique_indexes
+from queries.export_profiles import ExportQueryHandler, CONTENT_TYPES
+from domain.models import SubmitUserRequestModel, TransportSessionRequestModel, ExportProfilesRequestModel
+from api.batch_items import (BatchRequestError, SEARCH_STATUSES, parse_submit_batch, parse_search_batch,
+                              build_batch_response)
+from infrastructure.transport_decryptor import TransportQueueFullError
+from infrastructure.session_keys import TransportSessionError
+from infrastructure.idempotency import (IDEMPOTENCY_HEADER, REPLAYED_HEADER, request_fingerprint, idempotency_key,
+                                        stored_response, should_store)
+from infrastructure.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+BUSY_RESPONSE = {"error": "Server busy, retry later"}
+
+
+async def run_cpu(request: Request, fn, *args):
+    """Runs CPU-bound crypto in the crypto executor instead of on the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carry the request context so stage timings land in this request's Server-Timing
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(request.app.state.crypto_executor, ctx.run, fn, *args)
+
+
+async def read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def secure_ingress(request: Request):
+    store = request.app.state.idempotency
+    data = await read_json(request)
+    if store is None or not isinstance(data, dict):
+        return await _submit(request, data)
+
+    fingerprint = request_fingerprint(data)
+    try:
+        key = idempotency_key("submit", request.headers.get(IDEMPOTENCY_HEADER), fingerprint)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    record = await store.claim_or_wait_async(key, fingerprint)
+    if record is not None:
+        status, body = stored_response(record, fingerprint)
+        logger.info("Answered submit-user-profile from idempotency store (%d)", status)
+        return JSONResponse(body, status_code=status, headers={REPLAYED_HEADER: "true"})
+
+    response = None
+    try:
+        response = await _submit(request, data)
+    finally:
+        if response is not None and should_store(response.status_code):
+            store.complete(key, fingerprint, response.status_code, json.loads(response.body))
+        else:
+            store.release(key)
+    return response
+
+
+async def _submit(request: Request, data):
+    services = request.app.state.services
+    try:
+        logger.info("Received submit-user-profile request")
+        cmd_req = SubmitUserRequestModel(**(data if isinstance(data, dict) else {}))
+
+        with METRICS.stage("submit"):
+            blob, index = await run_cpu(request, prepare_submit, services.crypto_service, cmd_req)
+            await request.app.state.repository.save_user_profile(blob, index)
+
+        logger.info("submit-user-profile processed successfully")
+        return JSONResponse({"status": "success"}, status_code=200)
+    except TransportQueueFullError as e:
+        logger.warning(f"Shedding submit-user-profile: {e}")
+        return JSONResponse(BUSY_RESPONSE, status_code=503, headers={"Retry-After": "1"})
+    except TransportSessionError as e:
+        logger.warning(f"Rejected submit-user-profile: {e}")
+        return JSONResponse({"error": str(e)}, status_code=401)
+    except ValidationError as e:
+        logger.error(f"Validation error in submit-user-profile: {e.errors()}")
+        return JSONResponse({"error": e.errors()}, status_code=400)
+    except ValueError as e:
+        msg = str(e)
+        if "National ID already exists" in msg:
+            logger.warning(f"Duplicate National ID submitted: {msg}")
+            return JSONResponse({"error": msg}, status_code=409)
+        logger.warning(f"Value error in submit-user-profile: {msg}")
+        return JSONResponse({"error": msg}, status_code=400)
+    except Exception as e:
+        logger.error(f"Error in submit-user-profile: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def secure_ingress_batch(request: Request):
+    services = request.app.state.services
+    try:
+        results, positions, commands = parse_submit_batch(await read_json(request))
+        logger.info("Received submit-user-profiles batch with %d items", len(results))
+
+        handler = SubmitBatchCommandHandler(services.crypto_service, request.app.state.repository)
+        handled, pending = await run_cpu(request, handler.prepare, commands)
+        inserted = set()
+        if pending:
+            inserted = await request.app.state.repository.save_user_profiles(
+                [(blob, index) for _, blob, index in pending]
+            )
+        body = build_batch_response(results, positions, handler.finish(handled, pending, inserted))
+
+        logger.info("submit-user-profiles batch processed: %s", body['summary'])
+        return JSONResponse(body, status_code=200)
+    except BatchRequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    except TransportQueueFullError as e:
+        logger.warning(f"Shedding submit-user-profiles batch: {e}")
+        return JSONResponse(BUSY_RESPONSE, status_code=503, headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"Error in submit-user-profiles batch: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def open_transport_session(request: Request):
+    crypto_service = request.app.state.services.crypto_service
+    try:
+        data = await read_json(request)
+        session_req = TransportSessionRequestModel(**(data if isinstance(data, dict) else {}))
+        session_id = await run_cpu(request, crypto_service.open_transport_session, session_req.encrypted_key)
+        return JSONResponse({
+            "session_id": session_id,
+            "expires_in": int(crypto_service.transport_sessions.ttl)
+        }, status_code=201)
+    except TransportQueueFullError as e:
+        logger.warning(f"Shedding transport-session: {e}")
+        return JSONResponse(BUSY_RESPONSE, status_code=503, headers={"Retry-After": "1"})
+    except ValidationError as e:
+        return JSONResponse({"error": e.errors()}, status_code=400)
+    except Exception as e:
+        logger.warning(f"Failed to open transport session: {str(e)}")
+        return JSONResponse({"error": "Could not unwrap session key"}, status_code=400)
+
+
+async def get_public_key(request: Request):
+    doc = request.app.state.services.public_key
+    etag = f'"{doc.etag}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={doc.max_age}"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(doc.body, media_type="application/json", headers=headers)
+
+
+async def search(request: Request):
+    crypto_service = request.app.state.services.crypto_service
+    try:
+        nid = request.query_params.get('nid')
+        logger.info("Received search request")
+        if not nid:
+            logger.warning("Missing nid param in search request")
+            return JSONResponse({"error": "Missing nid param"}, status_code=400)
+
+        with METRICS.stage("search"):
+            with METRICS.stage("hmac_index"):
+                national_id_index = await run_cpu(request, crypto_service.hash_for_index, nid)
+            rows = await request.app.state.repository.find_by_hash(national_id_index)
+            plaintexts = []
+            if rows:
+                with METRICS.stage("storage_decrypt"):
+                    plaintexts = await run_cpu(request, crypto_service.decrypt_from_storage_many, [blob for _, blob in rows])
+        results = [{"id": row_id, "data": plaintext} for (row_id, _), plaintext in zip(rows, plaintexts)]
+
+        logger.info("Search returned %d results", len(results))
+        return JSONResponse(results, status_code=200)
+    except Exception as e:
+        logger.error(f"Error in search: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def search_batch(request: Request):
+    services = request.app.state.services
+    repository = request.app.state.repository
+    try:
+        results, positions, national_ids = parse_search_batch(await read_json(request))
+        logger.info("Received search batch with %d items", len(results))
+
+        handler = SearchBatchQueryHandler(services.crypto_service, repository)
+        with METRICS.stage("search_batch"):
+            handled, indexes = await run_cpu(request, handler.prepare, national_ids)
+            found = await repository.find_by_hashes(unique_indexes(indexes), handler.chunk_size)
+            handled = await run_cpu(request, handler.finish, handled, indexes, found)
+        body = build_batch_response(results, positions, handled, SEARCH_STATUSES)
+
+        logger.info("Search batch processed: %s", body['summary'])
+        return JSONResponse(body, status_code=200)
+    except BatchRequestError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"Error in search batch: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def search_cache_stats(request: Request):
+    cache = getattr(request.app.state.repository, "search_cache", None)
+    if cache is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse(dict(cache.describe(), enabled=True))
+
+
+async def export_profiles(request: Request):
+    if os.getenv("EXPORT_API_ENABLED") != "1":
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    try:
+        query = ExportProfilesRequestModel(**dict(request.query_params))
+    except ValidationError as e:
+        return JSONResponse({"error": e.errors()}, status_code=400)
+
+    logger.info(f"Starting {query.format} export after id={query.after_id}")
+    # The export walks a server-side cursor on the sync pool; Starlette
+    # iterates a sync generator in its threadpool, off the event loop.
+    services = request.app.state.services
+    handler = ExportQueryHandler(services.crypto_service, services.repository)
+    return StreamingResponse(handler.stream(query), media_type=CONTENT_TYPES[query.format])
+
+
+routes = [
+    Route('/submit-user-profile', secure_ingress, methods=['POST']),
+    Route('/submit-user-profiles:batch', secure_ingress_batch, methods=['POST']),
+    Route('/transport-session', open_transport_session, methods=['POST']),
+    Route('/public-key', get_public_key, methods=['GET']),
+    Route('/search/cache-stats', search_cache_stats, methods=['GET']),
+    Route('/search', search, methods=['GET']),
+    Route('/search:batch', search_batch, methods=['POST']),
+    Route('/export', export_profiles, methods=['GET']),
+]
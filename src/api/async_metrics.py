@@ -0,0 +1,36 @@
+"""
+Prometheus /metrics endpoint and Server-Timing middleware for the ASGI app.
+"""
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+from infrastructure.metrics import METRICS, CONTENT_TYPE
+
+
+async def metrics(request: Request):
+    return Response(METRICS.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+class ServerTimingMiddleware:
+    """Adds a Server-Timing header with the stages recorded for the request."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = METRICS.begin_request()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = METRICS.end_request(token)
+                if header:
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+routes = [Route('/metrics', metrics, methods=['GET'])]
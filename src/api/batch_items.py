@@ -0,0 +1,79 @@
+"""
+Request parsing and response shaping for the batch submit and batch
+search endpoints, shared by the Flask blueprint and the async entry point.
+"""
+import os
+from pydantic import ValidationError
+from domain.models import SubmitUserRequestModel
+
+SUBMIT_STATUSES = ("created", "duplicate", "invalid")
+SEARCH_STATUSES = ("found", "not_found", "invalid", "error")
+
+
+class BatchRequestError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_submit_batch(body):
+    """
+    Returns (results, positions, commands). Items that fail model
+    validation are already marked invalid in results; commands holds the
+    rest, with positions giving each command's index in the request.
+    """
+    items = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise BatchRequestError("Expected a JSON array of submit items")
+
+    max_items = int(os.getenv("SUBMIT_BATCH_MAX_ITEMS", "1000"))
+    if len(items) > max_items:
+        raise BatchRequestError(f"Batch too large (max {max_items} items)", 413)
+
+    # Validate each item on its own so one bad item doesn't fail the batch
+    results = [None] * len(items)
+    commands = []
+    positions = []
+    for pos, item in enumerate(items):
+        try:
+            commands.append(SubmitUserRequestModel(**item))
+            positions.append(pos)
+        except (ValidationError, TypeError):
+            results[pos] = {"status": "invalid", "error": "Malformed submit item"}
+    return results, positions, commands
+
+
+def parse_search_batch(body):
+    """
+    Returns (results, positions, national_ids) like parse_submit_batch.
+    Accepts {"national_ids": [...]} or a bare JSON array of strings.
+    """
+    items = body.get("national_ids") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise BatchRequestError("Expected a JSON array of national IDs")
+
+    max_items = int(os.getenv("SEARCH_BATCH_MAX_ITEMS", "10000"))
+    if len(items) > max_items:
+        raise BatchRequestError(f"Batch too large (max {max_items} items)", 413)
+
+    results = [None] * len(items)
+    national_ids = []
+    positions = []
+    for pos, item in enumerate(items):
+        if isinstance(item, str) and item:
+            national_ids.append(item)
+            positions.append(pos)
+        else:
+            results[pos] = {"status": "invalid", "error": "Malformed national ID"}
+    return results, positions, national_ids
+
+
+def build_batch_response(results: list, positions: list, handled: list, statuses=SUBMIT_STATUSES) -> dict:
+    for pos, result in zip(positions, handled):
+        results[pos] = result
+
+    summary = dict.fromkeys(statuses, 0)
+    for pos, result in enumerate(results):
+        result["index"] = pos
+        summary[result["status"]] += 1
+    return {"results": results, "summary": summary}
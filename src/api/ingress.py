@@ -1,29 +1,74 @@
-from flask import Blueprint, request, jsonify
-from commands.submit_data import SubmitCommandHandler
-from queries.search_data import SearchQueryHandler
-from infrastructure.crypto_service import CryptoService
-from domain.models import SubmitUserRequestModel
+import os
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from commands.submit_data import SubmitCommandHandler, SubmitBatchCommandHandler
+from queries.search_data import SearchQueryHandler, SearchBatchQueryHandler
+from queries.export_profiles import ExportQueryHandler, CONTENT_TYPES
+from domain.models import SubmitUserRequestModel, TransportSessionRequestModel, ExportProfilesRequestModel
+from api.batch_items import (BatchRequestError, SEARCH_STATUSES, parse_submit_batch, parse_search_batch,
+                              build_batch_response)
+from infrastructure.transport_decryptor import TransportQueueFullError
+from infrastructure.session_keys import TransportSessionError
+from infrastructure.idempotency import (IDEMPOTENCY_HEADER, REPLAYED_HEADER, request_fingerprint, idempotency_key,
+                                        stored_response, should_store)
 from pydantic import ValidationError
 import logging
 
 ingress_bp = Blueprint('ingress', __name__)
 logger = logging.getLogger(__name__)
 
+def get_services():
+    """Returns the app-scoped ServiceContainer built in create_app()."""
+    return current_app.extensions["services"]
+
 @ingress_bp.route('/submit-user-profile', methods=['POST'])
 def secure_ingress():
+    store = get_services().idempotency
+    data = request.get_json(silent=True)
+    if store is None or not isinstance(data, dict):
+        return _submit(data)
+
+    fingerprint = request_fingerprint(data)
+    try:
+        key = idempotency_key("submit", request.headers.get(IDEMPOTENCY_HEADER), fingerprint)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    record = store.claim_or_wait(key, fingerprint)
+    if record is not None:
+        status, body = stored_response(record, fingerprint)
+        logger.info("Answered submit-user-profile from idempotency store (%d)", status)
+        return jsonify(body), status, {REPLAYED_HEADER: "true"}
+
+    response = None
+    try:
+        response = current_app.make_response(_submit(data))
+    finally:
+        if response is not None and should_store(response.status_code):
+            store.complete(key, fingerprint, response.status_code, response.get_json())
+        else:
+            store.release(key)
+    return response
+
+def _submit(data):
     try:
-        data = request.json
-        logger.info(f"Received submit-user-profile request. Keys: {list(data.keys()) if data else 'None'}")
+        logger.info("Received submit-user-profile request")
         
         # Validate Request
         cmd_req = SubmitUserRequestModel(**data)
         
         # Dispatch Command
-        handler = SubmitCommandHandler()
+        services = get_services()
+        handler = SubmitCommandHandler(services.crypto_service, services.repository)
         result = handler.handle(cmd_req)
         
         logger.info("submit-user-profile processed successfully")
         return jsonify(result), 200
+    except TransportQueueFullError as e:
+        logger.warning(f"Shedding submit-user-profile: {e}")
+        return jsonify({"error": "Server busy, retry later"}), 503, {"Retry-After": "1"}
+    except TransportSessionError as e:
+        # Client should run a new /transport-session handshake
+        logger.warning(f"Rejected submit-user-profile: {e}")
+        return jsonify({"error": str(e)}), 401
     except ValidationError as e:
         logger.error(f"Validation error in submit-user-profile: {e.errors()}")
         return jsonify({"error": e.errors()}), 400
@@ -39,33 +84,125 @@ def secure_ingress():
         # In prod, log strict errors, don't expose internal details
         return jsonify({"error": str(e)}), 500
 
+@ingress_bp.route('/submit-user-profiles:batch', methods=['POST'])
+def secure_ingress_batch():
+    try:
+        results, positions, commands = parse_submit_batch(request.json)
+        logger.info("Received submit-user-profiles batch with %d items", len(results))
+
+        services = get_services()
+        handler = SubmitBatchCommandHandler(services.crypto_service, services.repository)
+        body = build_batch_response(results, positions, handler.handle(commands))
+
+        logger.info("submit-user-profiles batch processed: %s", body['summary'])
+        return jsonify(body), 200
+    except BatchRequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except TransportQueueFullError as e:
+        logger.warning(f"Shedding submit-user-profiles batch: {e}")
+        return jsonify({"error": "Server busy, retry later"}), 503, {"Retry-After": "1"}
+    except Exception as e:
+        logger.error(f"Error in submit-user-profiles batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@ingress_bp.route('/transport-session', methods=['POST'])
+def open_transport_session():
+    try:
+        session_req = TransportSessionRequestModel(**(request.json or {}))
+        crypto_service = get_services().crypto_service
+        session_id = crypto_service.open_transport_session(session_req.encrypted_key)
+        return jsonify({
+            "session_id": session_id,
+            "expires_in": int(crypto_service.transport_sessions.ttl)
+        }), 201
+    except TransportQueueFullError as e:
+        logger.warning(f"Shedding transport-session: {e}")
+        return jsonify({"error": "Server busy, retry later"}), 503, {"Retry-After": "1"}
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+    except Exception as e:
+        # Bad base64 / wrong key / not an AES key
+        logger.warning(f"Failed to open transport session: {str(e)}")
+        return jsonify({"error": "Could not unwrap session key"}), 400
+
 @ingress_bp.route('/public-key', methods=['GET'])
 def get_public_key():
     try:
-        # In a real app, inject this properly
-        service = CryptoService() 
-        pem = service.get_public_key_pem()
-        return jsonify({"public_key": pem}), 200
+        doc = get_services().public_key
+        response = Response(doc.body, mimetype='application/json')
+        response.set_etag(doc.etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = doc.max_age
+        # Answers If-None-Match with 304 and no body
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error getting public key: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@ingress_bp.route('/search/cache-stats', methods=['GET'])
+def search_cache_stats():
+    cache = getattr(get_services().repository, "search_cache", None)
+    if cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(cache.describe(), enabled=True)), 200
+
+@ingress_bp.route('/admission/stats', methods=['GET'])
+def admission_stats():
+    controller = current_app.extensions.get("admission")
+    if controller is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(controller.describe(), enabled=True)), 200
+
 @ingress_bp.route('/search', methods=['GET'])
 def search():
     try:
         nid = request.args.get('nid')
-        logger.info(f"Received search request")
+        logger.info("Received search request")
         
         if not nid:
             logger.warning("Missing nid param in search request")
             return jsonify({"error": "Missing nid param"}), 400
             
         # Dispatch Query
-        handler = SearchQueryHandler()
+        services = get_services()
+        handler = SearchQueryHandler(services.crypto_service, services.repository)
         results = handler.handle(nid)
         
-        logger.info(f"Search returned {len(results)} results")
+        logger.info("Search returned %d results", len(results))
         return jsonify(results), 200
     except Exception as e:
         logger.error(f"Error in search: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+@ingress_bp.route('/search:batch', methods=['POST'])
+def search_batch():
+    try:
+        results, positions, national_ids = parse_search_batch(request.get_json(silent=True))
+        logger.info("Received search batch with %d items", len(results))
+
+        services = get_services()
+        handler = SearchBatchQueryHandler(services.crypto_service, services.repository)
+        body = build_batch_response(results, positions, handler.handle(national_ids), SEARCH_STATUSES)
+
+        logger.info("Search batch processed: %s", body['summary'])
+        return jsonify(body), 200
+    except BatchRequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in search batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@ingress_bp.route('/export', methods=['GET'])
+def export_profiles():
+    # Returns plaintext national IDs; only mounted for compliance deployments
+    if os.getenv("EXPORT_API_ENABLED") != "1":
+        return jsonify({"error": "Not found"}), 404
+    try:
+        query = ExportProfilesRequestModel(**request.args.to_dict())
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+
+    logger.info(f"Starting {query.format} export after id={query.after_id}")
+    services = get_services()
+    handler = ExportQueryHandler(services.crypto_service, services.repository)
+    return Response(stream_with_context(handler.stream(query)), mimetype=CONTENT_TYPES[query.format])
@@ -0,0 +1,33 @@
+"""
+Prometheus /metrics endpoint and Server-Timing header for the Flask app.
+
+Only registered when METRICS_ENABLED=1; see infrastructure.metrics.
+"""
+from flask import Blueprint, Response, g
+from infrastructure.metrics import METRICS, CONTENT_TYPE
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
+
+def install_metrics(app, services):
+    METRICS.set_gauge_source("services", services.gauges)
+    app.register_blueprint(metrics_bp)
+    if METRICS.server_timing:
+        app.before_request(_begin_request)
+        app.after_request(_add_server_timing)
+
+
+def _begin_request():
+    g.metrics_token = METRICS.begin_request()
+
+
+def _add_server_timing(response):
+    header = METRICS.end_request(g.pop("metrics_token", None))
+    if header:
+        response.headers["Server-Timing"] = header
+    return response
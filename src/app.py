@@ -1,20 +1,50 @@
-import logging
-import sys
+import os
 from flask import Flask
 from api.ingress import ingress_bp
+from api.metrics import install_metrics
+from api.admission import install_admission
+from infrastructure.admission import AdmissionController
+from infrastructure.container import ServiceContainer
+from infrastructure.sharding import ShardedRepository
+from infrastructure.migrations import run_migrations
+from infrastructure.metrics import METRICS
+from infrastructure.logging_pipeline import configure_logging
 
-def create_app():
-    # Configure logging to stdout
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        stream=sys.stdout
-    )
+def create_app(services: ServiceContainer = None):
+    # Stdout logging through a background writer; PII is masked before queueing
+    configure_logging()
     
     app = Flask(__name__)
+
+    # App-scoped services: keys are loaded and parsed once per process
+    app.extensions["services"] = services or ServiceContainer()
+
+    repository = app.extensions["services"].repository
+    if isinstance(repository, ShardedRepository) and os.getenv("EXPORT_API_ENABLED") == "1":
+        # Export pages by id, and ids are only unique within a shard
+        raise ValueError("EXPORT_API_ENABLED is not supported with DATABASE_SHARDS; "
+                         "run an unsharded instance against each shard's DATABASE_URL to export it")
+
+    # Schema is bootstrapped once here, never on the write path
+    has_database = os.getenv("DATABASE_URL") or os.getenv("DATABASE_SHARDS")
+    if has_database and os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1":
+        run_migrations(app.extensions["services"].repository)
+
+    index_filter = getattr(app.extensions["services"].repository, "index_filter", None)
+    if index_filter is not None and os.getenv("DATABASE_URL"):
+        index_filter.warm()
     
     # Register Blueprints
     app.register_blueprint(ingress_bp, url_prefix='/api/v1')
+
+    # Stage metrics are off (and cost nothing) unless METRICS_ENABLED=1
+    METRICS.configure_from_env()
+    if METRICS.enabled:
+        install_metrics(app, app.extensions["services"])
+
+    # Per-route concurrency limits and load shedding in front of the crypto routes
+    if os.getenv("ADMISSION_ENABLED", "1") == "1":
+        install_admission(app, AdmissionController.from_env())
     
     return app
 
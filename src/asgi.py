@@ -0,0 +1,82 @@
+"""
+Async (ASGI) entry point, alongside the WSGI create_app() in app.py.
+
+Serves the same /api/v1 routes with async handlers and an asyncpg pool,
+so one process can hold thousands of concurrent searches open:
+
+    PYTHONPATH=src uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 5000 --workers 2
+"""
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.routing import Mount
+from api.async_ingress import routes
+from api.async_metrics import ServerTimingMiddleware, routes as metrics_routes
+from infrastructure.container import ServiceContainer
+from infrastructure.async_repository import AsyncRepository
+from infrastructure.search_cache import InMemorySearchCache
+from infrastructure.idempotency import InMemoryIdempotencyStore
+from infrastructure.migrations import run_migrations
+from infrastructure.metrics import METRICS
+from infrastructure.logging_pipeline import configure_logging
+
+logger = logging.getLogger(__name__)
+
+def create_asgi_app(services: ServiceContainer = None, repository=None):
+    # Stdout logging through a background writer; PII is masked before queueing
+    configure_logging()
+
+    if os.getenv("DATABASE_SHARDS"):
+        # AsyncRepository talks to a single DATABASE_URL and has no shard routing
+        raise ValueError("DATABASE_SHARDS is not supported by the ASGI entry point; serve sharded deployments "
+                         "with the WSGI app (app:create_app)")
+
+    services = services or ServiceContainer()
+    if repository is None:
+        # Only an in-process cache is safe to call from the event loop
+        cache = getattr(services.repository, "search_cache", None)
+        repository = AsyncRepository(search_cache=cache if isinstance(cache, InMemorySearchCache) else None)
+
+    # Same rule for the idempotency store: a shared backend would block the loop on network I/O
+    idempotency = services.idempotency
+    if idempotency is not None and not isinstance(idempotency, InMemoryIdempotencyStore):
+        logger.warning("IDEMPOTENCY_BACKEND is not in-process; the ASGI app dedupes submits per process only")
+        idempotency = InMemoryIdempotencyStore(idempotency.ttl, idempotency.in_flight_ttl, idempotency.wait_timeout)
+
+    workers = os.getenv("ASGI_CRYPTO_WORKERS")
+    crypto_executor = ThreadPoolExecutor(
+        max_workers=int(workers) if workers else (os.cpu_count() or 1),
+        thread_name_prefix="asgi-crypto"
+    )
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if os.getenv("DATABASE_URL") and os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1":
+            # One-off at startup; uses the sync pool
+            run_migrations(services.repository)
+        await repository.open()
+        try:
+            yield
+        finally:
+            await repository.close()
+            crypto_executor.shutdown(wait=False)
+
+    # Stage metrics are off (and cost nothing) unless METRICS_ENABLED=1
+    METRICS.configure_from_env()
+    app_routes = [Mount('/api/v1', routes=routes)]
+    middleware = []
+    if METRICS.enabled:
+        METRICS.set_gauge_source("services", services.gauges)
+        app_routes = metrics_routes + app_routes
+        if METRICS.server_timing:
+            middleware.append(Middleware(ServerTimingMiddleware))
+
+    app = Starlette(routes=app_routes, middleware=middleware, lifespan=lifespan)
+    app.state.services = services
+    app.state.repository = repository
+    app.state.idempotency = idempotency
+    app.state.crypto_executor = crypto_executor
+    return app
@@ -0,0 +1,113 @@
+"""
+Online conversion of user_profiles to the binary storage layout.
+
+1. Apply migration 0002 and deploy with STORAGE_LAYOUT=dual, so every new
+   write carries both the text and the BYTEA columns.
+2. Backfill the BYTEA columns of older rows (the default action). Blobs
+   are reframed, not re-encrypted, so no key material is needed:
+
+       PYTHONPATH=src python -m commands.convert_storage_layout --rows-per-second 5000
+
+3. Deploy with STORAGE_LAYOUT=binary, then drop the text copies:
+
+       PYTHONPATH=src python -m commands.convert_storage_layout --clear-text
+
+Both passes are idempotent and can be re-run after an interruption.
+"""
+import os
+import time
+import logging
+import argparse
+from infrastructure.repository import Repository
+from infrastructure.db_pool import ConnectionPool
+from infrastructure.storage_layout import blob_to_binary, index_to_binary
+from commands.reencrypt_storage import RowThrottle
+
+logger = logging.getLogger(__name__)
+
+
+class StorageLayoutConverter:
+    def __init__(self, repository: Repository = None, batch_size: int = 1000,
+                 rows_per_second: float = 0, progress_interval: float = 10.0):
+        self.repository = repository or Repository()
+        self.batch_size = batch_size
+        self.throttle = RowThrottle(rows_per_second)
+        self.progress_interval = progress_interval
+
+    def backfill(self, after_id: int = 0) -> dict:
+        """Fills national_id_blob_bin / national_id_index_bin for rows that lack them."""
+        counts = {"scanned": 0, "converted": 0, "failed": 0, "last_id": after_id}
+        started = last_report = time.monotonic()
+        for rows in self.repository.iter_unconverted_batches(after_id, self.batch_size):
+            self.throttle.acquire(len(rows))
+            converted = []
+            for row_id, blob, index in rows:
+                try:
+                    converted.append((row_id, blob_to_binary(blob), index_to_binary(index)))
+                except (ValueError, TypeError) as e:
+                    counts["failed"] += 1
+                    logger.error(f"Cannot convert profile id={row_id}: {e}")
+            counts["converted"] += self.repository.backfill_binary(converted)
+            counts["scanned"] += len(rows)
+            counts["last_id"] = rows[-1][0]
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                self._log_progress("Backfill", counts, started)
+        self._log_progress("Backfill", counts, started)
+        return counts
+
+    def clear_text(self, after_id: int = 0) -> dict:
+        """NULLs the text columns of rows that already have their binary copy."""
+        counts = {"scanned": 0, "cleared": 0, "last_id": after_id}
+        started = last_report = time.monotonic()
+        for rows in self.repository.iter_profile_batches(after_id, self.batch_size):
+            self.throttle.acquire(len(rows))
+            counts["cleared"] += self.repository.clear_text_columns(counts["last_id"], rows[-1][0])
+            counts["scanned"] += len(rows)
+            counts["last_id"] = rows[-1][0]
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                self._log_progress("Clear-text", counts, started)
+        self._log_progress("Clear-text", counts, started)
+        return counts
+
+    @staticmethod
+    def _log_progress(phase: str, counts: dict, started: float):
+        elapsed = time.monotonic() - started
+        rate = counts["scanned"] / elapsed if elapsed > 0 else 0.0
+        summary = " ".join(f"{k}={v}" for k, v in counts.items())
+        logger.info(f"{phase} progress: {summary} rate={rate:.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert stored national IDs to the binary storage layout.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rows-per-second", type=float, default=0, help="Throughput cap, 0 for unlimited")
+    parser.add_argument("--after-id", type=int, default=0, help="Skip rows up to this id")
+    parser.add_argument("--clear-text", action="store_true",
+                        help="NULL the text columns of converted rows (run with STORAGE_LAYOUT=binary)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # The reading cursor and the writes each hold a connection
+    pool = ConnectionPool(os.getenv("DATABASE_URL"), min_size=1, max_size=2)
+    converter = StorageLayoutConverter(
+        repository=Repository(pool=pool),
+        batch_size=args.batch_size,
+        rows_per_second=args.rows_per_second,
+    )
+    try:
+        if args.clear_text:
+            if not converter.repository.storage_layout.binary:
+                parser.error("--clear-text requires STORAGE_LAYOUT=binary")
+            converter.clear_text(args.after_id)
+            return 0
+        counts = converter.backfill(args.after_id)
+    finally:
+        pool.close()
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
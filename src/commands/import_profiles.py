@@ -0,0 +1,233 @@
+"""
+Offline bulk import of national IDs into user_profiles.
+
+Reads a CSV (with a header) or NDJSON file as a stream. Each record is
+either plaintext ({"national_id"}) or a transport-encrypted payload in
+the submit API shape ({"national_id", "encrypted_key", "iv"}). Records
+are validated with NationalIdSchema, encrypted and hashed across a
+process pool, and loaded with COPY into a staging table plus an
+INSERT ... ON CONFLICT merge. Duplicates and rejects are written to an
+NDJSON side file with their record number.
+
+    PYTHONPATH=src python -m commands.import_profiles legacy.csv --workers 8
+"""
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from infrastructure.crypto_service import CryptoService
+from infrastructure.repository import Repository
+from infrastructure.db_pool import ConnectionPool
+from commands.submit_data import validate_national_id
+
+logger = logging.getLogger(__name__)
+
+INPUT_MODES = ("plaintext", "transport")
+
+# Per-process CryptoService, created once by the pool initializer
+_worker_crypto = None
+
+
+def read_records(path: str, fmt: str = None):
+    """Yields (record_no, dict) pairs, 1-based, without loading the file."""
+    fmt = fmt or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+    with open(path, newline="") as f:
+        if fmt == "csv":
+            for record_no, record in enumerate(csv.DictReader(f), start=1):
+                yield record_no, record
+            return
+        record_no = 0
+        for line in f:
+            if not line.strip():
+                continue
+            record_no += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record_no, record if isinstance(record, dict) else {}
+
+
+def _init_worker():
+    global _worker_crypto
+    # Already inside a worker process; CryptoService unwraps inline by default
+    _worker_crypto = CryptoService()
+
+
+def prepare_chunk(records, mode: str = "plaintext", crypto_service: CryptoService = None):
+    """
+    CPU-bound part of the import for one chunk of (record_no, dict).
+    Returns (accepted [(record_no, blob, index)], rejected [(record_no, reason)]).
+    """
+    crypto_service = crypto_service or _worker_crypto
+    numbers, plaintexts, rejected = [], [], []
+    for record_no, record in records:
+        plaintext = record.get("national_id")
+        if mode == "transport" and plaintext is not None:
+            if not record.get("encrypted_key") or not record.get("iv"):
+                rejected.append((record_no, "Missing encrypted_key or iv"))
+                continue
+            try:
+                plaintext = crypto_service.decrypt_transport_payload(plaintext, record["encrypted_key"], record["iv"])
+            except Exception:
+                rejected.append((record_no, "Could not decrypt payload"))
+                continue
+        if not isinstance(plaintext, str):
+            rejected.append((record_no, "Missing national_id"))
+            continue
+        try:
+            validate_national_id(plaintext.strip())
+        except ValueError as e:
+            rejected.append((record_no, str(e)))
+            continue
+        numbers.append(record_no)
+        plaintexts.append(plaintext.strip())
+
+    indexes = crypto_service.hash_for_index_many(plaintexts)
+    blobs = crypto_service.encrypt_for_storage_many(plaintexts)
+    return list(zip(numbers, blobs, indexes)), rejected
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "read": self.read,
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+class ProfileImporter:
+    def __init__(self, repository: Repository = None, crypto_service: CryptoService = None,
+                 mode: str = "plaintext", workers: int = None, chunk_size: int = 5000,
+                 rejects_path: str = None, progress_interval: float = 10.0):
+        if mode not in INPUT_MODES:
+            raise ValueError(f"Unknown import mode: {mode}")
+        self.repository = repository or Repository()
+        # Only used with workers=0; pool workers build their own
+        self.crypto_service = crypto_service
+        self.mode = mode
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_size = chunk_size
+        self.rejects_path = rejects_path
+        self.progress_interval = progress_interval
+        self.stats = None
+
+    def _chunks(self, records):
+        chunk = []
+        for item in records:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _load(self, accepted, rejected, rejects_file):
+        stats = self.stats
+        stats.read += len(accepted) + len(rejected)
+        for record_no, reason in rejected:
+            rejects_file.write(json.dumps({"record": record_no, "status": "rejected", "error": reason}) + "\n")
+        stats.rejected += len(rejected)
+
+        # Repeats within a chunk are dropped here (first occurrence wins);
+        # repeats across chunks or of existing rows are caught by the merge.
+        rows, numbers, seen = [], [], set()
+        for record_no, blob, index in accepted:
+            if index in seen:
+                rejects_file.write(json.dumps({"record": record_no, "status": "duplicate"}) + "\n")
+                stats.duplicates += 1
+                continue
+            seen.add(index)
+            rows.append((blob, index))
+            numbers.append(record_no)
+
+        inserted = self.repository.copy_user_profiles(rows)
+        for record_no, (_, index) in zip(numbers, rows):
+            if index not in inserted:
+                rejects_file.write(json.dumps({"record": record_no, "status": "duplicate"}) + "\n")
+        stats.imported += len(inserted)
+        stats.duplicates += len(rows) - len(inserted)
+
+    def run(self, records) -> ImportStats:
+        self.stats = ImportStats()
+        last_report = time.monotonic()
+        rejects_file = open(self.rejects_path, "w") if self.rejects_path else open(os.devnull, "w")
+        try:
+            if self.workers <= 0:
+                crypto_service = self.crypto_service or CryptoService()
+                for chunk in self._chunks(records):
+                    self._load(*prepare_chunk(chunk, self.mode, crypto_service), rejects_file)
+            else:
+                # Keep a bounded number of chunks in flight so a huge file
+                # is never read ahead into memory.
+                in_flight = deque()
+                with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as executor:
+                    for chunk in self._chunks(records):
+                        in_flight.append(executor.submit(prepare_chunk, chunk, self.mode))
+                        while in_flight and (len(in_flight) > self.workers * 2 or in_flight[0].done()):
+                            self._load(*in_flight.popleft().result(), rejects_file)
+                        if time.monotonic() - last_report >= self.progress_interval:
+                            last_report = time.monotonic()
+                            self._log_progress()
+                    while in_flight:
+                        self._load(*in_flight.popleft().result(), rejects_file)
+        finally:
+            rejects_file.close()
+        self._log_progress()
+        return self.stats
+
+    def _log_progress(self):
+        s = self.stats
+        logger.info(f"Import progress: read={s.read} imported={s.imported} duplicates={s.duplicates} "
+                    f"rejected={s.rejected} rate={s.rows_per_second:.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import national IDs from a CSV or NDJSON file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Default: from the file extension")
+    parser.add_argument("--mode", choices=INPUT_MODES, default="plaintext")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 runs in-process")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Records per worker task and per COPY")
+    parser.add_argument("--rejects", help="Side file for duplicates and rejects (default: <path>.rejects.ndjson)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    pool = ConnectionPool(os.getenv("DATABASE_URL"), min_size=1, max_size=1)
+    importer = ProfileImporter(
+        repository=Repository(pool=pool),
+        mode=args.mode,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        rejects_path=args.rejects or f"{args.path}.rejects.ndjson",
+    )
+    try:
+        stats = importer.run(read_records(args.path, args.format))
+    finally:
+        pool.close()
+    print(json.dumps(stats.to_dict()))
+    return 1 if stats.rejected else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
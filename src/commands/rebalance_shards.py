@@ -0,0 +1,172 @@
+"""
+Online move of shard slots between databases.
+
+    PYTHONPATH=src python -m commands.rebalance_shards status
+    PYTHONPATH=src python -m commands.rebalance_shards move --slots 768-1023 --to s3 --rows-per-second 5000
+
+Needs DATABASE_SHARDS and a shared SHARD_MAP_PATH that every app
+process reads. A move runs in four steps, each safe to re-run:
+
+1. The map marks the slots as owned by the target and migrating from
+   their old shard; after --grace seconds every process writes new rows
+   to the target and falls back to the old shard on lookup misses.
+2. Rows in the slots' index range are copied to the target with their
+   created_at (existing indexes are skipped).
+3. The migrating marker is cleared; after --grace no process reads the
+   old shard for these slots.
+4. The old shard's rows for the slots are deleted, after copying any
+   that are still missing on the target.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+from infrastructure.sharding import ShardedRepository, ShardMapFile
+from commands.reencrypt_storage import RowThrottle
+
+logger = logging.getLogger(__name__)
+
+
+def parse_slots(spec: str):
+    first, _, last = spec.partition("-")
+    return int(first), int(last or first)
+
+
+class ShardRebalancer:
+    def __init__(self, repository: ShardedRepository, map_file: ShardMapFile, grace: float = None,
+                 batch_size: int = 1000, rows_per_second: float = 0, progress_interval: float = 10.0):
+        self.repository = repository
+        self.map_file = map_file
+        # Long enough for every process to pick up a map change
+        self.grace = grace if grace is not None else map_file.reload_interval * 2
+        self.batch_size = batch_size
+        self.throttle = RowThrottle(rows_per_second)
+        self.progress_interval = progress_interval
+
+    def _publish(self, shard_map, reason: str):
+        self.map_file.save(shard_map)
+        logger.info(f"Published shard map version {shard_map.version} ({reason}); waiting {self.grace}s")
+        time.sleep(self.grace)
+
+    @staticmethod
+    def _runs(shard_map, first: int, last: int) -> list:
+        """Contiguous (first, last, source) runs of migrating slots."""
+        runs = []
+        for slot in range(first, last + 1):
+            source = shard_map.migrating.get(slot)
+            if source is None:
+                continue
+            if runs and runs[-1][2] == source and runs[-1][1] == slot - 1:
+                runs[-1][1] = slot
+            else:
+                runs.append([slot, slot, source])
+        return runs
+
+    def move(self, first: int, last: int, target: str, cleanup_from: str = None) -> dict:
+        """
+        Moves slots first..last to target. cleanup_from resumes a move that
+        stopped after step 3 by clearing that shard's copies of the slots.
+        """
+        shard_map = self.map_file.current()
+        if target not in self.repository.shards:
+            raise ValueError(f"Unknown shard: {target}")
+        if not 0 <= first <= last < shard_map.slots:
+            raise ValueError(f"Slots must be within 0-{shard_map.slots - 1}")
+
+        moving = shard_map.start_move(first, last, target)
+        if moving.owners != shard_map.owners or moving.migrating != shard_map.migrating:
+            self._publish(moving, f"slots {first}-{last} migrating to {target}")
+        else:
+            moving = shard_map
+
+        counts = {"copied": 0, "scanned": 0, "late_copied": 0, "deleted": 0}
+        runs = self._runs(moving, first, last)
+        migrating = bool(runs)
+        if not runs and cleanup_from:
+            runs = [[first, last, cleanup_from]]
+        target_repo = self.repository.shards[target]
+        started = last_report = time.monotonic()
+        for run_first, run_last, source in runs:
+            lower, upper = moving.slot_bounds(run_first, run_last)
+            for rows in self.repository.shards[source].iter_index_range_batches(lower, upper, 0, self.batch_size):
+                self.throttle.acquire(len(rows))
+                counts["copied"] += target_repo.insert_moved_rows([(blob, index, created_at)
+                                                                   for _, blob, index, created_at in rows])
+                counts["scanned"] += len(rows)
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    self._log_progress("Copy", counts, started)
+        self._log_progress("Copy", counts, started)
+
+        if migrating:
+            self._publish(moving.finish_move(first, last), f"slots {first}-{last} owned by {target}")
+
+        for run_first, run_last, source in runs:
+            lower, upper = moving.slot_bounds(run_first, run_last)
+            source_repo = self.repository.shards[source]
+            for rows in source_repo.iter_index_range_batches(lower, upper, 0, self.batch_size):
+                self.throttle.acquire(len(rows))
+                present = target_repo.existing_indexes([index for _, _, index, _ in rows])
+                # Only rows written by a process that missed the grace period
+                late = [(blob, index, created_at) for _, blob, index, created_at in rows if index not in present]
+                counts["late_copied"] += target_repo.insert_moved_rows(late)
+                counts["deleted"] += source_repo.delete_rows([row_id for row_id, _, _, _ in rows])
+                for _, _, index, _ in rows:
+                    self.repository.invalidate(index)
+        self._log_progress("Cleanup", counts, started)
+        return counts
+
+    @staticmethod
+    def _log_progress(phase: str, counts: dict, started: float):
+        elapsed = time.monotonic() - started
+        rate = counts["scanned"] / elapsed if elapsed > 0 else 0.0
+        summary = " ".join(f"{k}={v}" for k, v in counts.items())
+        logger.info(f"{phase} progress: {summary} rate={rate:.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or move shard slots between databases.")
+    sub = parser.add_subparsers(dest="action", required=True)
+    sub.add_parser("status", help="Print slot counts per shard and slots being moved")
+    move = sub.add_parser("move", help="Move a slot range to another shard")
+    move.add_argument("--slots", required=True, help='Slot or range, e.g. "768-1023"')
+    move.add_argument("--to", required=True, dest="target")
+    move.add_argument("--grace", type=float, help="Seconds to wait after each map change (default: 2x reload interval)")
+    move.add_argument("--batch-size", type=int, default=1000)
+    move.add_argument("--rows-per-second", type=float, default=0, help="Throughput cap, 0 for unlimited")
+    move.add_argument("--cleanup-from", help="Resume cleanup of a finished move on this shard")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if not os.getenv("SHARD_MAP_PATH"):
+        parser.error("SHARD_MAP_PATH must point at the shard map shared with the app")
+    repository = ShardedRepository.from_env()
+    map_file = repository.shard_map
+    if not os.path.exists(map_file.path):
+        # First run: persist the default even spread before changing it
+        map_file.save(map_file.current())
+
+    if args.action == "status":
+        shard_map = map_file.current()
+        print(json.dumps({
+            "version": shard_map.version,
+            "slots": shard_map.slots,
+            "slots_per_shard": shard_map.counts(),
+            "migrating": ShardRebalancer._runs(shard_map, 0, shard_map.slots - 1),
+        }, indent=2))
+        return 0
+
+    first, last = parse_slots(args.slots)
+    rebalancer = ShardRebalancer(repository, map_file, grace=args.grace, batch_size=args.batch_size,
+                                 rows_per_second=args.rows_per_second)
+    try:
+        rebalancer.move(first, last, args.target, args.cleanup_from)
+    finally:
+        repository.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,217 @@
+"""
+Background DEK re-encryption (see senario-A.md).
+
+Walks user_profiles in id order, decrypts every blob that is not on the
+default storage adapter's version with whichever adapter wrote it, and
+re-encrypts it with the default adapter. Progress is checkpointed to a
+JSON file so an interrupted run resumes where it stopped.
+
+    PYTHONPATH=src python -m commands.reencrypt_storage --workers 4 --rows-per-second 2000
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from infrastructure.crypto_service import CryptoService
+from infrastructure.repository import Repository
+from infrastructure.db_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationProgress:
+    def __init__(self, last_id: int = 0, scanned: int = 0, reencrypted: int = 0,
+                 skipped: int = 0, conflicts: int = 0, failed: int = 0):
+        self.last_id = last_id
+        self.scanned = scanned
+        self.reencrypted = reencrypted
+        self.skipped = skipped        # already on the default version
+        self.conflicts = conflicts    # changed by a live writer mid-batch
+        self.failed = failed          # could not be decrypted
+        self.started_at = time.monotonic()
+        self._scanned_at_start = scanned
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return (self.scanned - self._scanned_at_start) / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "last_id": self.last_id,
+            "scanned": self.scanned,
+            "reencrypted": self.reencrypted,
+            "skipped": self.skipped,
+            "conflicts": self.conflicts,
+            "failed": self.failed,
+        }
+
+
+class Checkpoint:
+    """JSON checkpoint file, replaced atomically on every save."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> MigrationProgress:
+        if not self.path or not os.path.exists(self.path):
+            return MigrationProgress()
+        with open(self.path) as f:
+            return MigrationProgress(**json.load(f))
+
+    def save(self, progress: MigrationProgress):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(progress.to_dict(), f)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RowThrottle:
+    """Caps throughput at rows_per_second (0 disables the cap)."""
+    def __init__(self, rows_per_second: float):
+        self.rows_per_second = rows_per_second
+        self._next_allowed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, rows: int):
+        if self.rows_per_second <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_allowed)
+            self._next_allowed = start + rows / self.rows_per_second
+            delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StorageReencryptionMigrator:
+    def __init__(self, crypto_service: CryptoService = None, repository: Repository = None,
+                 batch_size: int = 500, workers: int = 4, rows_per_second: float = 0,
+                 checkpoint_path: str = "reencrypt_checkpoint.json", progress_interval: float = 10.0):
+        self.crypto_service = crypto_service or CryptoService()
+        self.repository = repository or Repository()
+        self.batch_size = batch_size
+        self.workers = workers
+        self.throttle = RowThrottle(rows_per_second)
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.progress_interval = progress_interval
+        self.progress = None
+
+    def _process_batch(self, rows) -> dict:
+        blobs = [blob for _, blob in rows]
+        failed = 0
+        try:
+            new_blobs = self.crypto_service.reencrypt_for_storage_many(blobs)
+        except Exception:
+            # Some row is undecryptable; redo this batch row by row to isolate it
+            new_blobs = []
+            for row_id, blob in rows:
+                try:
+                    new_blobs.append(self.crypto_service.reencrypt_for_storage(blob))
+                except Exception as e:
+                    failed += 1
+                    new_blobs.append(None)
+                    logger.error(f"Cannot re-encrypt profile id={row_id}: {type(e).__name__}")
+
+        updates = [
+            (row_id, blob, new_blob)
+            for (row_id, blob), new_blob in zip(rows, new_blobs)
+            if new_blob is not None
+        ]
+        updated = self.repository.update_blobs(updates)
+        return {
+            "scanned": len(rows),
+            "reencrypted": updated,
+            "conflicts": len(updates) - updated,
+            "failed": failed,
+            "skipped": len(rows) - len(updates) - failed,
+        }
+
+    def _record(self, last_id: int, counts: dict):
+        progress = self.progress
+        progress.last_id = last_id
+        progress.scanned += counts["scanned"]
+        progress.reencrypted += counts["reencrypted"]
+        progress.skipped += counts["skipped"]
+        progress.conflicts += counts["conflicts"]
+        progress.failed += counts["failed"]
+        self.checkpoint.save(progress)
+
+    def run(self) -> MigrationProgress:
+        self.progress = self.checkpoint.load()
+        self.progress.started_at = time.monotonic()
+        logger.info(f"Starting re-encryption after id={self.progress.last_id} "
+                    f"(workers={self.workers}, batch_size={self.batch_size})")
+
+        # Batches finish out of order; the checkpoint only advances past a
+        # batch once every earlier batch is done, so a resume never skips rows.
+        in_flight = deque()
+        last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reencrypt") as executor:
+            for rows in self.repository.iter_profile_batches(self.progress.last_id, self.batch_size):
+                self.throttle.acquire(len(rows))
+                in_flight.append((rows[-1][0], executor.submit(self._process_batch, rows)))
+
+                while in_flight and (len(in_flight) > self.workers * 2 or in_flight[0][1].done()):
+                    last_id, future = in_flight.popleft()
+                    self._record(last_id, future.result())
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    self._log_progress()
+
+            while in_flight:
+                last_id, future = in_flight.popleft()
+                self._record(last_id, future.result())
+
+        self._log_progress()
+        return self.progress
+
+    def _log_progress(self):
+        p = self.progress
+        logger.info(f"Re-encryption progress: last_id={p.last_id} scanned={p.scanned} "
+                    f"reencrypted={p.reencrypted} skipped={p.skipped} conflicts={p.conflicts} "
+                    f"failed={p.failed} rate={p.rows_per_second:.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-encrypt stored national IDs with the default DEK version.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rows-per-second", type=float, default=0, help="Throughput cap, 0 for unlimited")
+    parser.add_argument("--checkpoint", default="reencrypt_checkpoint.json")
+    parser.add_argument("--reset", action="store_true", help="Ignore any existing checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # One connection per worker plus one for the reading cursor
+    pool = ConnectionPool(os.getenv("DATABASE_URL"), min_size=1, max_size=args.workers + 1)
+    migrator = StorageReencryptionMigrator(
+        repository=Repository(pool=pool),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        rows_per_second=args.rows_per_second,
+        checkpoint_path=args.checkpoint,
+    )
+    if args.reset:
+        migrator.checkpoint.reset()
+    try:
+        progress = migrator.run()
+    finally:
+        pool.close()
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
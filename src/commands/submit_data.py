@@ -1,7 +1,13 @@
 from infrastructure.crypto_service import CryptoService
 from infrastructure.repository import Repository
+from infrastructure.session_keys import TransportSessionError
+from infrastructure.metrics import METRICS
 from domain.models import SubmitUserRequestModel
 from marshmallow import Schema, fields, validate, ValidationError
+from typing import List
+import logging
+
+logger = logging.getLogger(__name__)
 
 class NationalIdSchema(Schema):
     national_id = fields.String(required=True, validate=[
@@ -9,33 +15,148 @@ class NationalIdSchema(Schema):
         validate.Regexp(r'^\d+$', error="National ID must contain only digits")
     ])
 
-class SubmitCommandHandler:
-    def __init__(self):
-        self.crypto_service = CryptoService()
-        self.repository = Repository()
+def validate_national_id(plaintext: str):
+    # Validation: Use Marshmallow Schema
+    try:
+        NationalIdSchema().load({"national_id": plaintext})
+    except ValidationError as err:
+        # Flatten errors for simpler response or re-raise
+        raise ValueError(f"Invalid National ID: {err.messages}")
 
-    def handle(self, command: SubmitUserRequestModel):
-        # 1. Decrypt Transport Payload
-        plaintext = self.crypto_service.decrypt_transport_payload(
+def decrypt_and_hash(crypto_service: CryptoService, command: SubmitUserRequestModel):
+    """Decrypts, validates and hashes one submit. Returns (plaintext, national_id_index)."""
+    # 1. Decrypt Transport Payload
+    with METRICS.stage("transport_decrypt", mode="session" if command.session_id else "rsa"):
+        plaintext = crypto_service.decrypt_transport_payload(
             command.national_id,
             command.encrypted_key,
-            command.iv
+            command.iv,
+            command.session_id
         )
 
-        # Validation: Use Marshmallow Schema
-        try:
-            NationalIdSchema().load({"national_id": plaintext})
-        except ValidationError as err:
-            # Flatten errors for simpler response or re-raise
-            raise ValueError(f"Invalid National ID: {err.messages}")
+    with METRICS.stage("validate"):
+        validate_national_id(plaintext)
+
+    # 2. Hash for Index (Column B)
+    with METRICS.stage("hmac_index"):
+        national_id_index = crypto_service.hash_for_index(plaintext)
+    return plaintext, national_id_index
+
+def encrypt_submit(crypto_service: CryptoService, plaintext: str):
+    """Encrypts a validated national ID for storage (Column A)."""
+    with METRICS.stage("storage_encrypt", key_version=_active_version(crypto_service)):
+        return crypto_service.encrypt_for_storage(plaintext)
+
+def prepare_submit(crypto_service: CryptoService, command: SubmitUserRequestModel):
+    """
+    All CPU-bound work for one submit: decrypt, validate, encrypt, hash.
+    Returns (national_id_blob, national_id_index). Used by the async entry
+    point, which runs it in an executor and persists separately.
+    """
+    plaintext, national_id_index = decrypt_and_hash(crypto_service, command)
+    return encrypt_submit(crypto_service, plaintext), national_id_index
+
+def _active_version(crypto_service: CryptoService) -> str:
+    # Label value only; skipped entirely while metrics are off
+    if not METRICS.enabled:
+        return ""
+    return getattr(crypto_service.default_storage_adapter, "version", "unknown")
+
+class SubmitCommandHandler:
+    def __init__(self, crypto_service: CryptoService = None, repository: Repository = None):
+        # Shared instances come from the app's ServiceContainer; fall back to
+        # fresh ones for standalone use (scripts, tests).
+        self.crypto_service = crypto_service or CryptoService()
+        self.repository = repository or Repository()
+
+    def handle(self, command: SubmitUserRequestModel):
+        with METRICS.stage("submit"):
+            return self._handle(command)
+
+    def _handle(self, command: SubmitUserRequestModel):
+        plaintext, national_id_index = decrypt_and_hash(self.crypto_service, command)
 
-        # 2. Encrypt for Storage (Column A)
-        national_id_blob = self.crypto_service.encrypt_for_storage(plaintext)
+        # With an index filter, a likely duplicate is confirmed and rejected
+        # before paying for storage encryption; definite misses skip the check.
+        index_filter = self.repository.index_filter
+        if index_filter is not None and index_filter.might_contain(national_id_index) \
+                and self.repository.find_by_hash(national_id_index):
+            raise ValueError("National ID already exists")
 
-        # 3. Hash for Index (Column B)
-        national_id_index = self.crypto_service.hash_for_index(plaintext)
+        # 3. Encrypt for Storage (Column A)
+        national_id_blob = encrypt_submit(self.crypto_service, plaintext)
 
-        # 4. Persist
+        # 4. Persist (db_acquire / db_insert are timed by the pool and repository)
         self.repository.save_user_profile(national_id_blob, national_id_index)
-        
+
         return {"status": "success"}
+
+class SubmitBatchCommandHandler:
+    """
+    Processes many submit commands together and writes them with one
+    multi-row insert. Failures are reported per item; one bad item never
+    aborts the rest of the batch.
+    """
+    def __init__(self, crypto_service: CryptoService = None, repository: Repository = None):
+        self.crypto_service = crypto_service or CryptoService()
+        self.repository = repository or Repository()
+
+    def handle(self, commands: List[SubmitUserRequestModel]) -> List[dict]:
+        results, pending = self.prepare(commands)
+        inserted = set()
+        if pending:
+            inserted = self.repository.save_user_profiles(
+                [(blob, index) for _, blob, index in pending]
+            )
+        return self.finish(results, pending, inserted)
+
+    def prepare(self, commands: List[SubmitUserRequestModel]):
+        """
+        CPU-bound part of the batch: decrypt, validate, hash, encrypt.
+        Returns (results, pending) where results holds the final status of
+        rejected items and pending the (position, blob, index) rows to insert.
+        """
+        results = [None] * len(commands)
+        seen_indexes = set()
+
+        # RSA unwraps fan out across the transport decrypt backend
+        plaintexts = self.crypto_service.decrypt_transport_payloads(
+            [(c.national_id, c.encrypted_key, c.iv, c.session_id) for c in commands]
+        )
+
+        valid = []  # (position, plaintext)
+        for pos, plaintext in enumerate(plaintexts):
+            if isinstance(plaintext, TransportSessionError):
+                results[pos] = {"status": "invalid", "error": str(plaintext)}
+                continue
+            if isinstance(plaintext, Exception):
+                # Bad base64, wrong key, tampered ciphertext...
+                results[pos] = {"status": "invalid", "error": "Could not decrypt payload"}
+                continue
+            try:
+                validate_national_id(plaintext)
+            except ValueError as e:
+                results[pos] = {"status": "invalid", "error": str(e)}
+                continue
+            valid.append((pos, plaintext))
+
+        indexes = self.crypto_service.hash_for_index_many([p for _, p in valid])
+        unique = []  # (position, plaintext, index)
+        for (pos, plaintext), national_id_index in zip(valid, indexes):
+            if national_id_index in seen_indexes:
+                # Same ID twice in one batch: first occurrence wins
+                results[pos] = {"status": "duplicate"}
+                continue
+            seen_indexes.add(national_id_index)
+            unique.append((pos, plaintext, national_id_index))
+
+        blobs = self.crypto_service.encrypt_for_storage_many([p for _, p, _ in unique])
+        pending = [(pos, blob, index) for (pos, _, index), blob in zip(unique, blobs)]
+        return results, pending
+
+    def finish(self, results: list, pending: list, inserted: set) -> List[dict]:
+        for pos, _, national_id_index in pending:
+            results[pos] = {"status": "created" if national_id_index in inserted else "duplicate"}
+
+        logger.info("Batch submit processed %d items, %d created", len(results), len(inserted))
+        return results
@@ -0,0 +1,71 @@
+"""
+Generates (or imports) a DEK and stores it wrapped by the configured KEK.
+
+    # New random DEK v3, appended to the keyring file
+    KEK_PROVIDER=kms PYTHONPATH=src python -m commands.wrap_dek v3 --keyring dek_keyring.json
+
+    # Move the existing v1 key (sha256 of DEK_KEY) under the KEK, so old rows stay readable
+    PYTHONPATH=src python -m commands.wrap_dek v1 --from-env DEK_KEY
+
+    # Wrapped HMAC key for HMAC_KEY_WRAPPED (must keep the current value)
+    PYTHONPATH=src python -m commands.wrap_dek hmac --from-env HMAC_KEY
+
+Without --keyring the DEK_WRAPPED_KEYS / HMAC_KEY_WRAPPED entry is printed.
+The plaintext key is never written anywhere.
+"""
+import os
+import json
+import base64
+import logging
+import argparse
+from infrastructure.key_providers import kek_provider_from_env
+from infrastructure.storage_cipher_adapters import load_key_from_env
+from infrastructure.dek_cache import DEK_SIZE, zeroize
+
+logger = logging.getLogger(__name__)
+
+
+def add_to_keyring(path: str, version: str, wrapped: bytes, key_id: str):
+    keyring = {"keys": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            keyring = json.load(f)
+    if version in keyring.get("keys", {}):
+        raise ValueError(f"Version {version} is already in {path}")
+    keyring.setdefault("keys", {})[version] = base64.b64encode(wrapped).decode()
+    keyring["kek_key_id"] = key_id
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(keyring, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wrap a storage DEK (or the HMAC key) with the configured KEK.")
+    parser.add_argument("version", help='DEK version such as "v3", or "hmac"')
+    parser.add_argument("--from-env", metavar="VAR", help="Wrap the key derived from this legacy env var")
+    parser.add_argument("--keyring", help="Add the wrapped DEK to this JSON keyring (DEK_KEYRING_PATH)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    provider = kek_provider_from_env()
+    key = bytearray(load_key_from_env(args.from_env) if args.from_env else os.urandom(DEK_SIZE))
+    try:
+        wrapped = provider.wrap(key, args.version)
+    finally:
+        zeroize(key)
+
+    encoded = base64.b64encode(wrapped).decode()
+    if args.version == "hmac":
+        print(f"HMAC_KEY_WRAPPED={encoded}")
+    elif args.keyring:
+        add_to_keyring(args.keyring, args.version, wrapped, provider.key_id)
+        logger.info(f"Added wrapped DEK {args.version} to {args.keyring}")
+    else:
+        print(f"{args.version}:{encoded}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
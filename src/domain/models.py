@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
 
 class UserProfileModel(BaseModel):
     id: Optional[int]
@@ -9,5 +10,19 @@ class UserProfileModel(BaseModel):
 
 class SubmitUserRequestModel(BaseModel):
     national_id: str
-    encrypted_key: str
+    # Legacy mode: per-request RSA-wrapped AES key.
+    # Session mode: session_id from /transport-session instead.
+    encrypted_key: Optional[str] = None
     iv: str
+    session_id: Optional[str] = None
+
+class TransportSessionRequestModel(BaseModel):
+    encrypted_key: str
+
+class ExportProfilesRequestModel(BaseModel):
+    format: Literal["ndjson", "csv"] = "ndjson"
+    # Resume point: only rows with a larger id are exported
+    after_id: int = Field(0, ge=0)
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    fetch_size: int = Field(1000, ge=1, le=10000)
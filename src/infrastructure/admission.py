@@ -0,0 +1,273 @@
+"""
+Admission control for the Flask app: bounds how much CPU-bound work runs
+at once and sheds the excess early instead of letting every request slow
+down together.
+
+- Each route class has its own concurrency limit, and all classes share
+  max_concurrent slots in total.
+- A request over its limit waits in a bounded queue. It is rejected at
+  once (503 + Retry-After) when the queue is full or the estimated wait
+  is past the class's max_wait, and when it is still queued at max_wait.
+- Freed slots go to the waiting class with the best priority (lowest
+  number), so searches are served before queued submits.
+- An optional per-client token bucket rejects clients over their rate
+  with 429.
+
+Routes without a class (public key, stats) are never queued.
+
+    ADMISSION_MAX_CONCURRENT=16
+    ADMISSION_LIMITS="submit=8:16:2,search=16:64:1"   # class=concurrent:queue:max_wait[:priority]
+    ADMISSION_CLIENT_RATE=20                          # requests/s per client, 0 = off
+    ADMISSION_CLIENT_BURST=40
+"""
+import os
+import math
+import time
+import bisect
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+from infrastructure.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the per-class service time average
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float, status_code: int = 503):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+
+
+class RoutePolicy:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float, priority: int):
+        if max_concurrent < 1 or max_queue < 0 or max_wait < 0:
+            raise ValueError(f"Invalid admission limits for {name}")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.priority = priority
+
+
+def default_policies(cpus: int = None) -> dict:
+    """RSA/AES-heavy classes get about one slot per core; lookups get more and go first."""
+    cpus = cpus or os.cpu_count() or 1
+    policies = [
+        RoutePolicy("search", 2 * cpus, 4 * cpus, 1.0, priority=1),
+        RoutePolicy("transport_session", cpus, 2 * cpus, 2.0, priority=2),
+        RoutePolicy("submit", cpus, 2 * cpus, 2.0, priority=2),
+        RoutePolicy("search_batch", max(1, cpus // 2), cpus, 5.0, priority=3),
+        RoutePolicy("submit_batch", max(1, cpus // 2), cpus, 5.0, priority=3),
+        RoutePolicy("export", 2, 0, 0.0, priority=3),
+    ]
+    return {policy.name: policy for policy in policies}
+
+
+def parse_limits(spec: str, policies: dict) -> dict:
+    """Applies ADMISSION_LIMITS overrides ("class=concurrent:queue:max_wait[:priority],...")."""
+    policies = dict(policies)
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, values = entry.partition("=")
+        fields = values.split(":")
+        if len(fields) not in (3, 4):
+            raise ValueError(f"ADMISSION_LIMITS entry must be class=concurrent:queue:max_wait[:priority]: {entry}")
+        current = policies.get(name)
+        priority = int(fields[3]) if len(fields) == 4 else (current.priority if current else 2)
+        policies[name] = RoutePolicy(name, int(fields[0]), int(fields[1]), float(fields[2]), priority)
+    return policies
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+
+class ClientRateLimiter:
+    """Token bucket per client id, for the most recently seen max_clients clients."""
+    def __init__(self, rate: float, burst: float, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client: str) -> float:
+        """0.0 if a token was taken, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= 1.0:
+                bucket.tokens -= 1.0
+                return 0.0
+            return (1.0 - bucket.tokens) / self.rate
+
+
+class _RouteState:
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        self.service_time = 0.0  # moving average, seconds
+        self.admitted = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.shed = {"queue_full": 0, "deadline": 0, "timeout": 0, "rate_limited": 0}
+
+
+class _Waiter:
+    __slots__ = ("key", "policy", "deadline", "event", "admitted")
+
+    def __init__(self, key, policy: RoutePolicy, deadline: float):
+        self.key = key
+        self.policy = policy
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.admitted = False
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class AdmissionController:
+    def __init__(self, policies: dict, max_concurrent: int, rate_limiter: ClientRateLimiter = None):
+        self.policies = policies
+        self.max_concurrent = max_concurrent
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self._routes = {name: _RouteState() for name in policies}
+        self._waiting = []  # _Waiter, sorted by (priority, arrival)
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        cpus = os.cpu_count() or 1
+        policies = parse_limits(os.getenv("ADMISSION_LIMITS", ""), default_policies(cpus))
+        rate = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+        limiter = None
+        if rate > 0:
+            limiter = ClientRateLimiter(rate, float(os.getenv("ADMISSION_CLIENT_BURST", str(rate * 2))))
+        controller = cls(policies, int(os.getenv("ADMISSION_MAX_CONCURRENT", str(2 * cpus))), limiter)
+        logger.info(f"Admission control on: {controller.max_concurrent} concurrent, "
+                    f"client rate {rate or 'unlimited'}/s")
+        return controller
+
+    def _shed(self, state: _RouteState, name: str, reason: str, retry_after: float, status_code: int = 503):
+        state.shed[reason] += 1
+        METRICS.count("admission_shed_total", route=name, reason=reason)
+        logger.warning("Shedding %s request: %s", name, reason)
+        return AdmissionRejected(reason, retry_after, status_code)
+
+    def _has_slot(self, policy: RoutePolicy) -> bool:
+        return self.in_flight < self.max_concurrent and self._routes[policy.name].in_flight < policy.max_concurrent
+
+    def _start(self, policy: RoutePolicy, waited: float):
+        state = self._routes[policy.name]
+        state.in_flight += 1
+        state.admitted += 1
+        state.wait_seconds += waited
+        state.max_wait_seconds = max(state.max_wait_seconds, waited)
+        self.in_flight += 1
+
+    def admit(self, name: str, client: str = None) -> float:
+        """
+        Blocks until the request may run and returns the time spent
+        queued; raises AdmissionRejected instead. Pair with release().
+        """
+        policy = self.policies[name]
+        state = self._routes[name]
+        if self.rate_limiter is not None and client is not None:
+            wait = self.rate_limiter.take(client)
+            if wait > 0:
+                with self._lock:
+                    raise self._shed(state, name, "rate_limited", wait, 429)
+
+        with METRICS.stage("admission_wait", route=name):
+            arrived = time.monotonic()
+            with self._lock:
+                # Waiters of this class go first; other classes' waiters are blocked on their own limits
+                if state.queued == 0 and self._has_slot(policy):
+                    self._start(policy, 0.0)
+                    return 0.0
+                # Rough time to reach the head of this class's queue
+                estimate = (state.queued + 1) * state.service_time / policy.max_concurrent
+                if state.queued >= policy.max_queue:
+                    raise self._shed(state, name, "queue_full", estimate or policy.max_wait)
+                if estimate > policy.max_wait:
+                    raise self._shed(state, name, "deadline", estimate)
+                waiter = _Waiter((policy.priority, next(self._arrivals)), policy, arrived + policy.max_wait)
+                bisect.insort(self._waiting, waiter)
+                state.queued += 1
+
+            waiter.event.wait(policy.max_wait)
+            with self._lock:
+                if not waiter.admitted:
+                    self._waiting.remove(waiter)
+                    state.queued -= 1
+                    raise self._shed(state, name, "timeout", policy.max_wait)
+            return time.monotonic() - arrived
+
+    def release(self, name: str, service_time: float):
+        with self._lock:
+            state = self._routes[name]
+            state.in_flight -= 1
+            self.in_flight -= 1
+            state.service_time += SERVICE_TIME_ALPHA * (service_time - state.service_time)
+            self._dispatch()
+
+    def _dispatch(self):
+        """Hands free slots to waiters in priority order; caller holds the lock."""
+        now = time.monotonic()
+        for waiter in list(self._waiting):
+            if self.in_flight >= self.max_concurrent:
+                break
+            # A waiter past its deadline is about to give up; don't spend a slot on it
+            if waiter.deadline <= now or not self._has_slot(waiter.policy):
+                continue
+            self._waiting.remove(waiter)
+            self._routes[waiter.policy.name].queued -= 1
+            self._start(waiter.policy, now - (waiter.deadline - waiter.policy.max_wait))
+            waiter.admitted = True
+            waiter.event.set()
+
+    def describe(self) -> dict:
+        with self._lock:
+            routes = {}
+            for name, state in self._routes.items():
+                policy = self.policies[name]
+                routes[name] = {
+                    "priority": policy.priority,
+                    "max_concurrent": policy.max_concurrent,
+                    "max_queue": policy.max_queue,
+                    "max_wait": policy.max_wait,
+                    "in_flight": state.in_flight,
+                    "queued": state.queued,
+                    "admitted": state.admitted,
+                    "avg_wait_seconds": state.wait_seconds / state.admitted if state.admitted else 0.0,
+                    "max_wait_seconds": state.max_wait_seconds,
+                    "avg_service_seconds": state.service_time,
+                    "shed": dict(state.shed),
+                }
+            return {"max_concurrent": self.max_concurrent, "in_flight": self.in_flight, "routes": routes}
+
+    def gauges(self):
+        for name, state in self._routes.items():
+            labels = {"route": name}
+            yield "admission_in_flight", labels, state.in_flight
+            yield "admission_queued", labels, state.queued
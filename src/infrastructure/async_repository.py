@@ -0,0 +1,110 @@
+import os
+import logging
+import asyncpg
+from infrastructure.storage_layout import StorageLayout, index_to_text
+from infrastructure.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRepository:
+    """
+    asyncpg-backed counterpart of Repository for the ASGI entry point.
+
+    asyncpg prepares and caches statements per connection, so the insert and
+    lookup are planned once per pooled connection. search_cache must be a
+    non-blocking (in-process) cache; the index filter is not used here
+    because its refresh scans the table synchronously.
+    """
+    def __init__(self, dsn: str = None, min_size: int = None, max_size: int = None, search_cache=None,
+                 storage_layout: StorageLayout = None):
+        self.dsn = dsn or os.getenv("DATABASE_URL")
+        self.min_size = min_size if min_size is not None else int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+        self.max_size = max_size if max_size is not None else int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+        self.search_cache = search_cache
+        self.storage_layout = storage_layout or StorageLayout.from_env()
+        self._pool = None
+
+    async def open(self):
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            )
+            logger.info(f"Async DB pool opened (min={self.min_size}, max={self.max_size})")
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def _invalidate(self, national_id_index):
+        if self.search_cache is not None:
+            self.search_cache.invalidate(national_id_index)
+
+    async def save_user_profile(self, national_id_blob, national_id_index):
+        logger.info("Saving user profile. Index hash prefix: %.10s...", index_to_text(national_id_index))
+        layout = self.storage_layout
+        params = layout.insert_params(national_id_blob, national_id_index)
+        placeholders = ", ".join(f"${i + 1}" for i in range(len(params)))
+        try:
+            with METRICS.stage("db_insert"):
+                await self._pool.execute(
+                    f"INSERT INTO user_profiles ({layout.insert_columns}) VALUES ({placeholders})",
+                    *params
+                )
+        except asyncpg.UniqueViolationError:
+            self._invalidate(national_id_index)
+            raise ValueError("National ID already exists")
+        self._invalidate(national_id_index)
+        logger.info("User profile saved successfully")
+
+    async def save_user_profiles(self, rows) -> set:
+        logger.info("Saving %d user profiles", len(rows))
+        layout = self.storage_layout
+        columns = list(zip(*(layout.insert_params(blob, index) for blob, index in rows))) if rows else []
+        arrays = ", ".join(f"${i + 1}::{t}[]" for i, t in enumerate(layout.insert_types))
+        records = await self._pool.fetch(
+            f"INSERT INTO user_profiles ({layout.insert_columns}) "
+            f"SELECT * FROM unnest({arrays}) "
+            f"{layout.on_conflict} RETURNING {layout.returning_column}",
+            *(list(column) for column in columns)
+        ) if rows else []
+        inserted = {layout.inserted_key(record[0]) for record in records}
+        for national_id_index in inserted:
+            self._invalidate(national_id_index)
+        logger.info("Saved %d user profiles, %d duplicates", len(inserted), len(rows) - len(inserted))
+        return inserted
+
+    async def find_by_hash(self, national_id_index):
+        logger.info("Finding user profile by hash. Prefix: %.10s...", index_to_text(national_id_index))
+        token = None
+        if self.search_cache is not None:
+            cached = self.search_cache.get(national_id_index)
+            if cached is not None:
+                return cached
+            token = self.search_cache.read_token(national_id_index)
+
+        layout = self.storage_layout
+        with METRICS.stage("db_lookup"):
+            records = await self._pool.fetch(layout.lookup_sql, *layout.lookup_params(national_id_index))
+        results = layout.normalize_rows(records)
+        if self.search_cache is not None:
+            self.search_cache.set(national_id_index, results, token)
+        logger.info("Found %d profiles", len(results))
+        return results
+
+    async def find_by_hashes(self, indexes, chunk_size: int = 1000) -> dict:
+        """See Repository.find_by_hashes; the search cache is bypassed here too."""
+        results = {index: [] for index in indexes}
+        pending = list(results)
+        layout = self.storage_layout
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            with METRICS.stage("db_lookup"):
+                records = await self._pool.fetch(layout.batch_lookup_sql, *layout.batch_lookup_params(chunk))
+            results.update(layout.normalize_batch_rows(records))
+        logger.info("Found profiles for %d of %d hashes", sum(1 for rows in results.values() if rows), len(results))
+        return results
@@ -0,0 +1,91 @@
+import os
+import atexit
+import json
+import hashlib
+import logging
+from infrastructure.crypto_service import CryptoService
+from infrastructure.repository import Repository
+from infrastructure.sharding import ShardedRepository
+from infrastructure.search_cache import search_cache_from_env
+from infrastructure.index_filter import IndexMembershipFilter
+from infrastructure.idempotency import idempotency_store_from_env
+
+logger = logging.getLogger(__name__)
+
+
+class PublicKeyDocument:
+    """
+    Pre-rendered /public-key response body plus its cache validators.
+    """
+    def __init__(self, pem: str, max_age: int):
+        self.body = json.dumps({"public_key": pem}).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()
+        self.max_age = max_age
+
+
+class ServiceContainer:
+    """
+    App-scoped services. Built once in create_app() so key material is
+    loaded and parsed once per process instead of once per request.
+    """
+    def __init__(self, crypto_service: CryptoService = None, repository: Repository = None):
+        if crypto_service is None:
+            # The configured thread/process decrypt pool lives here, once per server process
+            crypto_service = CryptoService(transport_from_env=True)
+            atexit.register(crypto_service.shutdown)
+        self.crypto_service = crypto_service
+        if repository is None:
+            if os.getenv("DATABASE_SHARDS"):
+                repository = ShardedRepository.from_env(search_cache=search_cache_from_env())
+            else:
+                repository = Repository(search_cache=search_cache_from_env())
+        self.repository = repository
+        if os.getenv("INDEX_FILTER_ENABLED", "0") == "1" and getattr(self.repository, "index_filter", None) is None:
+            if isinstance(self.repository, ShardedRepository):
+                logger.warning("INDEX_FILTER_ENABLED is ignored with DATABASE_SHARDS")
+            else:
+                # Warmed by create_app() once the schema exists
+                self.repository.index_filter = IndexMembershipFilter.from_env(self.repository)
+
+        # Replays retried submits; shared across workers with a shared backend
+        self.idempotency = idempotency_store_from_env()
+
+        max_age = int(os.getenv("PUBLIC_KEY_MAX_AGE", "3600"))
+        self.public_key = PublicKeyDocument(self.crypto_service.get_public_key_pem(), max_age)
+        logger.info("Service container initialized")
+
+    def gauges(self):
+        """(name, labels, value) gauges for /metrics: queue depth, caches, pool and filter state."""
+        decryptor = self.crypto_service.transport_decryptor
+        yield "transport_in_flight", {}, decryptor.in_flight
+        yield "transport_queue_depth", {}, decryptor.queue_depth
+        yield "transport_sessions", {}, len(self.crypto_service.transport_sessions)
+
+        dek_cache = self.crypto_service.key_registry.dek_cache
+        if dek_cache is not None:
+            yield "dek_cache_entries", {}, len(dek_cache)
+            yield "dek_unwraps", {}, dek_cache.unwraps
+
+        if self.idempotency is not None and hasattr(self.idempotency, "__len__"):
+            yield "idempotency_entries", {}, len(self.idempotency)
+
+        cache = getattr(self.repository, "search_cache", None)
+        if cache is not None:
+            for key, value in cache.describe().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield f"search_cache_{key}", {}, value
+        pool = getattr(self.repository, "_pool", None)
+        if pool is not None:
+            yield "db_pool_size", {}, pool.size
+            yield "db_pool_idle", {}, pool.idle_count
+        if isinstance(self.repository, ShardedRepository):
+            for name, shard in self.repository.shards.items():
+                if shard._pool is not None:
+                    yield "db_pool_size", {"shard": name}, shard._pool.size
+                    yield "db_pool_idle", {"shard": name}, shard._pool.idle_count
+        replicas = getattr(self.repository, "replicas", None)
+        if replicas is not None:
+            yield from replicas.gauges()
+        index_filter = getattr(self.repository, "index_filter", None)
+        if index_filter is not None:
+            yield "index_filter_entries", {}, index_filter.bloom.count
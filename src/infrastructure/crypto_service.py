@@ -1,31 +1,53 @@
 import os
 import base64
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.hmac import HMAC
 from cryptography.hazmat.backends import default_backend
 
 logger = logging.getLogger(__name__)
 
-from .storage_cipher_adapters import load_key_from_env, StorageCipherAdapter, V1StorageCipher
+from .dek_cache import load_hmac_key
+from .key_registry import KeyRegistry
+from .storage_layout import StorageLayout
+from .transport_decryptor import TransportDecryptor
+from .session_keys import SessionKeyCache
+from .metrics import METRICS
 
 class CryptoService:
-    def __init__(self):
+    def __init__(self, transport_from_env: bool = False):
         # Load Server Private Key (for Transport Decryption)
         self.private_key = self._load_private_key()
+        # RSA-OAEP unwrap backend, built on first use. Only the server's
+        # ServiceContainer asks for TRANSPORT_DECRYPT_BACKEND; CLIs, import
+        # workers and handler fallbacks unwrap inline instead of each
+        # starting a thread/process pool of their own.
+        self._transport_from_env = transport_from_env
+        self._transport_decryptor = None
+        self._transport_lock = threading.Lock()
+        # Handshake-established AES keys for session-mode submits
+        self.transport_sessions = SessionKeyCache.from_env()
         
+        # Storage DEKs by version; the active one encrypts new writes
+        self.key_registry = KeyRegistry.from_env()
+
         # Load HMAC Key (for Indexing - Column B)
         # Using a separate key or deriving it is best practice.
-        self.hmac_key = load_key_from_env("HMAC_KEY")
+        self.hmac_key = load_hmac_key(self.key_registry.kek_provider)
+        # Keyed HMAC template; copying it is cheaper than re-keying per call.
+        self._hmac_template = HMAC(self.hmac_key, hashes.SHA256(), backend=default_backend())
+        self._public_key_pem = None
+        # binary layout: new blobs/indexes are raw bytes instead of base64 text
+        self.storage_layout = StorageLayout.from_env()
 
-        # Initialize Storage Adapters
-        self.storage_adapters = [
-            V1StorageCipher()
-        ]
-        # Default to the last one (assumed latest) or explicit V1
-        self.default_storage_adapter = self.storage_adapters[0]
+        # Optional thread pool for splitting very large *_many batches
+        self.batch_workers = int(os.getenv("CRYPTO_BATCH_WORKERS", "0"))
+        self.batch_chunk_size = int(os.getenv("CRYPTO_BATCH_CHUNK_SIZE", "2048"))
+        self._batch_executor = None
+        self._batch_lock = threading.Lock()
 
     def _load_private_key(self):
         # In a real app, load from file or secure vault. 
@@ -61,69 +83,253 @@ class CryptoService:
             )
         raise ValueError(f"Server Private Key not found (checked {key_path}, {fallback_path} and PRIVATE_KEY_CONTENT)")
 
+    @property
+    def transport_decryptor(self) -> TransportDecryptor:
+        if self._transport_decryptor is None:
+            with self._transport_lock:
+                if self._transport_decryptor is None:
+                    if self._transport_from_env:
+                        self._transport_decryptor = TransportDecryptor.from_env(self.private_key)
+                    else:
+                        self._transport_decryptor = TransportDecryptor(self.private_key)
+        return self._transport_decryptor
+
+    @transport_decryptor.setter
+    def transport_decryptor(self, decryptor: TransportDecryptor):
+        self._transport_decryptor = decryptor
+
+    def shutdown(self):
+        """Stops the transport decrypt and batch pools, if they were started."""
+        if self._transport_decryptor is not None:
+            self._transport_decryptor.shutdown()
+        with self._batch_lock:
+            executor, self._batch_executor = self._batch_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @property
+    def storage_adapters(self) -> list:
+        return self.key_registry.adapters
+
+    @property
+    def default_storage_adapter(self):
+        return self.key_registry.active
+
     def get_public_key_pem(self) -> str:
         """
         Derives the public key from the private key and returns it in PEM format.
+        The PEM is rendered once and cached for the lifetime of the service.
         """
-        public_key = self.private_key.public_key()
-        pem = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        return pem.decode('utf-8')
+        if self._public_key_pem is None:
+            public_key = self.private_key.public_key()
+            pem = public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+            self._public_key_pem = pem.decode('utf-8')
+        return self._public_key_pem
 
-    def decrypt_transport_payload(self, encrypted_data_b64: str, encrypted_key_b64: str, iv_b64: str) -> str:
+    def open_transport_session(self, encrypted_key_b64: str) -> str:
         """
-        Decrypts the hybrid encryption payload from Frontend.
+        Unwraps a client AES key once and returns a session id that later
+        submits can use instead of a per-request encrypted_key.
+        """
+        symmetric_key = self.transport_decryptor.unwrap_key(encrypted_key_b64)
+        session_id = self.transport_sessions.create(symmetric_key)
+        logger.info("Transport session opened")
+        return session_id
+
+    def decrypt_session_payload(self, session_id: str, encrypted_data_b64: str, iv_b64: str) -> str:
         """
-        logger.info(f"Decrypting transport payload. Data len: {len(encrypted_data_b64)}, Key len: {len(encrypted_key_b64)}")
-        encrypted_key = base64.b64decode(encrypted_key_b64)
-        encrypted_data = base64.b64decode(encrypted_data_b64)
-        iv = base64.b64decode(iv_b64)
-
-        # 1. Decrypt Symmetric Key using Private Key
-        symmetric_key = self.private_key.decrypt(
-            encrypted_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
+        Decrypts an AES-GCM payload with a session key. No RSA work.
+        """
+        aesgcm = self.transport_sessions.get(session_id)
+        with METRICS.stage("session_aes_gcm"):
+            plaintext_bytes = aesgcm.decrypt(
+                base64.b64decode(iv_b64),
+                base64.b64decode(encrypted_data_b64),
+                None
             )
-        )
-
-        # 2. Decrypt Data using Symmetric Key (AES-GCM)
-        aesgcm = AESGCM(symmetric_key)
-        # WebCrypto encrypts tag at end of ciphertext usually. 
-        # Python cryptography AESGCM expects ciphertext + tag combined as data.
-        # This matches the standard GCM construction.
-        plaintext_bytes = aesgcm.decrypt(iv, encrypted_data, None)
-        
-        logger.info("Transport payload decrypted successfully")
         return plaintext_bytes.decode('utf-8')
 
-    def encrypt_for_storage(self, plaintext: str) -> str:
+    def decrypt_transport_payload(self, encrypted_data_b64: str, encrypted_key_b64: str, iv_b64: str,
+                                  session_id: str = None) -> str:
+        """
+        Decrypts the hybrid encryption payload from Frontend.
+        Session payloads use the cached session key; legacy payloads carry
+        their own RSA-wrapped key and run on the transport decrypt backend.
+        """
+        if session_id:
+            logger.info("Decrypting session transport payload. Data len: %d", len(encrypted_data_b64))
+            return self.decrypt_session_payload(session_id, encrypted_data_b64, iv_b64)
+        if not encrypted_key_b64:
+            raise ValueError("Either encrypted_key or session_id is required")
+
+        logger.info("Decrypting transport payload. Data len: %d, Key len: %d", len(encrypted_data_b64), len(encrypted_key_b64))
+        plaintext = self.transport_decryptor.decrypt(encrypted_data_b64, encrypted_key_b64, iv_b64)
+        logger.info("Transport payload decrypted successfully")
+        return plaintext
+
+    def decrypt_transport_payloads(self, payloads) -> list:
+        """
+        Decrypts many (encrypted_data_b64, encrypted_key_b64, iv_b64[, session_id])
+        payloads. Session payloads are decrypted inline, the rest in parallel
+        on the transport decrypt backend. Failed items come back as the
+        exception instance.
+        """
+        logger.info("Decrypting %d transport payloads", len(payloads))
+        results = [None] * len(payloads)
+        rsa_positions = []
+        for pos, payload in enumerate(payloads):
+            encrypted_data_b64, encrypted_key_b64, iv_b64 = payload[:3]
+            session_id = payload[3] if len(payload) > 3 else None
+            if not session_id and encrypted_key_b64:
+                rsa_positions.append(pos)
+                continue
+            try:
+                results[pos] = self.decrypt_transport_payload(encrypted_data_b64, encrypted_key_b64, iv_b64, session_id)
+            except Exception as e:
+                results[pos] = e
+
+        rsa_results = self.transport_decryptor.decrypt_many([payloads[pos][:3] for pos in rsa_positions])
+        for pos, result in zip(rsa_positions, rsa_results):
+            results[pos] = result
+        return results
+
+    def encrypt_for_storage(self, plaintext: str):
         """
         Column A: Randomized Encryption using default adapter.
+        Returns base64 text, or bytes under the binary storage layout.
         """
         logger.info("Encrypting for storage...")
+        if self.storage_layout.binary:
+            return self.default_storage_adapter.encrypt_binary(plaintext.encode())
         blob = self.default_storage_adapter.encrypt(plaintext.encode())
         return base64.b64encode(blob).decode('utf-8')
 
-    def decrypt_from_storage(self, blob_b64: str) -> str:
+    def decrypt_from_storage(self, blob_b64) -> str:
+        """Accepts either layout: base64 text, or binary (bytes / memoryview)."""
         logger.info("Decrypting from storage...")
+        if not isinstance(blob_b64, str):
+            return self.key_registry.adapter_for_binary(blob_b64).decrypt_binary(blob_b64).decode('utf-8')
         blob = base64.b64decode(blob_b64)
-        
-        for adapter in self.storage_adapters:
-            if blob.startswith(adapter.version_prefix):
-                return adapter.decrypt(blob).decode('utf-8')
-        
-        raise ValueError("Unknown storage encryption version")
+        return self.key_registry.adapter_for(blob).decrypt(blob).decode('utf-8')
 
-    def hash_for_index(self, plaintext: str) -> str:
+    def reencrypt_for_storage(self, blob_b64):
+        """
+        Re-encrypts a stored blob with the active DEK version, keeping its
+        layout. Returns None if the blob is already on the active version.
+        """
+        if not isinstance(blob_b64, str):
+            return self._reencrypt_binary(blob_b64)
+        blob = base64.b64decode(blob_b64)
+        if self.key_registry.is_active(blob):
+            return None
+        plaintext = self.key_registry.adapter_for(blob).decrypt(blob)
+        return base64.b64encode(self.default_storage_adapter.encrypt(plaintext)).decode('utf-8')
+
+    def hash_for_index(self, plaintext: str):
         """
         Column B: Deterministic Hash (HMAC-SHA256).
+        Returns base64 text, or the raw 32-byte digest under the binary layout.
         """
         logger.info("Hashing for index...")
-        h = HMAC(self.hmac_key, hashes.SHA256(), backend=default_backend())
+        h = self._hmac_template.copy()
         h.update(plaintext.encode())
+        if self.storage_layout.binary:
+            return h.finalize()
         return base64.b64encode(h.finalize()).decode('utf-8')
+
+    # --- Batch API -------------------------------------------------------
+    # Same results as the per-item methods, but with loop-invariant lookups
+    # hoisted, one log line per batch and optional fan-out across threads.
+
+    def _map_batch(self, chunk_fn, items: Sequence) -> list:
+        if self.batch_workers <= 1 or len(items) <= self.batch_chunk_size:
+            return chunk_fn(items)
+        with self._batch_lock:
+            # Concurrent batches share one executor
+            if self._batch_executor is None:
+                self._batch_executor = ThreadPoolExecutor(max_workers=self.batch_workers,
+                                                          thread_name_prefix="crypto-batch")
+            executor = self._batch_executor
+        size = self.batch_chunk_size
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        results = []
+        for chunk_result in executor.map(chunk_fn, chunks):
+            results.extend(chunk_result)
+        return results
+
+    def _encrypt_chunk(self, plaintexts: Sequence[str]) -> list:
+        if self.storage_layout.binary:
+            encrypt_binary = self.default_storage_adapter.encrypt_binary
+            return [encrypt_binary(p.encode()) for p in plaintexts]
+        encrypt = self.default_storage_adapter.encrypt
+        b64encode = base64.b64encode
+        return [b64encode(encrypt(p.encode())).decode('ascii') for p in plaintexts]
+
+    def _decrypt_chunk(self, blobs_b64: Sequence) -> List[str]:
+        adapter_for = self.key_registry.adapter_for
+        adapter_for_binary = self.key_registry.adapter_for_binary
+        b64decode = base64.b64decode
+        results = []
+        for blob_b64 in blobs_b64:
+            if isinstance(blob_b64, str):
+                blob = b64decode(blob_b64)
+                results.append(adapter_for(blob).decrypt(blob).decode('utf-8'))
+            else:
+                results.append(adapter_for_binary(blob_b64).decrypt_binary(blob_b64).decode('utf-8'))
+        return results
+
+    def _hash_chunk(self, plaintexts: Sequence[str]) -> list:
+        template = self._hmac_template
+        b64encode = base64.b64encode
+        binary = self.storage_layout.binary
+        results = []
+        for plaintext in plaintexts:
+            h = template.copy()
+            h.update(plaintext.encode())
+            results.append(h.finalize() if binary else b64encode(h.finalize()).decode('ascii'))
+        return results
+
+    def _reencrypt_chunk(self, blobs_b64: Sequence) -> list:
+        reencrypt_binary = self._reencrypt_binary
+        is_active = self.key_registry.is_active
+        adapter_for = self.key_registry.adapter_for
+        encrypt = self.default_storage_adapter.encrypt
+        b64decode, b64encode = base64.b64decode, base64.b64encode
+        results = []
+        for blob_b64 in blobs_b64:
+            if not isinstance(blob_b64, str):
+                results.append(reencrypt_binary(blob_b64))
+                continue
+            blob = b64decode(blob_b64)
+            if is_active(blob):
+                results.append(None)
+            else:
+                results.append(b64encode(encrypt(adapter_for(blob).decrypt(blob))).decode('ascii'))
+        return results
+
+    def _reencrypt_binary(self, blob):
+        if self.key_registry.is_active_binary(blob):
+            return None
+        plaintext = self.key_registry.adapter_for_binary(blob).decrypt_binary(blob)
+        return self.default_storage_adapter.encrypt_binary(plaintext)
+
+    def encrypt_for_storage_many(self, plaintexts: Sequence[str]) -> list:
+        logger.info("Encrypting %d values for storage", len(plaintexts))
+        return self._map_batch(self._encrypt_chunk, plaintexts)
+
+    def decrypt_from_storage_many(self, blobs_b64: Sequence[str]) -> List[str]:
+        """Raises on the first blob that cannot be decrypted, like decrypt_from_storage."""
+        logger.info("Decrypting %d values from storage", len(blobs_b64))
+        return self._map_batch(self._decrypt_chunk, blobs_b64)
+
+    def hash_for_index_many(self, plaintexts: Sequence[str]) -> list:
+        logger.info("Hashing %d values for index", len(plaintexts))
+        return self._map_batch(self._hash_chunk, plaintexts)
+
+    def reencrypt_for_storage_many(self, blobs_b64: Sequence[str]) -> list:
+        """Batch reencrypt_for_storage: None for blobs already on the active version."""
+        logger.info("Re-encrypting %d stored values", len(blobs_b64))
+        return self._map_batch(self._reencrypt_chunk, blobs_b64)
@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from infrastructure.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class PooledConnection:
+    """
+    A raw psycopg2 connection plus the bookkeeping the pool needs
+    (age for recycling, idle time for health checks, prepared statement names).
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared = set()
+
+
+class ConnectionPool:
+    """
+    Thread-safe Postgres connection pool.
+
+    - min_size connections are opened on first use and kept warm.
+    - Connections idle for longer than health_check_interval are pinged
+      with SELECT 1 before being handed out; dead ones are replaced.
+    - Connections older than max_lifetime are closed on release (recycling).
+    """
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 1800.0, health_check_interval: float = 30.0,
+                 acquire_timeout: float = 5.0):
+        if min_size > max_size:
+            raise ValueError("min_size must not exceed max_size")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()
+        self._size = 0
+        self._filled = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, dsn: str):
+        return cls(
+            dsn,
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+            acquire_timeout=float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5")),
+        )
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    def _connect(self) -> PooledConnection:
+        with METRICS.stage("db_connect"):
+            return PooledConnection(psycopg2.connect(self.dsn))
+
+    def _fill(self):
+        # Open min_size connections once; failures here surface on acquire
+        with self._cond:
+            if self._filled:
+                return
+            self._filled = True
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+        for opened in range(max(missing, 0)):
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    # Give back every slot that has no connection behind it;
+                    # the next acquire tries the fill again
+                    self._size -= missing - opened
+                    self._filled = False
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        if conn.raw.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.raw.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.raw.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close_quietly(self, conn: PooledConnection):
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+    def acquire(self) -> PooledConnection:
+        with METRICS.stage("db_acquire"):
+            return self._acquire()
+
+    def _acquire(self) -> PooledConnection:
+        if not self._filled:
+            self._fill()
+
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolExhaustedError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(f"No database connection available within {self.acquire_timeout}s")
+                self._cond.wait(remaining)
+
+        if conn is not None and self._is_healthy(conn):
+            return conn
+
+        if conn is not None:
+            logger.warning("Replacing unhealthy pooled connection")
+            self._close_quietly(conn)
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: PooledConnection, discard: bool = False):
+        now = time.monotonic()
+        if not discard and not conn.raw.closed:
+            if conn.raw.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand out a connection with an open or aborted transaction
+                try:
+                    conn.raw.rollback()
+                except psycopg2.Error:
+                    discard = True
+        expired = now - conn.created_at > self.max_lifetime
+
+        with self._cond:
+            if discard or expired or self._closed or conn.raw.closed:
+                self._size -= 1
+                self._cond.notify()
+                close = True
+            else:
+                conn.last_used = now
+                self._idle.append(conn)
+                self._cond.notify()
+                close = False
+        if close:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            # Connection-level failure: don't put it back in the pool
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
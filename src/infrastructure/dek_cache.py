@@ -0,0 +1,169 @@
+"""
+Envelope encryption for storage DEKs.
+
+Each DEK version is configured only in wrapped form:
+
+    DEK_WRAPPED_KEYS="v1:<base64 wrapped>,v2:<base64 wrapped>"
+    # or
+    DEK_KEYRING_PATH=/run/secrets/dek_keyring.json   # {"keys": {"v1": "<base64 wrapped>"}}
+
+and unwrapped through the KEK provider (see key_providers) into a
+DekCache. Adapters fetch their AESGCM from the cache on every call,
+which is a dict lookup and a clock read; the provider is only called
+when an entry is missing or past DEK_CACHE_TTL. Evicted and expired
+keys are zeroized. commands.wrap_dek produces the wrapped values.
+"""
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .storage_cipher_adapters import VersionedStorageCipher, version_tag, load_key_from_env
+from .key_providers import KeyEncryptionProvider, KeyProviderError, kek_provider_from_env
+
+logger = logging.getLogger(__name__)
+
+DEK_SIZE = 32
+
+
+def zeroize(buf: bytearray):
+    """Overwrites key material in place."""
+    buf[:] = bytes(len(buf))
+
+
+class _DekEntry:
+    __slots__ = ("expires_at", "key", "aesgcm")
+
+    def __init__(self, expires_at: float, key: bytearray):
+        self.expires_at = expires_at
+        self.key = key
+        self.aesgcm = AESGCM(key)
+
+
+class DekCache:
+    """
+    Unwrapped DEKs by version, bounded by TTL and entry count.
+
+    Lookups are lock-free; a miss takes the lock and calls the provider
+    once, so concurrent misses for one version share a single unwrap.
+    The AESGCM object keeps its own copy of the key inside OpenSSL; the
+    bytearray held here is what zeroize() wipes on eviction.
+    """
+    def __init__(self, provider: KeyEncryptionProvider, ttl: float = 900.0, max_entries: int = 16):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.unwraps = 0
+        self._entries = OrderedDict()  # version -> _DekEntry
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, provider: KeyEncryptionProvider):
+        return cls(
+            provider,
+            ttl=float(os.getenv("DEK_CACHE_TTL", "900")),
+            max_entries=int(os.getenv("DEK_CACHE_MAX_ENTRIES", "16")),
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def aead(self, version: str, wrapped: bytes) -> AESGCM:
+        entry = self._entries.get(version)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry.aesgcm
+        return self._load(version, wrapped)
+
+    def _load(self, version: str, wrapped: bytes) -> AESGCM:
+        with self._lock:
+            entry = self._entries.get(version)
+            now = time.monotonic()
+            if entry is not None and entry.expires_at > now:
+                return entry.aesgcm
+
+            key = self.provider.unwrap(wrapped, version)
+            self.unwraps += 1
+            if len(key) != DEK_SIZE:
+                zeroize(key)
+                raise KeyProviderError(f"Unwrapped DEK {version} is not {DEK_SIZE} bytes")
+
+            stale = self._entries.pop(version, None)
+            if stale is not None:
+                zeroize(stale.key)
+            entry = self._entries[version] = _DekEntry(now + self.ttl, key)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                zeroize(evicted.key)
+            return entry.aesgcm
+
+    def evict(self, version: str):
+        with self._lock:
+            entry = self._entries.pop(version, None)
+            if entry is not None:
+                zeroize(entry.key)
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                zeroize(entry.key)
+            self._entries.clear()
+
+
+class EnvelopeStorageCipher(VersionedStorageCipher):
+    """
+    Same "<version>:" / tag-byte framing as VersionedStorageCipher, but the
+    DEK is held wrapped and the AESGCM comes from the DekCache.
+    """
+    def __init__(self, version: str, wrapped_dek: bytes, cache: DekCache):
+        self.version = version
+        self.prefix = f"{version}:".encode()
+        self.tag = version_tag(version)
+        self.wrapped_dek = wrapped_dek
+        self.cache = cache
+
+    @property
+    def aesgcm(self) -> AESGCM:
+        return self.cache.aead(self.version, self.wrapped_dek)
+
+
+def load_wrapped_keys() -> dict:
+    """{version: wrapped DEK bytes} from DEK_WRAPPED_KEYS or DEK_KEYRING_PATH, in config order."""
+    spec = os.getenv("DEK_WRAPPED_KEYS")
+    if spec:
+        keys = {}
+        for entry in spec.split(","):
+            version, sep, wrapped = entry.strip().partition(":")
+            if not sep or not version or not wrapped:
+                raise ValueError("DEK_WRAPPED_KEYS entries must look like <version>:<base64 wrapped key>")
+            keys[version] = base64.b64decode(wrapped)
+        return keys
+
+    path = os.getenv("DEK_KEYRING_PATH")
+    if not path:
+        return {}
+    with open(path) as f:
+        keyring = json.load(f)
+    return {version: base64.b64decode(wrapped) for version, wrapped in keyring.get("keys", {}).items()}
+
+
+def envelope_configured() -> bool:
+    return bool(os.getenv("DEK_WRAPPED_KEYS") or os.getenv("DEK_KEYRING_PATH"))
+
+
+def load_hmac_key(provider: KeyEncryptionProvider = None) -> bytes:
+    """
+    HMAC_KEY_WRAPPED (unwrapped once at startup; the HMAC template keeps
+    it for the process lifetime) or the legacy HMAC_KEY.
+    """
+    wrapped = os.getenv("HMAC_KEY_WRAPPED")
+    if not wrapped:
+        return load_key_from_env("HMAC_KEY")
+    provider = provider or kek_provider_from_env()
+    key = provider.unwrap(base64.b64decode(wrapped), "hmac")
+    try:
+        return bytes(key)
+    finally:
+        zeroize(key)
@@ -0,0 +1,221 @@
+"""
+Idempotent submits. A retried request returns the stored response of
+the first attempt instead of running decryption, encryption and the
+insert again.
+
+Requests are keyed by their Idempotency-Key header or, without one, by
+a fingerprint of the raw encrypted payload (a client retry resends the
+same ciphertext). The fingerprint is stored with the response, so a key
+reused with a different payload is rejected instead of replayed.
+
+The first request claims the key with a short-lived in-flight marker.
+A duplicate that arrives meanwhile waits for the stored response; if
+the first attempt fails with a 5xx or 401 the marker is released and
+the duplicate runs instead.
+
+    IDEMPOTENCY_BACKEND=memory        # memory (default), local-shared, redis or none
+    IDEMPOTENCY_TTL=86400             # seconds a response is replayed for
+    IDEMPOTENCY_LOCK_TTL=30           # in-flight marker lifetime if a worker dies mid-request
+    IDEMPOTENCY_WAIT_TIMEOUT=10       # how long a duplicate waits for the in-flight result
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from infrastructure.search_cache import LocalSharedStore
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Fields of a submit that identify the encrypted payload
+FINGERPRINT_FIELDS = ("national_id", "encrypted_key", "iv", "session_id")
+
+
+def request_fingerprint(payload: dict) -> str:
+    """SHA-256 over the submit's ciphertext fields; nothing is decrypted."""
+    canonical = json.dumps([payload.get(field) for field in FINGERPRINT_FIELDS], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def idempotency_key(scope: str, header_value: str, fingerprint: str) -> str:
+    if header_value is None:
+        return f"{scope}:fp:{fingerprint}"
+    if not header_value or len(header_value) > MAX_KEY_LENGTH:
+        raise ValueError(f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+    return f"{scope}:key:{hashlib.sha256(header_value.encode('utf-8')).hexdigest()}"
+
+
+def stored_response(record: dict, fingerprint: str):
+    """(status, body) to answer a claimed-by-someone-else request with."""
+    if record["fingerprint"] != fingerprint:
+        return 422, {"error": f"{IDEMPOTENCY_HEADER} was already used with a different payload"}
+    if record["state"] == IN_FLIGHT:
+        return 409, {"error": "A request with this payload is still in progress, retry later"}
+    return record["status"], record["body"]
+
+
+def should_store(status: int) -> bool:
+    # 5xx (including 503 load shedding) are transient, and a 401 asks the
+    # client to open a new transport session and resend; let those retry
+    return status < 500 and status != 401
+
+
+class IdempotencyStore(ABC):
+    """
+    claim() either takes the key for this request (returns None) or
+    returns the record already there: an in-flight marker or a stored
+    response. Records are JSON-safe dicts so shared stores can hold them.
+    """
+    poll_interval = 0.05
+
+    def __init__(self, ttl: float = 86400.0, in_flight_ttl: float = 30.0, wait_timeout: float = 10.0):
+        self.ttl = ttl
+        self.in_flight_ttl = in_flight_ttl
+        self.wait_timeout = wait_timeout
+
+    @abstractmethod
+    def claim(self, key: str, fingerprint: str):
+        pass
+
+    @abstractmethod
+    def complete(self, key: str, fingerprint: str, status: int, body):
+        pass
+
+    @abstractmethod
+    def release(self, key: str):
+        pass
+
+    def _wait(self, key: str, timeout: float):
+        time.sleep(timeout)
+
+    @staticmethod
+    def _settled(record, fingerprint: str) -> bool:
+        return record is None or record["state"] == DONE or record["fingerprint"] != fingerprint
+
+    def claim_or_wait(self, key: str, fingerprint: str):
+        """claim(), waiting up to wait_timeout for an in-flight duplicate to finish or give up."""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            record = self.claim(key, fingerprint)
+            remaining = deadline - time.monotonic()
+            if self._settled(record, fingerprint) or remaining <= 0:
+                return record
+            self._wait(key, min(remaining, self.poll_interval))
+
+    async def claim_or_wait_async(self, key: str, fingerprint: str):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            record = self.claim(key, fingerprint)
+            remaining = deadline - time.monotonic()
+            if self._settled(record, fingerprint) or remaining <= 0:
+                return record
+            await asyncio.sleep(min(remaining, self.poll_interval))
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Per-process store, bounded to max_entries (oldest dropped first)."""
+    def __init__(self, ttl: float = 86400.0, in_flight_ttl: float = 30.0, wait_timeout: float = 10.0,
+                 max_entries: int = 100000):
+        super().__init__(ttl, in_flight_ttl, wait_timeout)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, record)
+        self._changed = threading.Condition()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put(self, key: str, ttl: float, record: dict):
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + ttl, record)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def claim(self, key: str, fingerprint: str):
+        with self._changed:
+            record = self._live(key)
+            if record is not None:
+                return record
+            self._put(key, self.in_flight_ttl, {"state": IN_FLIGHT, "fingerprint": fingerprint})
+            return None
+
+    def complete(self, key: str, fingerprint: str, status: int, body):
+        with self._changed:
+            self._put(key, self.ttl, {"state": DONE, "fingerprint": fingerprint, "status": status, "body": body})
+            self._changed.notify_all()
+
+    def release(self, key: str):
+        with self._changed:
+            self._entries.pop(key, None)
+            self._changed.notify_all()
+
+    def _wait(self, key: str, timeout: float):
+        with self._changed:
+            self._changed.wait_for(lambda: (self._live(key) or {}).get("state") != IN_FLIGHT, timeout)
+
+
+class SharedIdempotencyStore(IdempotencyStore):
+    """
+    Store on a shared Redis-compatible server so duplicates are caught
+    across workers; the claim is an atomic SET NX. Duplicates poll.
+    """
+    def __init__(self, client, ttl: float = 86400.0, in_flight_ttl: float = 30.0, wait_timeout: float = 10.0,
+                 key_prefix: str = "idem:"):
+        super().__init__(ttl, in_flight_ttl, wait_timeout)
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def claim(self, key: str, fingerprint: str):
+        marker = json.dumps({"state": IN_FLIGHT, "fingerprint": fingerprint})
+        while True:
+            if self.client.set(self.key_prefix + key, marker, ex=max(1, int(self.in_flight_ttl)), nx=True):
+                return None
+            raw = self.client.get(self.key_prefix + key)
+            if raw is not None:
+                return json.loads(raw)
+            # Expired or released between the two calls; try to claim again
+
+    def complete(self, key: str, fingerprint: str, status: int, body):
+        record = {"state": DONE, "fingerprint": fingerprint, "status": status, "body": body}
+        self.client.set(self.key_prefix + key, json.dumps(record), ex=max(1, int(self.ttl)))
+
+    def release(self, key: str):
+        self.client.delete(self.key_prefix + key)
+
+
+def idempotency_store_from_env():
+    backend = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+    ttl = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+    in_flight_ttl = float(os.getenv("IDEMPOTENCY_LOCK_TTL", "30"))
+    wait_timeout = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return InMemoryIdempotencyStore(ttl, in_flight_ttl, wait_timeout,
+                                        int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000")))
+    if backend == "local-shared":
+        return SharedIdempotencyStore(LocalSharedStore(), ttl, in_flight_ttl, wait_timeout)
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("IDEMPOTENCY_BACKEND=redis requires the 'redis' package")
+        url = os.getenv("IDEMPOTENCY_REDIS_URL") or os.getenv("SEARCH_CACHE_REDIS_URL", "redis://localhost:6379/0")
+        return SharedIdempotencyStore(redis.Redis.from_url(url), ttl, in_flight_ttl, wait_timeout)
+    raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {backend}")
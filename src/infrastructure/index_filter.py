@@ -0,0 +1,258 @@
+import os
+import math
+import time
+import base64
+import struct
+import atexit
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; saves are then unsynchronized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"NIDBLOOM1"
+SNAPSHOT_HEADER = struct.Struct(">QQQQd")  # num_bits, num_hashes, count, last_id, fp_rate
+
+
+def _index_bytes(national_id_index) -> bytes:
+    # Index values are HMAC-SHA256 digests, stored base64-encoded
+    if isinstance(national_id_index, str):
+        return base64.b64decode(national_id_index)
+    return bytes(national_id_index)
+
+
+class BloomFilter:
+    """
+    Bloom filter over national_id_index values.
+
+    The values are already uniformly distributed HMAC outputs, so bit
+    positions come straight from the digest (double hashing on two 64-bit
+    slices) with no extra hashing.
+    """
+    def __init__(self, capacity: int, fp_rate: float = 0.01):
+        if capacity <= 0 or not 0 < fp_rate < 1:
+            raise ValueError("capacity must be positive and 0 < fp_rate < 1")
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, digest: bytes):
+        h1 = int.from_bytes(digest[0:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, national_id_index):
+        positions = self._positions(_index_bytes(national_id_index))
+        bits = self._bits
+        # Read-modify-write on shared bytes: serialize so no bit is lost
+        with self._lock:
+            new_bit = False
+            for pos in positions:
+                mask = 1 << (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    new_bit = True
+            # Re-adding a known value (e.g. on rescan) doesn't inflate count
+            if new_bit:
+                self.count += 1
+
+    def might_contain(self, national_id_index) -> bool:
+        bits = self._bits
+        for pos in self._positions(_index_bytes(national_id_index)):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    __contains__ = might_contain
+
+    def to_bytes(self, last_id: int = 0) -> bytes:
+        with self._lock:
+            header = SNAPSHOT_HEADER.pack(self.num_bits, self.num_hashes, self.count, last_id, self.fp_rate)
+            return SNAPSHOT_MAGIC + header + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Returns (filter, last_id) from a to_bytes() snapshot."""
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("Not a bloom filter snapshot")
+        offset = len(SNAPSHOT_MAGIC)
+        num_bits, num_hashes, count, last_id, fp_rate = SNAPSHOT_HEADER.unpack_from(data, offset)
+        bits = data[offset + SNAPSHOT_HEADER.size:]
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated bloom filter snapshot")
+        bloom = cls.__new__(cls)
+        bloom.capacity = max(1, int(num_bits * (math.log(2) ** 2) / -math.log(fp_rate)))
+        bloom.fp_rate = fp_rate
+        bloom.num_bits = num_bits
+        bloom.num_hashes = num_hashes
+        bloom.count = count
+        bloom._bits = bytearray(bits)
+        bloom._lock = threading.Lock()
+        return bloom, last_id
+
+
+class IndexMembershipFilter:
+    """
+    Answers "is this national_id_index definitely absent?" without a DB
+    round trip.
+
+    Built at startup from a snapshot (if any) plus a bulk scan of newer
+    rows, and updated on every local insert. Rows inserted by other
+    processes are picked up by an incremental rescan that a background
+    thread runs every refresh_interval seconds; that interval bounds how
+    long another worker's insert can be reported as absent. The rescan
+    starts refresh_lookback ids before the last id seen, because SERIAL ids
+    can commit out of order, and is skipped when the (max id, count) of
+    that window has not changed since the last one.
+
+    Lookups never touch the database. If no rescan has succeeded for
+    3 * refresh_interval (DB down, thread stuck), misses answer "maybe"
+    so callers fall back to the query instead of trusting stale bits.
+    """
+    def __init__(self, repository, capacity: int = 10_000_000, fp_rate: float = 0.01,
+                 snapshot_path: str = None, refresh_interval: float = 1.0, refresh_lookback: int = 1000):
+        self.repository = repository
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.refresh_lookback = refresh_lookback
+        self.bloom = BloomFilter(capacity, fp_rate)
+        self.last_id = 0
+        self._last_refresh = 0.0
+        self._watermark = None  # (scan start id, (max id, count)) of the last rescan
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+        self.ready = False
+
+    @classmethod
+    def from_env(cls, repository):
+        return cls(
+            repository,
+            capacity=int(os.getenv("INDEX_FILTER_CAPACITY", "10000000")),
+            fp_rate=float(os.getenv("INDEX_FILTER_FP_RATE", "0.01")),
+            snapshot_path=os.getenv("INDEX_FILTER_SNAPSHOT_PATH") or None,
+            refresh_interval=float(os.getenv("INDEX_FILTER_REFRESH_SECONDS", "1.0")),
+            refresh_lookback=int(os.getenv("INDEX_FILTER_REFRESH_LOOKBACK", "1000")),
+        )
+
+    def warm(self):
+        """Loads the snapshot (if compatible) and scans rows added since it was taken."""
+        started = time.monotonic()
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "rb") as f:
+                    bloom, last_id = BloomFilter.from_bytes(f.read())
+                if bloom.num_bits >= self.bloom.num_bits:
+                    self.bloom, self.last_id = bloom, last_id
+                    logger.info(f"Loaded index filter snapshot up to id={last_id}")
+                else:
+                    logger.info("Index filter snapshot is smaller than configured capacity; rebuilding")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable index filter snapshot: {e}")
+
+        scanned = self._scan(self.last_id)
+        self.ready = True
+        logger.info(f"Index filter warmed: {scanned} rows scanned in {time.monotonic() - started:.1f}s")
+        if self.snapshot_path:
+            self.save_snapshot()
+            atexit.register(self.save_snapshot)
+        if self.refresh_interval > 0 and self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="index-filter-refresh", daemon=True)
+            self._refresher.start()
+
+    def _scan(self, after_id: int) -> int:
+        scanned = 0
+        for rows in self.repository.iter_index_batches(after_id):
+            for row_id, national_id_index in rows:
+                self.bloom.add(national_id_index)
+            scanned += len(rows)
+            self.last_id = max(self.last_id, rows[-1][0])
+        self._last_refresh = time.monotonic()
+        if self.bloom.count > self.capacity:
+            logger.warning(f"Index filter holds {self.bloom.count} entries, above its capacity of {self.capacity}; "
+                           f"false-positive rate is rising, raise INDEX_FILTER_CAPACITY")
+        return scanned
+
+    def refresh(self):
+        # One refresher at a time; concurrent callers just use current bits
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            after_id = max(0, self.last_id - self.refresh_lookback)
+            # Taken before the scan, so rows committed during it change the next watermark
+            watermark = (after_id, self.repository.index_watermark(after_id))
+            if watermark == self._watermark:
+                self._last_refresh = time.monotonic()
+                return
+            self._scan(after_id)
+            self._watermark = watermark
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # might_contain() stops trusting misses once the bits go stale
+                logger.warning(f"Index filter refresh failed: {type(e).__name__}: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+    def add(self, national_id_index):
+        self.bloom.add(national_id_index)
+
+    def might_contain(self, national_id_index) -> bool:
+        if not self.ready or self.bloom.might_contain(national_id_index):
+            return True
+        # Trust a miss only while the background rescan keeps up
+        return time.monotonic() - self._last_refresh >= 3 * self.refresh_interval
+
+    def save_snapshot(self) -> bool:
+        """
+        Atomically replaces the snapshot file. Every worker may call this
+        (at warm-up and exit): each writes its own temp file, and a worker
+        that finds another one mid-save skips instead of waiting. Errors
+        are logged, never raised, so a bad snapshot path cannot stop boot.
+        """
+        if not self.snapshot_path:
+            return False
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        tmp_path = None
+        try:
+            with open(f"{self.snapshot_path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        logger.info("Index filter snapshot is being saved by another process; skipping")
+                        return False
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".index-filter-", suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self.bloom.to_bytes(self.last_id))
+                os.replace(tmp_path, self.snapshot_path)
+                tmp_path = None
+        except OSError as e:
+            logger.warning(f"Could not save index filter snapshot: {e}")
+            return False
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+        logger.info(f"Saved index filter snapshot up to id={self.last_id}")
+        return True
@@ -0,0 +1,143 @@
+"""
+Key-encryption-key (KEK) providers for envelope encryption.
+
+Storage DEKs are kept only in wrapped form (DEK_WRAPPED_KEYS or a
+keyring file); a provider unwraps them on a DekCache miss. Providers:
+
+    KEK_PROVIDER=env    KEK_KEY=<base64 32 bytes>
+    KEK_PROVIDER=file   KEK_PATH=/run/secrets/kek
+    KEK_PROVIDER=kms    KMS_ADDRESS=127.0.0.1:7700 KMS_AUTHKEY=... KMS_KEY_ID=storage
+
+The kms provider talks to infrastructure.mock_kms, a separate process
+that holds the KEK, the same way a real KMS client would.
+"""
+import os
+import base64
+import logging
+import threading
+from abc import ABC, abstractmethod
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .storage_cipher_adapters import NONCE_SIZE
+
+logger = logging.getLogger(__name__)
+
+KEK_SIZE = 32
+
+
+class KeyProviderError(ValueError):
+    """Raised when a DEK cannot be wrapped or unwrapped."""
+
+
+class KeyEncryptionProvider(ABC):
+    """
+    Wraps and unwraps DEKs under a KEK. context (the DEK version) is bound
+    as associated data, so a wrapped DEK cannot be replayed as another version.
+    """
+    key_id = "default"
+
+    @abstractmethod
+    def wrap(self, dek: bytes, context: str) -> bytes:
+        pass
+
+    @abstractmethod
+    def unwrap(self, wrapped: bytes, context: str) -> bytearray:
+        pass
+
+
+class LocalKekProvider(KeyEncryptionProvider):
+    """AES-256-GCM key wrap with a KEK held in this process (env or file)."""
+    def __init__(self, kek: bytes, key_id: str = "local"):
+        if len(kek) != KEK_SIZE:
+            raise ValueError("KEK must be 32 bytes")
+        self.key_id = key_id
+        self._aesgcm = AESGCM(kek)
+
+    @classmethod
+    def from_env(cls):
+        value = os.getenv("KEK_KEY")
+        if not value:
+            raise ValueError("Missing required environment variable: KEK_KEY")
+        return cls(base64.b64decode(value), key_id=os.getenv("KEK_KEY_ID", "env"))
+
+    @classmethod
+    def from_file(cls, path: str = None):
+        path = path or os.getenv("KEK_PATH")
+        if not path:
+            raise ValueError("Missing required environment variable: KEK_PATH")
+        with open(path, "rb") as f:
+            raw = f.read().strip()
+        # Raw 32 bytes or base64 text
+        kek = raw if len(raw) == KEK_SIZE else base64.b64decode(raw)
+        return cls(kek, key_id=os.getenv("KEK_KEY_ID", os.path.basename(path)))
+
+    def wrap(self, dek: bytes, context: str) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aesgcm.encrypt(nonce, bytes(dek), context.encode())
+
+    def unwrap(self, wrapped: bytes, context: str) -> bytearray:
+        try:
+            return bytearray(self._aesgcm.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], context.encode()))
+        except Exception:
+            raise KeyProviderError(f"Cannot unwrap DEK {context} with KEK {self.key_id}")
+
+
+class KmsKekProvider(KeyEncryptionProvider):
+    """
+    Client for the mock KMS process. One short-lived connection per call;
+    calls only happen on DEK cache misses.
+    """
+    def __init__(self, address, authkey: bytes, key_id: str = "storage", timeout: float = 5.0):
+        self.address = address
+        self.authkey = authkey
+        self.key_id = key_id
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        host, _, port = os.getenv("KMS_ADDRESS", "127.0.0.1:7700").rpartition(":")
+        authkey = os.getenv("KMS_AUTHKEY")
+        if not authkey:
+            raise ValueError("Missing required environment variable: KMS_AUTHKEY")
+        return cls((host, int(port)), authkey.encode(), key_id=os.getenv("KMS_KEY_ID", "storage"))
+
+    def _call(self, op: str, data: bytes, context: str) -> bytes:
+        with self._lock:
+            try:
+                with Client(self.address, authkey=self.authkey) as conn:
+                    conn.send({"op": op, "key_id": self.key_id, "data": bytes(data), "context": context})
+                    if not conn.poll(self.timeout):
+                        raise KeyProviderError(f"KMS {op} timed out")
+                    reply = conn.recv()
+            except KeyProviderError:
+                raise
+            except (OSError, EOFError, AuthenticationError) as e:
+                raise KeyProviderError(f"KMS unavailable: {e}")
+        if not reply.get("ok"):
+            raise KeyProviderError(f"KMS {op} failed: {reply.get('error')}")
+        return reply["data"]
+
+    def wrap(self, dek: bytes, context: str) -> bytes:
+        return self._call("wrap", dek, context)
+
+    def unwrap(self, wrapped: bytes, context: str) -> bytearray:
+        return bytearray(self._call("unwrap", wrapped, context))
+
+
+PROVIDERS = {
+    "env": LocalKekProvider.from_env,
+    "file": LocalKekProvider.from_file,
+    "kms": KmsKekProvider.from_env,
+}
+
+
+def kek_provider_from_env() -> KeyEncryptionProvider:
+    name = os.getenv("KEK_PROVIDER", "env")
+    factory = PROVIDERS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown KEK_PROVIDER: {name}")
+    provider = factory()
+    logger.info(f"Using {name} KEK provider (key_id={provider.key_id})")
+    return provider
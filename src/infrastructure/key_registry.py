@@ -0,0 +1,142 @@
+import os
+import base64
+import logging
+from typing import Dict
+from .storage_cipher_adapters import StorageCipherAdapter, VersionedStorageCipher, V1StorageCipher, derive_key
+from .key_providers import kek_provider_from_env
+from .dek_cache import DekCache, EnvelopeStorageCipher, envelope_configured, load_wrapped_keys
+
+logger = logging.getLogger(__name__)
+
+# Longest accepted "<version>:" prefix; bounds the separator scan
+MAX_PREFIX_LEN = 16
+
+
+class KeyRegistry:
+    """
+    Storage DEKs by version, with exactly one active version for new writes.
+
+    Configured with DEK_KEYS="v1:<secret>,v2:<secret>" and
+    DEK_ACTIVE_VERSION=v2. Without DEK_KEYS the single DEK_KEY is
+    registered as v1. With DEK_WRAPPED_KEYS / DEK_KEYRING_PATH the DEKs
+    are envelope-encrypted instead (see dek_cache). Dispatch parses the blob's version prefix (or, for
+    binary-layout blobs, reads the tag byte) and does one dict lookup,
+    however many versions are registered.
+    """
+    def __init__(self, adapters=(), active_version: str = None):
+        self._by_prefix: Dict[bytes, StorageCipherAdapter] = {}
+        self._by_tag: Dict[int, StorageCipherAdapter] = {}
+        self._active = None
+        # Set when DEKs are envelope-encrypted
+        self.kek_provider = None
+        self.dek_cache = None
+        for adapter in adapters:
+            self.register(adapter)
+        if active_version is not None:
+            self.activate(active_version)
+
+    @classmethod
+    def from_env(cls):
+        if envelope_configured():
+            return cls.from_keyring()
+        spec = os.getenv("DEK_KEYS")
+        if not spec:
+            return cls([V1StorageCipher()], "v1")
+
+        adapters = []
+        for entry in spec.split(","):
+            version, sep, secret = entry.strip().partition(":")
+            if not sep or not version or not secret:
+                raise ValueError("DEK_KEYS entries must look like <version>:<secret>")
+            adapters.append(VersionedStorageCipher(version, derive_key(secret)))
+        active = os.getenv("DEK_ACTIVE_VERSION") or adapters[-1].version
+        registry = cls(adapters, active)
+        logger.info(f"Loaded DEK versions {registry.versions}, active={active}")
+        return registry
+
+    @classmethod
+    def from_keyring(cls, provider=None, wrapped_keys: dict = None, active_version: str = None):
+        provider = provider or kek_provider_from_env()
+        wrapped_keys = wrapped_keys if wrapped_keys is not None else load_wrapped_keys()
+        if not wrapped_keys:
+            raise ValueError("No wrapped DEKs configured")
+        cache = DekCache.from_env(provider)
+        if len(wrapped_keys) > cache.max_entries:
+            logger.warning(f"{len(wrapped_keys)} DEK versions exceed DEK_CACHE_MAX_ENTRIES={cache.max_entries}; "
+                           f"expect repeated unwraps")
+        adapters = [EnvelopeStorageCipher(version, wrapped, cache) for version, wrapped in wrapped_keys.items()]
+        active = active_version or os.getenv("DEK_ACTIVE_VERSION") or adapters[-1].version
+        registry = cls(adapters, active)
+        registry.kek_provider = provider
+        registry.dek_cache = cache
+        # Unwrap every version now so a bad KEK or keyring fails at startup
+        for adapter in adapters:
+            adapter.aesgcm
+        logger.info(f"Loaded wrapped DEK versions {registry.versions}, active={active}")
+        return registry
+
+    @property
+    def adapters(self) -> list:
+        return list(self._by_prefix.values())
+
+    @property
+    def versions(self) -> list:
+        return [prefix[:-1].decode() for prefix in self._by_prefix]
+
+    @property
+    def active(self) -> StorageCipherAdapter:
+        return self._active
+
+    def register(self, adapter: StorageCipherAdapter):
+        prefix = adapter.version_prefix
+        if not prefix.endswith(b":") or len(prefix) > MAX_PREFIX_LEN:
+            raise ValueError(f"Invalid storage version prefix: {prefix!r}")
+        if prefix in self._by_prefix:
+            raise ValueError(f"Storage version already registered: {prefix!r}")
+        tag = getattr(adapter, "tag", None)
+        if tag is not None:
+            if tag in self._by_tag:
+                raise ValueError(f"Storage version tag already registered: {tag}")
+            self._by_tag[tag] = adapter
+        self._by_prefix[prefix] = adapter
+        if self._active is None:
+            self._active = adapter
+
+    def activate(self, version: str):
+        adapter = self._by_prefix.get(f"{version}:".encode())
+        if adapter is None:
+            raise ValueError(f"Active DEK version {version} is not registered")
+        self._active = adapter
+
+    def version_prefix_of(self, blob: bytes) -> bytes:
+        end = blob.find(b":", 0, MAX_PREFIX_LEN)
+        if end < 0:
+            raise ValueError("Unknown storage encryption version")
+        return blob[:end + 1]
+
+    def adapter_for(self, blob: bytes) -> StorageCipherAdapter:
+        adapter = self._by_prefix.get(self.version_prefix_of(blob))
+        if adapter is None:
+            raise ValueError("Unknown storage encryption version")
+        return adapter
+
+    def is_active(self, blob: bytes) -> bool:
+        return blob.startswith(self._active.version_prefix)
+
+    def adapter_for_binary(self, blob) -> StorageCipherAdapter:
+        adapter = self._by_tag.get(blob[0]) if len(blob) else None
+        if adapter is None:
+            raise ValueError("Unknown storage encryption version")
+        return adapter
+
+    def version_of(self, blob) -> str:
+        """Version that wrote a stored blob (base64 text or binary), or "unknown"."""
+        try:
+            if isinstance(blob, str):
+                return self.adapter_for(base64.b64decode(blob)).version
+            return self.adapter_for_binary(blob).version
+        except (ValueError, AttributeError):
+            return "unknown"
+
+    def is_active_binary(self, blob) -> bool:
+        return len(blob) > 0 and blob[0] == getattr(self._active, "tag", None)
@@ -0,0 +1,207 @@
+"""
+Non-blocking logging with PII masking.
+
+configure_logging() replaces the blocking stdout handler with a bounded
+queue drained by a background writer thread. Records pass two filters
+before they are queued:
+
+- SamplingFilter keeps 1 in N INFO/DEBUG records for noisy loggers
+  (WARNING and above are never sampled out).
+- PiiMaskingFilter renders the message, redacts 13-digit IDs and known
+  sensitive fields, and drops the args, so nothing unmasked ever
+  reaches the queue or the writer.
+
+When the queue is full records are dropped and counted rather than
+blocking the request thread.
+
+    LOG_LEVEL=INFO
+    LOG_QUEUE_SIZE=10000
+    LOG_SAMPLE_RATES="infrastructure.crypto_service=100,infrastructure.repository=10"
+"""
+import os
+import re
+import sys
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+MASK = "[REDACTED]"
+
+# A bare 13-digit run (Thai national ID shape), not part of a longer number
+NATIONAL_ID_PATTERN = re.compile(r"(?<!\d)\d{13}(?!\d)")
+
+SENSITIVE_FIELDS = frozenset({
+    "national_id", "nid", "plaintext", "encrypted_key", "iv",
+    "dek", "dek_key", "hmac_key", "private_key", "session_key",
+})
+
+# "national_id=..." / '"iv": "..."' inside an already formatted message
+SENSITIVE_PAIR_PATTERN = re.compile(
+    r"""(?P<key>["']?\b(?:%s)\b["']?\s*[:=]\s*)(?P<value>"[^"]*"|'[^']*'|[^\s,;&}]+)"""
+    % "|".join(sorted(SENSITIVE_FIELDS, key=len, reverse=True)),
+    re.IGNORECASE,
+)
+
+# Attributes every LogRecord has; anything else came in via extra=
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# The running pipeline, if configure_logging() has been called
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def mask_text(text: str) -> str:
+    text = SENSITIVE_PAIR_PATTERN.sub(lambda m: m.group("key") + MASK, text)
+    return NATIONAL_ID_PATTERN.sub(MASK, text)
+
+
+class PiiMaskingFilter(logging.Filter):
+    """Formats the record eagerly and replaces it with a masked copy."""
+    def filter(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            # Leave broken format strings to the handler's error path
+            return True
+        record.msg = mask_text(message)
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = mask_text(record.exc_text)
+        # Tracebacks are rendered above; don't ship frames with locals to the queue
+        record.exc_info = None
+        for name, value in list(vars(record).items()):
+            if name in _RECORD_ATTRS:
+                continue
+            if name.lower() in SENSITIVE_FIELDS:
+                setattr(record, name, MASK)
+            elif isinstance(value, str):
+                setattr(record, name, mask_text(value))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps every Nth INFO/DEBUG record per configured logger. Rates apply to
+    the logger and its children; the most specific configured name wins.
+    """
+    def __init__(self, rates: dict = None):
+        super().__init__()
+        self.rates = {name: int(n) for name, n in (rates or {}).items() if int(n) > 1}
+        self._resolved = {}  # logger name -> N (1 = keep all)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        rates = {}
+        for item in os.getenv("LOG_SAMPLE_RATES", "").split(","):
+            name, _, n = item.strip().partition("=")
+            if name and n:
+                rates[name] = int(n)
+        return cls(rates)
+
+    def _rate_for(self, name: str) -> int:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, probe = 1, name
+            while probe:
+                if probe in self.rates:
+                    rate = self.rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate_for(record.name)
+        if rate == 1:
+            return True
+        with self._lock:
+            seen = self._counters.get(record.name, 0)
+            self._counters[record.name] = seen + 1
+        return seen % rate == 0
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # PiiMaskingFilter already rendered msg and cleared args/exc_info
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingPipeline:
+    def __init__(self, handler: DroppingQueueHandler, listener: QueueListener):
+        self.handler = handler
+        self.listener = listener
+
+    @property
+    def queue_depth(self) -> int:
+        return self.handler.queue.qsize()
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def stop(self):
+        """Flushes whatever is queued and stops the writer thread."""
+        self.listener.stop()
+
+
+def configure_logging(stream=None, level: str = None, queue_size: int = None) -> LoggingPipeline:
+    """
+    Installs the queue handler on the root logger. Idempotent: later calls
+    return the pipeline that is already running.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+
+        level = level or os.getenv("LOG_LEVEL", "INFO")
+        queue_size = queue_size or int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        handler.addFilter(SamplingFilter.from_env())
+        handler.addFilter(PiiMaskingFilter())
+
+        listener = QueueListener(handler.queue, writer, respect_handler_level=True)
+        listener.start()
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(handler)
+
+        _pipeline = LoggingPipeline(handler, listener)
+        atexit.register(shutdown_logging)
+        return _pipeline
+
+
+def shutdown_logging():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            return
+        logging.getLogger().removeHandler(_pipeline.handler)
+        _pipeline.stop()
+        _pipeline = None
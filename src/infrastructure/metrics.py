@@ -0,0 +1,190 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; covers sub-ms HMAC up to multi-second stalls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Shared no-op returned by stage() while metrics are off
+_NOOP_STAGE = nullcontext()
+
+# (stage, seconds) pairs for the current request when Server-Timing is on
+_request_timings: ContextVar = ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Stage:
+    __slots__ = ("metrics", "key", "name", "started")
+
+    def __init__(self, metrics, key, name):
+        self.metrics = metrics
+        self.key = key
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.observe(self.key, elapsed, failed=exc_type is not None)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+class StageMetrics:
+    """
+    Per-stage latency histograms and counters, rendered in Prometheus text
+    format. Disabled by default; while disabled stage() hands back a shared
+    no-op context manager and nothing is recorded.
+
+        with METRICS.stage("hmac_index"):
+            ...
+        with METRICS.stage("storage_encrypt", key_version="v2"):
+            ...
+    """
+    def __init__(self, enabled: bool = False, server_timing: bool = False, prefix: str = "nid"):
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self.prefix = prefix
+        self._histograms = {}  # (stage, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> int
+        self._gauge_sources = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, server_timing: bool = False):
+        self.enabled = enabled
+        self.server_timing = enabled and server_timing
+
+    def configure_from_env(self):
+        """METRICS_ENABLED=1 turns collection on; METRICS_SERVER_TIMING=1 adds the response header."""
+        self.configure(os.getenv("METRICS_ENABLED", "0") == "1", os.getenv("METRICS_SERVER_TIMING", "0") == "1")
+        if self.enabled:
+            logger.info(f"Stage metrics enabled (server_timing={self.server_timing})")
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauge_sources.clear()
+
+    def stage(self, name: str, **labels):
+        if not self.enabled:
+            return _NOOP_STAGE
+        return _Stage(self, (name, tuple(sorted(labels.items()))), name)
+
+    def observe(self, key, seconds: float, failed: bool = False):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+            if failed:
+                error_key = ("stage_errors_total", key)
+                self._counters[error_key] = self._counters.get(error_key, 0) + 1
+
+    def count(self, name: str, amount: int = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, ("", tuple(sorted(labels.items()))))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge_source(self, key: str, source):
+        """source() returns (name, labels_dict, value) tuples, read at scrape time."""
+        self._gauge_sources[key] = source
+
+    # --- Server-Timing ----------------------------------------------------
+
+    def begin_request(self):
+        """Starts collecting stage timings for this request; returns a reset token."""
+        return _request_timings.set([]) if self.server_timing else None
+
+    def end_request(self, token) -> str:
+        """Returns the Server-Timing header value (or None) and stops collecting."""
+        if token is None:
+            return None
+        timings = _request_timings.get()
+        _request_timings.reset(token)
+        if not timings:
+            return None
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings)
+
+    # --- Exposition ---------------------------------------------------------
+
+    @staticmethod
+    def _labels(pairs) -> str:
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        p = self.prefix
+        with self._lock:
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        lines = [f"# HELP {p}_stage_duration_seconds Time spent per request stage.",
+                 f"# TYPE {p}_stage_duration_seconds histogram"]
+        for (stage, labels), counts, total, count, buckets in sorted(histograms):
+            base = (("stage", stage),) + labels
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{p}_stage_duration_seconds_bucket{self._labels(base + (('le', le),))} {cumulative}")
+            lines.append(f"{p}_stage_duration_seconds_sum{self._labels(base)} {total}")
+            lines.append(f"{p}_stage_duration_seconds_count{self._labels(base)} {count}")
+
+        by_name = {}
+        for (name, (stage, labels)), value in counters:
+            pairs = ((("stage", stage),) if stage else ()) + labels
+            by_name.setdefault(name, []).append((pairs, value))
+        for name in sorted(by_name):
+            lines.append(f"# TYPE {p}_{name} counter")
+            for pairs, value in sorted(by_name[name]):
+                lines.append(f"{p}_{name}{self._labels(pairs)} {value}")
+
+        gauges = {}
+        for source in list(self._gauge_sources.values()):
+            try:
+                for name, labels, value in source():
+                    gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                logger.warning(f"Metrics gauge source failed: {e}")
+        for name in sorted(gauges):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            for pairs, value in gauges[name]:
+                lines.append(f"{p}_{name}{self._labels(pairs)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide instance, configured by create_app() / create_asgi_app()
+METRICS = StageMetrics()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
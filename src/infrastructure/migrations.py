@@ -0,0 +1,80 @@
+"""
+Schema migrations for user_profiles.
+
+Run once at startup by create_app() (unless DB_MIGRATE_ON_STARTUP=0) or
+explicitly with:
+
+    PYTHONPATH=src python -m infrastructure.migrations
+"""
+import logging
+from infrastructure.repository import Repository
+from infrastructure.sharding import ShardedRepository
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant so concurrent workers serialize on the same advisory lock
+MIGRATION_LOCK_ID = 814_202_611
+
+# Ordered (name, sql) pairs. Never edit an applied migration; append a new one.
+MIGRATIONS = [
+    ("0001_create_user_profiles", """
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id SERIAL PRIMARY KEY,
+            national_id_blob VARCHAR(255) NOT NULL,
+            national_id_index VARCHAR(64) NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    # Binary storage layout (STORAGE_LAYOUT=dual/binary). The new columns are
+    # nullable so rows can be converted online; see commands.convert_storage_layout.
+    ("0002_add_binary_storage_columns", """
+        ALTER TABLE user_profiles
+            ADD COLUMN IF NOT EXISTS national_id_blob_bin BYTEA,
+            ADD COLUMN IF NOT EXISTS national_id_index_bin BYTEA
+                CONSTRAINT user_profiles_national_id_index_bin_len CHECK (octet_length(national_id_index_bin) = 32),
+            ALTER COLUMN national_id_blob DROP NOT NULL,
+            ALTER COLUMN national_id_index DROP NOT NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS user_profiles_national_id_index_bin_key
+            ON user_profiles (national_id_index_bin);
+    """),
+]
+
+def run_migrations(repository: Repository) -> list:
+    """
+    Applies pending migrations in a single transaction and returns their names.
+    A ShardedRepository is migrated shard by shard.
+    """
+    if isinstance(repository, ShardedRepository):
+        applied = []
+        for name, shard in repository.shards.items():
+            logger.info(f"Migrating shard {name}")
+            applied.extend(run_migrations(shard))
+        return applied
+
+    with repository.get_connection() as pooled:
+        conn = pooled.raw
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name VARCHAR(128) PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cur.execute("SELECT name FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+
+            pending = [(name, sql) for name, sql in MIGRATIONS if name not in applied]
+            for name, sql in pending:
+                logger.info(f"Applying migration {name}")
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        conn.commit()
+
+    if not pending:
+        logger.info("Schema is up to date")
+    return [name for name, _ in pending]
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migrations(Repository())
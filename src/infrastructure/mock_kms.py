@@ -0,0 +1,122 @@
+"""
+Local stand-in for a KMS, run as its own process so the KEK never lives
+in the application process:
+
+    MOCK_KMS_KEK=<base64 32 bytes> MOCK_KMS_AUTHKEY=dev \
+        PYTHONPATH=src python -m infrastructure.mock_kms --address 127.0.0.1:7700
+
+Speaks a tiny request/reply protocol over multiprocessing.connection
+(authenticated with the shared authkey); KmsKekProvider is the client.
+For testing only.
+"""
+import os
+import base64
+import logging
+import argparse
+import threading
+import multiprocessing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+from .key_providers import LocalKekProvider
+
+logger = logging.getLogger(__name__)
+
+
+class MockKmsServer:
+    def __init__(self, address, authkey: bytes, keks: dict):
+        # key_id -> LocalKekProvider
+        self.keys = {key_id: LocalKekProvider(kek, key_id) for key_id, kek in keks.items()}
+        self.listener = Listener(address, authkey=authkey)
+        self.calls = 0
+        self._closed = False
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def handle(self, request: dict) -> dict:
+        self.calls += 1
+        provider = self.keys.get(request.get("key_id"))
+        if provider is None:
+            return {"ok": False, "error": "unknown key id"}
+        try:
+            if request.get("op") == "wrap":
+                data = provider.wrap(request["data"], request["context"])
+            elif request.get("op") == "unwrap":
+                data = bytes(provider.unwrap(request["data"], request["context"]))
+            else:
+                return {"ok": False, "error": "unknown op"}
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": True, "data": data}
+
+    def _serve_connection(self, conn):
+        with conn:
+            try:
+                conn.send(self.handle(conn.recv()))
+            except (EOFError, OSError):
+                pass
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (OSError, AuthenticationError):
+                # Failed authentication or listener closed
+                if self._closed:
+                    return
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+
+
+def _run(address, authkey, keks, ready):
+    server = MockKmsServer(address, authkey, keks)
+    ready.send(server.address)
+    ready.close()
+    server.serve_forever()
+
+
+def start_mock_kms(keks: dict, authkey: bytes, address=("127.0.0.1", 0)):
+    """Starts the server in a child process; returns (process, bound address)."""
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run, args=(address, authkey, keks, child), daemon=True)
+    process.start()
+    child.close()
+    return process, parent.recv()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock KMS for envelope encryption tests.")
+    parser.add_argument("--address", default="127.0.0.1:7700")
+    parser.add_argument("--key-id", default=os.getenv("KMS_KEY_ID", "storage"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    authkey = os.getenv("MOCK_KMS_AUTHKEY") or os.getenv("KMS_AUTHKEY")
+    if not authkey:
+        raise SystemExit("MOCK_KMS_AUTHKEY is required")
+    kek = os.getenv("MOCK_KMS_KEK")
+    if kek:
+        kek = base64.b64decode(kek)
+    else:
+        kek = os.urandom(32)
+        logger.warning("MOCK_KMS_KEK not set; using a random KEK (wrapped DEKs will not survive a restart)")
+
+    host, _, port = args.address.rpartition(":")
+    server = MockKmsServer((host, int(port)), authkey.encode(), {args.key_id: kek})
+    logger.info(f"Mock KMS listening on {args.address} (key_id={args.key_id})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
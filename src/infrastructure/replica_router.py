@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+import psycopg2
+from infrastructure.db_pool import ConnectionPool, PoolExhaustedError
+from infrastructure.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("round_robin", "least_connections")
+
+# Errors that say "this node is unusable", not "this query is wrong".
+# PoolExhaustedError only means the node is busy: skip it for this read
+# without marking it down.
+NODE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class ReplicaNode:
+    def __init__(self, name: str, pool: ConnectionPool):
+        self.name = name
+        self.pool = pool
+        self.in_flight = 0
+        self.down_until = 0.0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return self.down_until <= now
+
+
+class ReplicaRouter:
+    """
+    Routes lookups to read replicas, one ConnectionPool per node.
+
+    - round_robin rotates through healthy replicas; least_connections
+      picks the one with the fewest reads in flight.
+    - A node that fails to connect or drops a connection is taken out
+      for retry_interval seconds, then tried again by the next read
+      (the pools also ping idle connections before reuse). The read
+      moves on to the next replica and finally to the primary. A node
+      whose pool is exhausted is only skipped for that read.
+    - With read_your_writes > 0, an index written by this process is
+      read from the primary for that many seconds, covering replica lag.
+
+        DATABASE_REPLICA_URLS=postgresql://replica1/uppass,postgresql://replica2/uppass
+        DB_READ_STRATEGY=least_connections
+        DB_READ_YOUR_WRITES_WINDOW=2
+    """
+    def __init__(self, pools, strategy: str = "round_robin", retry_interval: float = 10.0,
+                 read_your_writes: float = 0.0, max_tracked_writes: int = 100000):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown read strategy: {strategy}")
+        self.nodes = [ReplicaNode(f"replica{i + 1}", pool) for i, pool in enumerate(pools)]
+        self.strategy = strategy
+        self.retry_interval = retry_interval
+        self.read_your_writes = read_your_writes
+        self.max_tracked_writes = max_tracked_writes
+        self._recent_writes = OrderedDict()  # index -> primary-only until
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """None unless DATABASE_REPLICA_URLS lists at least one replica."""
+        dsns = [dsn.strip() for dsn in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if dsn.strip()]
+        if not dsns:
+            return None
+        router = cls(
+            [ConnectionPool.from_env(dsn) for dsn in dsns],
+            strategy=os.getenv("DB_READ_STRATEGY", "round_robin"),
+            retry_interval=float(os.getenv("DB_REPLICA_RETRY_INTERVAL", "10")),
+            read_your_writes=float(os.getenv("DB_READ_YOUR_WRITES_WINDOW", "0")),
+        )
+        logger.info(f"Routing lookups to {len(dsns)} replicas ({router.strategy}, "
+                    f"read_your_writes={router.read_your_writes}s)")
+        return router
+
+    # --- Read-your-writes -------------------------------------------------
+
+    def note_write(self, key):
+        if self.read_your_writes <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes.pop(key, None)
+            self._recent_writes[key] = now + self.read_your_writes
+            # The window is fixed, so insertion order is expiry order
+            while self._recent_writes:
+                oldest, until = next(iter(self._recent_writes.items()))
+                if until > now and len(self._recent_writes) <= self.max_tracked_writes:
+                    break
+                del self._recent_writes[oldest]
+
+    def pinned_to_primary(self, key) -> bool:
+        until = self._recent_writes.get(key)
+        return until is not None and until > time.monotonic()
+
+    # --- Routing ------------------------------------------------------------
+
+    def _candidates(self) -> list:
+        now = time.monotonic()
+        healthy = [node for node in self.nodes if node.available(now)]
+        if len(healthy) < 2:
+            return healthy
+        start = next(self._rotation) % len(healthy)
+        ordered = healthy[start:] + healthy[:start]
+        if self.strategy == "least_connections":
+            # Stable sort keeps the rotation as the tie-breaker
+            ordered.sort(key=lambda node: node.in_flight)
+        return ordered
+
+    def _mark_down(self, node: ReplicaNode, error: Exception):
+        with self._lock:
+            node.failures += 1
+            node.down_until = time.monotonic() + self.retry_interval
+        logger.warning(f"Replica {node.name} unavailable for {self.retry_interval}s: {type(error).__name__}")
+
+    def read(self, fn, primary: ConnectionPool, key=None):
+        """
+        Runs fn(pooled_connection) on a replica, falling back to the primary.
+        Returns (node name, result).
+        """
+        if key is None or not self.pinned_to_primary(key):
+            for node in self._candidates():
+                with self._lock:
+                    node.in_flight += 1
+                try:
+                    with node.pool.connection() as pooled:
+                        result = fn(pooled)
+                except PoolExhaustedError:
+                    METRICS.count("db_replica_busy_total", node=node.name)
+                    continue
+                except NODE_ERRORS as e:
+                    self._mark_down(node, e)
+                    continue
+                finally:
+                    with self._lock:
+                        node.in_flight -= 1
+                if node.failures:
+                    node.failures = 0
+                    logger.info(f"Replica {node.name} is serving reads again")
+                METRICS.count("db_reads_total", node="replica")
+                return node.name, result
+
+        METRICS.count("db_reads_total", node="primary")
+        with primary.connection() as pooled:
+            return "primary", fn(pooled)
+
+    def gauges(self):
+        now = time.monotonic()
+        for node in self.nodes:
+            labels = {"node": node.name}
+            yield "db_replica_up", labels, int(node.available(now))
+            yield "db_replica_in_flight", labels, node.in_flight
+            yield "db_replica_pool_size", labels, node.pool.size
+
+    def close(self):
+        for node in self.nodes:
+            node.pool.close()
@@ -1,55 +1,461 @@
 import psycopg2
-from infrastructure.crypto_service import CryptoService
+from psycopg2.extras import execute_values
+import io
 import os
 import logging
+import threading
+from infrastructure.db_pool import ConnectionPool
+from infrastructure.replica_router import ReplicaRouter
+from infrastructure.storage_layout import StorageLayout, index_to_text
+from infrastructure.metrics import METRICS
 
 logger = logging.getLogger(__name__)
 
+def prepared_statements(layout: StorageLayout) -> dict:
+    """Server-side prepared statements, created lazily once per pooled connection."""
+    placeholders = ", ".join(f"${i + 1}" for i in range(len(layout.insert_types)))
+    return {
+        "save_user_profile": (
+            f"PREPARE save_user_profile ({', '.join(layout.insert_types)}) AS "
+            f"INSERT INTO user_profiles ({layout.insert_columns}) VALUES ({placeholders})"
+        ),
+        "find_by_hash": (
+            f"PREPARE find_by_hash ({', '.join(layout.lookup_types)}) AS {layout.lookup_sql}"
+        ),
+        "find_by_hashes": (
+            f"PREPARE find_by_hashes ({', '.join(t + '[]' for t in layout.lookup_types)}) AS {layout.batch_lookup_sql}"
+        ),
+    }
+
+# Rows per multi-row INSERT statement in save_user_profiles
+BULK_INSERT_PAGE_SIZE = 1000
+
+def _copy_text(value) -> str:
+    # COPY text format; base64 never needs escaping, bytea goes in as \\x<hex>
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    return value
+
 class Repository:
-    def __init__(self):
-        self.conn_str = os.getenv("DATABASE_URL")
-    
+    def __init__(self, conn_str: str = None, pool: ConnectionPool = None, search_cache=None, index_filter=None,
+                 storage_layout: StorageLayout = None, replicas: ReplicaRouter = None):
+        self.conn_str = conn_str or os.getenv("DATABASE_URL")
+        self._pool = pool
+        # Optional read replicas for lookups; writes always go to the primary
+        self.replicas = replicas if replicas is not None else ReplicaRouter.from_env()
+        # Which columns (text, BYTEA or both) hold blobs and indexes
+        self.storage_layout = storage_layout or StorageLayout.from_env()
+        self._statements = prepared_statements(self.storage_layout)
+        # Optional cache of find_by_hash rows (ciphertext only), keyed by index
+        self.search_cache = search_cache
+        # Optional IndexMembershipFilter; short-circuits definite misses
+        self.index_filter = index_filter
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> ConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool.from_env(self.conn_str)
+        return self._pool
+
     def get_connection(self):
-        return psycopg2.connect(self.conn_str)
-
-    def save_user_profile(self, national_id_blob: str, national_id_index: str):
-        logger.info(f"Saving user profile. Index hash prefix: {national_id_index[:10]}...")
-        conn = self.get_connection()
-        try:
-            with conn.cursor() as cur:
-                # Create table if not exists (demo only, use migration tool in prod)
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS user_profiles (
-                        id SERIAL PRIMARY KEY,
-                        national_id_blob VARCHAR(255) NOT NULL,
-                        national_id_index VARCHAR(64) NOT NULL UNIQUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                try:
+        """Context manager yielding a PooledConnection; returns it to the pool on exit."""
+        return self.pool.connection()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+        if self.replicas is not None:
+            self.replicas.close()
+
+    def _prepare(self, pooled, cur, name: str):
+        if name not in pooled.prepared:
+            cur.execute(self._statements[name])
+            pooled.prepared.add(name)
+
+    def save_user_profile(self, national_id_blob, national_id_index):
+        logger.info("Saving user profile. Index hash prefix: %.10s...", index_to_text(national_id_index))
+        # Schema is created by infrastructure.migrations at startup, not per write
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                self._prepare(pooled, cur, "save_user_profile")
+                params = self.storage_layout.insert_params(national_id_blob, national_id_index)
+                with METRICS.stage("db_insert"):
+                    try:
+                        cur.execute(
+                            f"EXECUTE save_user_profile ({', '.join(['%s'] * len(params))})",
+                            params
+                        )
+                    except psycopg2.errors.UniqueViolation:
+                        conn.rollback()
+                        self._on_inserted(national_id_index)
+                        raise ValueError("National ID already exists")
+                    conn.commit()
+        self._on_inserted(national_id_index)
+        logger.info("User profile saved successfully")
+
+    def save_user_profiles(self, rows) -> set:
+        """
+        Inserts (national_id_blob, national_id_index) rows with multi-row
+        INSERTs in a single transaction. Rows whose index already exists are
+        skipped. Returns the set of indexes that were actually inserted.
+        """
+        logger.info("Saving %d user profiles", len(rows))
+        layout = self.storage_layout
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                inserted = execute_values(
+                    cur,
+                    f"INSERT INTO user_profiles ({layout.insert_columns}) VALUES %s "
+                    f"{layout.on_conflict} RETURNING {layout.returning_column}",
+                    [layout.insert_params(blob, index) for blob, index in rows],
+                    page_size=BULK_INSERT_PAGE_SIZE,
+                    fetch=True
+                )
+            conn.commit()
+        inserted = {layout.inserted_key(row[0]) for row in inserted}
+        for national_id_index in inserted:
+            self._on_inserted(national_id_index)
+        logger.info("Saved %d user profiles, %d duplicates", len(inserted), len(rows) - len(inserted))
+        return inserted
+
+    def copy_user_profiles(self, rows) -> set:
+        """
+        Bulk-load path for large imports: COPYs (national_id_blob,
+        national_id_index) rows into a per-session staging table, then
+        merges them with INSERT ... ON CONFLICT DO NOTHING in the same
+        transaction. rows must not repeat an index. Returns the set of
+        indexes that were actually inserted.
+        """
+        if not rows:
+            return set()
+        layout = self.storage_layout
+        columns = layout.insert_columns
+        column_defs = ", ".join(
+            f"{name} {sql_type}" for name, sql_type in zip(columns.split(", "), layout.insert_types)
+        )
+        buffer = io.StringIO()
+        for blob, index in rows:
+            buffer.write("\t".join(_copy_text(value) for value in layout.insert_params(blob, index)))
+            buffer.write("\n")
+        buffer.seek(0)
+
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS user_profiles_staging ({column_defs}) ON COMMIT DELETE ROWS")
+                cur.copy_expert(f"COPY user_profiles_staging ({columns}) FROM STDIN", buffer)
+                cur.execute(
+                    f"INSERT INTO user_profiles ({columns}) SELECT {columns} FROM user_profiles_staging "
+                    f"{layout.on_conflict} RETURNING {layout.returning_column}"
+                )
+                inserted = {layout.inserted_key(row[0]) for row in cur.fetchall()}
+            conn.commit()
+        for national_id_index in inserted:
+            self._on_inserted(national_id_index)
+        return inserted
+
+    def existing_indexes(self, indexes) -> set:
+        """The subset of indexes that already have a row."""
+        if not indexes:
+            return set()
+        layout = self.storage_layout
+        column = layout.index_column
+        values = [bytes(i) for i in indexes] if layout.binary else list(indexes)
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {column} FROM user_profiles WHERE {column} = ANY(%s)", (values,))
+                found = {layout.inserted_key(row[0]) for row in cur.fetchall()}
+            conn.rollback()
+        return found
+
+    def insert_moved_rows(self, rows) -> int:
+        """
+        Inserts (national_id_blob, national_id_index, created_at) rows copied
+        from another shard, keeping created_at. Indexes already present are
+        skipped, so re-running a move is harmless. Returns rows inserted.
+        """
+        if not rows:
+            return 0
+        layout = self.storage_layout
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                inserted = execute_values(
+                    cur,
+                    f"INSERT INTO user_profiles ({layout.insert_columns}, created_at) VALUES %s "
+                    f"{layout.on_conflict} RETURNING {layout.returning_column}",
+                    [layout.insert_params(blob, index) + (created_at,) for blob, index, created_at in rows],
+                    page_size=BULK_INSERT_PAGE_SIZE,
+                    fetch=True
+                )
+            conn.commit()
+        for row in inserted:
+            self._on_inserted(layout.inserted_key(row[0]))
+        return len(inserted)
+
+    def delete_rows(self, ids) -> int:
+        if not ids:
+            return 0
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM user_profiles WHERE id = ANY(%s)", (list(ids),))
+                deleted = cur.rowcount
+            conn.commit()
+        return deleted
+
+    def _on_inserted(self, national_id_index):
+        if self.replicas is not None:
+            self.replicas.note_write(national_id_index)
+        if self.index_filter is not None:
+            self.index_filter.add(national_id_index)
+        if self.search_cache is not None:
+            self.search_cache.invalidate(national_id_index)
+
+    def find_by_hash(self, national_id_index):
+        logger.info("Finding user profile by hash. Prefix: %.10s...", index_to_text(national_id_index))
+        if self.index_filter is not None and not self.index_filter.might_contain(national_id_index):
+            logger.info("Found 0 profiles (index filter)")
+            return []
+
+        token = None
+        if self.search_cache is not None:
+            cached = self.search_cache.get(national_id_index)
+            if cached is not None:
+                logger.info("Found %d profiles (cached)", len(cached))
+                return cached
+            token = self.search_cache.read_token(national_id_index)
+
+        def lookup(pooled):
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                self._prepare(pooled, cur, "find_by_hash")
+                params = self.storage_layout.lookup_params(national_id_index)
+                with METRICS.stage("db_lookup"):
+                    cur.execute(f"EXECUTE find_by_hash ({', '.join(['%s'] * len(params))})", params)
+                    rows = self.storage_layout.normalize_rows(cur.fetchall())
+            # End the read transaction so the connection goes back idle
+            conn.rollback()
+            return rows
+
+        if self.replicas is None:
+            node = "primary"
+            with self.get_connection() as pooled:
+                results = lookup(pooled)
+        else:
+            node, results = self.replicas.read(lookup, self.pool, national_id_index)
+        # A lagging replica can miss a fresh insert; never cache that miss
+        if self.search_cache is not None and (results or node == "primary"):
+            self.search_cache.set(national_id_index, results, token)
+        logger.info("Found %d profiles", len(results))
+        return results
+
+    def find_by_hashes(self, indexes, chunk_size: int = 1000) -> dict:
+        """
+        Batch find_by_hash: {index: [(id, blob), ...]} for every index given,
+        [] for misses. Runs one ANY(array) query per chunk_size indexes.
+        The search cache is bypassed; bulk reconciliation keys are mostly
+        one-off and would only push out the hot single-search entries.
+        """
+        results = {index: [] for index in indexes}
+        pending = list(results)
+        if self.index_filter is not None:
+            pending = [index for index in pending if self.index_filter.might_contain(index)]
+        logger.info("Finding user profiles for %d hashes (%d after index filter)", len(results), len(pending))
+        layout = self.storage_layout
+
+        def lookup(chunk):
+            def run(pooled):
+                conn = pooled.raw
+                with conn.cursor() as cur:
+                    self._prepare(pooled, cur, "find_by_hashes")
+                    params = layout.batch_lookup_params(chunk)
+                    with METRICS.stage("db_lookup"):
+                        cur.execute(f"EXECUTE find_by_hashes ({', '.join(['%s'] * len(params))})", params)
+                        found = layout.normalize_batch_rows(cur.fetchall())
+                conn.rollback()
+                return found
+            return run
+
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            if self.replicas is None:
+                with self.get_connection() as pooled:
+                    found = lookup(chunk)(pooled)
+            else:
+                # One freshly written index sends the whole chunk to the primary
+                pinned = next((index for index in chunk if self.replicas.pinned_to_primary(index)), None)
+                _, found = self.replicas.read(lookup(chunk), self.pool, pinned)
+            results.update(found)
+        logger.info("Found profiles for %d of %d hashes", sum(1 for rows in results.values() if rows), len(results))
+        return results
+
+    def iter_profile_batches(self, after_id: int = 0, batch_size: int = 500, chunk_size: int = 50000):
+        """
+        Yields lists of (id, national_id_blob) rows in id order, starting after
+        after_id. Each chunk of chunk_size rows is read through a named
+        (server-side) cursor in its own short transaction, then the next chunk
+        resumes from the last id seen (keyset pagination), so no snapshot is
+        held open across the whole table.
+        """
+        layout = self.storage_layout
+        return self._iter_batches(f"id, {layout.blob_column}", after_id, batch_size, chunk_size,
+                                  where=f"{layout.blob_column} IS NOT NULL", normalize=layout.binary)
+
+    def iter_index_batches(self, after_id: int = 0, batch_size: int = 5000, chunk_size: int = 200000):
+        """Like iter_profile_batches, but yields (id, national_id_index) rows."""
+        layout = self.storage_layout
+        return self._iter_batches(f"id, {layout.index_column}", after_id, batch_size, chunk_size,
+                                  where=f"{layout.index_column} IS NOT NULL", normalize=layout.binary)
+
+    def index_watermark(self, after_id: int = 0) -> tuple:
+        """
+        (max id, row count) of indexed rows with id > after_id. An index-only
+        query that lets the membership filter skip rescans when nothing changed.
+        """
+        column = self.storage_layout.index_column
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COALESCE(MAX(id), 0), COUNT(*) FROM user_profiles "
+                            f"WHERE id > %s AND {column} IS NOT NULL", (after_id,))
+                watermark = tuple(cur.fetchone())
+            conn.rollback()
+        return watermark
+
+    def iter_unconverted_batches(self, after_id: int = 0, batch_size: int = 1000, chunk_size: int = 100000):
+        """Yields (id, national_id_blob, national_id_index) rows that have no BYTEA copy yet."""
+        return self._iter_batches("id, national_id_blob, national_id_index", after_id, batch_size, chunk_size,
+                                  where="national_id_blob_bin IS NULL")
+
+    def iter_export_batches(self, after_id: int = 0, created_from=None, created_to=None,
+                            batch_size: int = 1000, chunk_size: int = 100000):
+        """
+        Yields (id, national_id_blob, created_at) rows in id order, optionally
+        limited to created_from <= created_at < created_to.
+        """
+        layout = self.storage_layout
+        where, params = [f"{layout.blob_column} IS NOT NULL"], []
+        if created_from is not None:
+            where.append("created_at >= %s")
+            params.append(created_from)
+        if created_to is not None:
+            where.append("created_at < %s")
+            params.append(created_to)
+        return self._iter_batches(f"id, {layout.blob_column}, created_at", after_id, batch_size, chunk_size,
+                                  where=" AND ".join(where), where_params=tuple(params), normalize=layout.binary)
+
+    def iter_index_range_batches(self, lower: bytes, upper: bytes = None, after_id: int = 0,
+                                 batch_size: int = 1000, chunk_size: int = 50000):
+        """
+        Yields lists of (id, national_id_blob, national_id_index, created_at)
+        for rows whose index bytes fall in [lower, upper), in id order.
+        Used to move shard slots.
+        """
+        layout = self.storage_layout
+        params = (lower, upper) if upper is not None else (lower,)
+        batches = self._iter_batches(
+            f"id, {layout.blob_column}, {layout.index_column}, created_at", after_id, batch_size, chunk_size,
+            where=layout.index_range_condition(upper is not None), where_params=params
+        )
+        for rows in batches:
+            if layout.binary:
+                rows = [(row[0], bytes(row[1]), bytes(row[2]), row[3]) for row in rows]
+            yield rows
+
+    def _iter_batches(self, columns: str, after_id: int, batch_size: int, chunk_size: int,
+                      where: str = None, where_params: tuple = (), normalize: bool = False):
+        # psycopg2 returns BYTEA as memoryview; hand out bytes
+        if normalize:
+            for rows in self._iter_batches(columns, after_id, batch_size, chunk_size, where, where_params):
+                yield [(row[0], bytes(row[1])) + tuple(row[2:]) for row in rows]
+            return
+        condition = f"id > %s AND {where}" if where else "id > %s"
+        last_id = after_id
+        while True:
+            rows_in_chunk = 0
+            with self.get_connection() as pooled:
+                conn = pooled.raw
+                with conn.cursor(name="iter_batches") as cur:
+                    cur.itersize = batch_size
                     cur.execute(
-                        "INSERT INTO user_profiles (national_id_blob, national_id_index) VALUES (%s, %s)",
-                        (national_id_blob, national_id_index)
+                        f"SELECT {columns} FROM user_profiles WHERE {condition} ORDER BY id LIMIT %s",
+                        (last_id, *where_params, chunk_size)
                     )
-                except psycopg2.errors.UniqueViolation:
-                    conn.rollback()
-                    raise ValueError("National ID already exists")
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        rows_in_chunk += len(rows)
+                        last_id = rows[-1][0]
+                        yield rows
+                conn.rollback()
+            if rows_in_chunk < chunk_size:
+                return
+
+    def update_blobs(self, updates) -> int:
+        """
+        Rewrites national_id_blob for (id, old_blob, new_blob) rows in one
+        statement. A row is only updated if its blob still equals old_blob,
+        so concurrent writers are never overwritten. Returns rows updated.
+        """
+        if not updates:
+            return 0
+        layout = self.storage_layout
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    layout.update_blobs_sql,
+                    [layout.update_params(*update) for update in updates],
+                    page_size=len(updates)
+                )
+                updated = cur.rowcount
+            conn.commit()
+        return updated
+
+    def backfill_binary(self, rows) -> int:
+        """
+        Fills the BYTEA columns for (id, blob_bin, index_bin) rows that do
+        not have them yet, leaving rows a live writer converted alone.
+        Returns rows updated.
+        """
+        if not rows:
+            return 0
+        with self.get_connection() as pooled:
+            conn = pooled.raw
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    "UPDATE user_profiles AS u "
+                    "SET national_id_blob_bin = v.blob_bin, national_id_index_bin = v.index_bin "
+                    "FROM (VALUES %s) AS v(id, blob_bin, index_bin) "
+                    "WHERE u.id = v.id AND u.national_id_blob_bin IS NULL",
+                    rows,
+                    page_size=len(rows)
+                )
+                updated = cur.rowcount
             conn.commit()
-            logger.info("User profile saved successfully")
-        finally:
-            conn.close()
+        return updated
 
-    def find_by_hash(self, national_id_index: str):
-        logger.info(f"Finding user profile by hash. Prefix: {national_id_index[:10]}...")
-        conn = self.get_connection()
-        try:
+    def clear_text_columns(self, after_id: int, up_to_id: int) -> int:
+        """NULLs the text copies of already converted rows in (after_id, up_to_id]."""
+        with self.get_connection() as pooled:
+            conn = pooled.raw
             with conn.cursor() as cur:
                 cur.execute(
-                    "SELECT id, national_id_blob FROM user_profiles WHERE national_id_index = %s",
-                    (national_id_index,)
+                    "UPDATE user_profiles SET national_id_blob = NULL, national_id_index = NULL "
+                    "WHERE id > %s AND id <= %s AND national_id_blob_bin IS NOT NULL "
+                    "AND national_id_blob IS NOT NULL",
+                    (after_id, up_to_id)
                 )
-                results = cur.fetchall()
-                logger.info(f"Found {len(results)} profiles")
-                return results
-        finally:
-            conn.close()
+                updated = cur.rowcount
+            conn.commit()
+        return updated
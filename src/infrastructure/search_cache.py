@@ -0,0 +1,261 @@
+import os
+import json
+import base64
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry / per-row bookkeeping overhead used for the memory cap
+ENTRY_OVERHEAD_BYTES = 200
+ROW_OVERHEAD_BYTES = 64
+
+
+class SearchCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def to_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class InMemorySearchCache:
+    """
+    Per-process LRU of find_by_hash results keyed by national_id_index.
+
+    Values are the (id, national_id_blob) rows exactly as stored, so only
+    ciphertext is held in memory; plaintext is produced per request.
+    Entries expire after ttl seconds and the least recently used are
+    evicted once max_entries or max_bytes is exceeded.
+
+    Invalidation only reaches this process, so misses are not cached by
+    default: with several workers, an ID inserted through another worker
+    would stay "not found" here until the entry expired. Set
+    cache_misses for single-process deployments.
+    """
+    def __init__(self, max_entries: int = 100000, ttl: float = 60.0, max_bytes: int = 64 * 1024 * 1024,
+                 cache_misses: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_misses = cache_misses
+        self.stats = SearchCacheStats()
+        self._entries = OrderedDict()  # index -> (expires_at, rows, size)
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def read_token(self, national_id_index=None) -> int:
+        """
+        Taken before a DB read and passed to set(); if any invalidation
+        happened in between, the (possibly stale) rows are not cached.
+        """
+        return self._generation
+
+    @staticmethod
+    def _size_of(national_id_index: str, rows) -> int:
+        return (ENTRY_OVERHEAD_BYTES + len(national_id_index)
+                + sum(ROW_OVERHEAD_BYTES + len(blob) for _, blob in rows))
+
+    def get(self, national_id_index: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(national_id_index)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._remove(national_id_index)
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(national_id_index)
+            self.stats.hits += 1
+            return list(entry[1])
+
+    def set(self, national_id_index: str, rows, token: int = None):
+        if not rows and not self.cache_misses:
+            return
+        rows = [tuple(row) for row in rows]
+        size = self._size_of(national_id_index, rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            if national_id_index in self._entries:
+                self._remove(national_id_index)
+            self._entries[national_id_index] = (time.monotonic() + self.ttl, rows, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats.evictions += 1
+
+    def invalidate(self, national_id_index: str):
+        with self._lock:
+            self._generation += 1
+            if national_id_index in self._entries:
+                self._remove(national_id_index)
+                self.stats.invalidations += 1
+
+    def _remove(self, national_id_index: str):
+        _, _, size = self._entries.pop(national_id_index)
+        self._bytes -= size
+
+    def describe(self) -> dict:
+        return dict(self.stats.to_dict(), backend="memory", entries=len(self._entries), bytes=self._bytes)
+
+
+class LocalSharedStore:
+    """
+    In-process stand-in for a shared key/value server (Redis-compatible
+    get / mget / set(ex=, nx=) / incr / expire / delete). Used in tests
+    and local dev.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._live(key)
+            return item[0] if item is not None else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [item[0] if item is not None else None for item in map(self._live, keys)]
+
+    def set(self, key: str, value, ex: float = None, nx: bool = False):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def incr(self, key: str) -> int:
+        # Keeps the key's expiry, like Redis INCR
+        with self._lock:
+            item = self._live(key)
+            value = int(item[0]) + 1 if item is not None else 1
+            self._data[key] = (str(value), item[1] if item is not None else None)
+            return value
+
+    def expire(self, key: str, seconds: float) -> bool:
+        with self._lock:
+            item = self._live(key)
+            if item is None:
+                return False
+            self._data[key] = (item[0], time.monotonic() + seconds)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            return 1 if self._data.pop(key, None) is not None else 0
+
+
+class SharedSearchCache:
+    """
+    Search cache backed by a shared store, so every worker sees the same
+    entries and an insert in one worker invalidates them for all.
+    TTL and eviction are left to the store. Binary-layout keys and blobs
+    are stored base64-encoded, so both layouts share one key space.
+
+    Each index has a generation counter that invalidate() bumps. Entries
+    are written with the generation read before the DB query, and get()
+    ignores an entry whose generation is no longer current, so a read
+    that raced an insert cannot bring back the stale rows.
+    """
+    def __init__(self, client, ttl: float = 60.0, key_prefix: str = "search:"):
+        self.client = client
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.stats = SearchCacheStats()
+
+    def _key(self, national_id_index) -> str:
+        if not isinstance(national_id_index, str):
+            national_id_index = base64.b64encode(national_id_index).decode('ascii')
+        return self.key_prefix + national_id_index
+
+    def _generation_key(self, national_id_index) -> str:
+        return "gen:" + self._key(national_id_index)
+
+    def get(self, national_id_index):
+        raw, generation = self.client.mget([self._key(national_id_index), self._generation_key(national_id_index)])
+        entry = json.loads(raw) if raw is not None else None
+        if entry is None or entry["gen"] != int(generation or 0):
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        # Rows are [id, blob] or [id, base64 blob, true] for binary blobs
+        return [(row[0], base64.b64decode(row[1]) if len(row) > 2 else row[1]) for row in entry["rows"]]
+
+    def read_token(self, national_id_index) -> int:
+        return int(self.client.get(self._generation_key(national_id_index)) or 0)
+
+    def set(self, national_id_index, rows, token=None):
+        if token is None:
+            token = self.read_token(national_id_index)
+        encoded = [
+            [row_id, blob] if isinstance(blob, str)
+            else [row_id, base64.b64encode(blob).decode('ascii'), True]
+            for row_id, blob in rows
+        ]
+        self.client.set(self._key(national_id_index), json.dumps({"gen": token, "rows": encoded}),
+                        ex=max(1, int(self.ttl)))
+
+    def invalidate(self, national_id_index):
+        generation_key = self._generation_key(national_id_index)
+        self.client.incr(generation_key)
+        # Outlives any entry written under the old generation
+        self.client.expire(generation_key, max(1, int(self.ttl)) * 2)
+        if self.client.delete(self._key(national_id_index)):
+            self.stats.invalidations += 1
+
+    def describe(self) -> dict:
+        return dict(self.stats.to_dict(), backend="shared")
+
+
+def search_cache_from_env():
+    """
+    SEARCH_CACHE_BACKEND: memory (default), redis, local-shared or none.
+    """
+    backend = os.getenv("SEARCH_CACHE_BACKEND", "memory")
+    ttl = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return InMemorySearchCache(
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "100000")),
+            ttl=ttl,
+            max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            # Only safe with a single worker process
+            cache_misses=os.getenv("SEARCH_CACHE_MISSES", "0") == "1",
+        )
+    if backend == "local-shared":
+        return SharedSearchCache(LocalSharedStore(), ttl=ttl)
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("SEARCH_CACHE_BACKEND=redis requires the 'redis' package")
+        return SharedSearchCache(redis.Redis.from_url(os.getenv("SEARCH_CACHE_REDIS_URL", "redis://localhost:6379/0")), ttl=ttl)
+    raise ValueError(f"Unknown SEARCH_CACHE_BACKEND: {backend}")
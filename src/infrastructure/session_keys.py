@@ -0,0 +1,73 @@
+import os
+import time
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+logger = logging.getLogger(__name__)
+
+AES_KEY_SIZES = (16, 24, 32)
+
+
+class TransportSessionError(ValueError):
+    """Raised for unknown or expired transport session ids."""
+
+
+class SessionKeyCache:
+    """
+    TTL-bounded, size-capped store of transport session keys.
+
+    Each entry keeps a ready AESGCM object so session submits skip both the
+    RSA unwrap and the AES key schedule. Sessions live in process memory:
+    with several gunicorn workers a client hitting another worker gets
+    TransportSessionError and should simply perform a new handshake.
+    """
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # session_id -> (expires_at, AESGCM)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl=float(os.getenv("TRANSPORT_SESSION_TTL", "300")),
+            max_entries=int(os.getenv("TRANSPORT_SESSION_MAX_ENTRIES", "10000")),
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def create(self, key: bytes) -> str:
+        if len(key) not in AES_KEY_SIZES:
+            raise ValueError("Session key must be a 128, 192 or 256-bit AES key")
+        session_id = secrets.token_urlsafe(24)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[session_id] = (expires_at, AESGCM(key))
+            # Oldest sessions are evicted first once the cap is reached
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> AESGCM:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                raise TransportSessionError("Unknown or expired transport session")
+            expires_at, aesgcm = entry
+            if expires_at <= now:
+                del self._entries[session_id]
+                raise TransportSessionError("Unknown or expired transport session")
+        return aesgcm
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
@@ -0,0 +1,288 @@
+"""
+Sharding of user_profiles across several databases by national_id_index.
+
+The index is an HMAC-SHA256 digest, so its leading bytes are uniformly
+distributed. The first two bytes select one of SHARD_SLOTS slots, and
+each slot is a contiguous range of index values. Slots are assigned to
+shards by a ShardMap, so a lookup or write touches exactly one shard and
+the routing needs nothing but the index bytes. Moving a slot between
+shards is done online by commands.rebalance_shards.
+
+    DATABASE_SHARDS="s0=postgresql://db0/uppass,s1=postgresql://db1/uppass"
+    SHARD_MAP_PATH=/etc/uppass/shard_map.json   # optional; default spreads slots evenly
+    SHARD_SLOTS=1024
+"""
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from infrastructure.repository import Repository
+from infrastructure.storage_layout import StorageLayout
+
+logger = logging.getLogger(__name__)
+
+# Slots are carved out of the first two index bytes
+SLOT_SPACE = 1 << 16
+DEFAULT_SLOTS = 1024
+
+
+def index_prefix(national_id_index) -> int:
+    """First two bytes of the index as an int, without decoding the whole value."""
+    if isinstance(national_id_index, str):
+        head = base64.b64decode(national_id_index[:4])
+    else:
+        head = bytes(national_id_index[:2])
+    return int.from_bytes(head[:2], "big")
+
+
+class ShardMap:
+    """
+    Immutable slot -> shard assignment. A slot that is being moved also
+    records the shard it is moving from; see ShardedRepository.
+    """
+    def __init__(self, slots: int, owners: list, migrating: dict = None, version: int = 0):
+        if slots <= 0 or SLOT_SPACE % slots:
+            raise ValueError(f"Shard slots must divide {SLOT_SPACE}")
+        if len(owners) != slots:
+            raise ValueError("Every slot needs an owning shard")
+        self.slots = slots
+        self.owners = list(owners)
+        self.migrating = dict(migrating or {})  # slot -> source shard
+        self.version = version
+        self._width = SLOT_SPACE // slots
+
+    @classmethod
+    def even(cls, shard_names: list, slots: int = DEFAULT_SLOTS):
+        """Contiguous, equal-sized slot ranges per shard, in the given order."""
+        if not shard_names:
+            raise ValueError("At least one shard is required")
+        return cls(slots, [shard_names[slot * len(shard_names) // slots] for slot in range(slots)])
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        slots = data["slots"]
+        owners, migrating = [None] * slots, {}
+        for entry in data["assignments"]:
+            for slot in range(entry["first"], entry["last"] + 1):
+                owners[slot] = entry["shard"]
+                if entry.get("migrating_from"):
+                    migrating[slot] = entry["migrating_from"]
+        if None in owners:
+            raise ValueError("Shard map leaves slots unassigned")
+        return cls(slots, owners, migrating, data.get("version", 0))
+
+    def to_dict(self) -> dict:
+        assignments = []
+        for slot in range(self.slots):
+            key = (self.owners[slot], self.migrating.get(slot))
+            if assignments and (assignments[-1]["shard"], assignments[-1].get("migrating_from")) == key:
+                assignments[-1]["last"] = slot
+                continue
+            entry = {"first": slot, "last": slot, "shard": key[0]}
+            if key[1]:
+                entry["migrating_from"] = key[1]
+            assignments.append(entry)
+        return {"version": self.version, "slots": self.slots, "assignments": assignments}
+
+    @property
+    def shard_names(self) -> list:
+        return sorted(set(self.owners) | set(self.migrating.values()))
+
+    def slot_of(self, national_id_index) -> int:
+        return index_prefix(national_id_index) // self._width
+
+    def route(self, national_id_index):
+        """(owning shard, shard it is migrating from or None)."""
+        slot = index_prefix(national_id_index) // self._width
+        return self.owners[slot], self.migrating.get(slot)
+
+    def slot_bounds(self, first: int, last: int):
+        """Index range [lower, upper) covered by slots first..last; upper is None at the end."""
+        upper = (last + 1) * self._width
+        return (first * self._width).to_bytes(2, "big"), upper.to_bytes(2, "big") if upper < SLOT_SPACE else None
+
+    def counts(self) -> dict:
+        counts = {}
+        for owner in self.owners:
+            counts[owner] = counts.get(owner, 0) + 1
+        return counts
+
+    def start_move(self, first: int, last: int, target: str):
+        """New map with slots first..last owned by target and migrating from their old owners."""
+        owners, migrating = list(self.owners), dict(self.migrating)
+        for slot in range(first, last + 1):
+            if owners[slot] != target:
+                migrating[slot] = migrating.get(slot, owners[slot])
+                owners[slot] = target
+        return ShardMap(self.slots, owners, migrating, self.version + 1)
+
+    def finish_move(self, first: int, last: int):
+        migrating = {slot: source for slot, source in self.migrating.items() if not first <= slot <= last}
+        return ShardMap(self.slots, self.owners, migrating, self.version + 1)
+
+
+class ShardMapFile:
+    """ShardMap backed by a JSON file, re-read when it changes (checked every reload_interval)."""
+    def __init__(self, path: str, reload_interval: float = 5.0, default: ShardMap = None):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._default = default
+        self._map = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> ShardMap:
+        if self._map is not None and time.monotonic() - self._checked_at < self.reload_interval:
+            return self._map
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                if self._default is None:
+                    raise ValueError(f"Shard map not found: {self.path}")
+                self._map = self._map or self._default
+                return self._map
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    shard_map = ShardMap.from_dict(json.load(f))
+                if self._map is not None:
+                    logger.info(f"Loaded shard map version {shard_map.version}")
+                self._map, self._mtime = shard_map, mtime
+            return self._map
+
+    def save(self, shard_map: ShardMap):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(shard_map.to_dict(), f, indent=2)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._map, self._mtime, self._checked_at = shard_map, None, 0.0
+
+
+class StaticShardMap:
+    def __init__(self, shard_map: ShardMap):
+        self._map = shard_map
+
+    def current(self) -> ShardMap:
+        return self._map
+
+
+class ShardedRepository:
+    """
+    Repository facade over one Repository (and pool) per shard, for the
+    request paths: saves and lookups go to the shard that owns the index.
+
+    While a slot is being moved, new rows go to the new owner, lookups
+    that miss there fall back to the old owner, and writes check the old
+    owner first so a national ID cannot end up on both shards.
+
+    Scans (export, re-encryption, layout conversion) run per shard: point
+    those commands at each shard's DSN in turn.
+    """
+    def __init__(self, shards: dict, shard_map, search_cache=None):
+        self.shards = shards
+        self.shard_map = shard_map
+        # Shared by all shards; index values are globally unique
+        self.search_cache = search_cache
+        self.index_filter = None
+        self.storage_layout = next(iter(shards.values())).storage_layout
+        missing = set(shard_map.current().shard_names) - set(shards)
+        if missing:
+            raise ValueError(f"Shard map references unknown shards: {sorted(missing)}")
+
+    @classmethod
+    def from_env(cls, search_cache=None):
+        if os.getenv("DATABASE_REPLICA_URLS"):
+            raise ValueError("DATABASE_REPLICA_URLS is not supported together with DATABASE_SHARDS")
+        layout = StorageLayout.from_env()
+        shards = {}
+        for entry in os.getenv("DATABASE_SHARDS", "").split(","):
+            name, sep, dsn = entry.strip().partition("=")
+            if not sep or not name or not dsn:
+                raise ValueError("DATABASE_SHARDS entries must look like <name>=<dsn>")
+            shards[name] = Repository(dsn, storage_layout=layout)
+        default = ShardMap.even(list(shards), int(os.getenv("SHARD_SLOTS", str(DEFAULT_SLOTS))))
+        path = os.getenv("SHARD_MAP_PATH")
+        if path:
+            shard_map = ShardMapFile(path, float(os.getenv("SHARD_MAP_RELOAD_INTERVAL", "5")), default)
+        else:
+            shard_map = StaticShardMap(default)
+        logger.info(f"Sharding user_profiles across {list(shards)}")
+        return cls(shards, shard_map, search_cache)
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+    def _group(self, rows, key=lambda row: row[1]) -> dict:
+        """{(owner, source): [rows]} using the current map."""
+        shard_map = self.shard_map.current()
+        groups = {}
+        for row in rows:
+            groups.setdefault(shard_map.route(key(row)), []).append(row)
+        return groups
+
+    def _without_existing(self, source: str, rows) -> list:
+        existing = self.shards[source].existing_indexes([index for _, index in rows])
+        return [row for row in rows if row[1] not in existing]
+
+    def save_user_profile(self, national_id_blob, national_id_index):
+        owner, source = self.shard_map.current().route(national_id_index)
+        if source is not None and self.shards[source].existing_indexes([national_id_index]):
+            raise ValueError("National ID already exists")
+        try:
+            self.shards[owner].save_user_profile(national_id_blob, national_id_index)
+        finally:
+            self.invalidate(national_id_index)
+
+    def save_user_profiles(self, rows) -> set:
+        return self._save_grouped(rows, "save_user_profiles")
+
+    def copy_user_profiles(self, rows) -> set:
+        return self._save_grouped(rows, "copy_user_profiles")
+
+    def _save_grouped(self, rows, method: str) -> set:
+        inserted = set()
+        for (owner, source), group in self._group(rows).items():
+            if source is not None:
+                group = self._without_existing(source, group)
+            if group:
+                inserted |= getattr(self.shards[owner], method)(group)
+        for national_id_index in inserted:
+            self.invalidate(national_id_index)
+        return inserted
+
+    def invalidate(self, national_id_index):
+        if self.search_cache is not None:
+            self.search_cache.invalidate(national_id_index)
+
+    def find_by_hash(self, national_id_index):
+        token = None
+        if self.search_cache is not None:
+            cached = self.search_cache.get(national_id_index)
+            if cached is not None:
+                return cached
+            token = self.search_cache.read_token(national_id_index)
+
+        owner, source = self.shard_map.current().route(national_id_index)
+        results = self.shards[owner].find_by_hash(national_id_index)
+        if not results and source is not None:
+            results = self.shards[source].find_by_hash(national_id_index)
+        if self.search_cache is not None:
+            self.search_cache.set(national_id_index, results, token)
+        return results
+
+    def find_by_hashes(self, indexes, chunk_size: int = 1000) -> dict:
+        """One batch per shard; misses in migrating slots are retried on the old owner."""
+        results = {}
+        for (owner, source), group in self._group(indexes, key=lambda index: index).items():
+            found = self.shards[owner].find_by_hashes(group, chunk_size)
+            misses = [index for index, rows in found.items() if not rows]
+            if misses and source is not None:
+                found.update(self.shards[source].find_by_hashes(misses, chunk_size))
+            results.update(found)
+        return results
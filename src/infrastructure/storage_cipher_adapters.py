@@ -5,11 +5,9 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 
-def load_key_from_env(var_name: str, default=None):
-    val = os.getenv(var_name)
-    if not val:
-        if default: return default
-        raise ValueError(f"Missing required environment variable: {var_name}")
+NONCE_SIZE = 12
+
+def derive_key(val: str) -> bytes:
     # Assuming key is hex or base64? Let's assume URL-safe Base64 or just 32 bytes hex.
     # For simplicity in this demo, let's treat it as a string that we hash to get bytes if it's not proper length.
     # Better: use a proper KDF.
@@ -17,6 +15,13 @@ def load_key_from_env(var_name: str, default=None):
     digest.update(val.encode())
     return digest.finalize()
 
+def load_key_from_env(var_name: str, default=None):
+    val = os.getenv(var_name)
+    if not val:
+        if default: return default
+        raise ValueError(f"Missing required environment variable: {var_name}")
+    return derive_key(val)
+
 class StorageCipherAdapter(ABC):
     @property
     @abstractmethod
@@ -33,31 +38,63 @@ class StorageCipherAdapter(ABC):
         """Decrypts full blob (including prefix)"""
         pass
 
-class V1StorageCipher(StorageCipherAdapter):
-    def __init__(self):
-        self.key = load_key_from_env("DEK_KEY")
-        self.prefix = b"v1:"
+def version_tag(version: str):
+    """
+    1-byte tag used by the binary storage layout: "v<N>" maps to N
+    (1..255). Returns None for versions that have no binary tag.
+    """
+    if len(version) > 1 and version[0] == "v" and version[1:].isdigit():
+        tag = int(version[1:])
+        if 0 < tag < 256:
+            return tag
+    return None
+
+class VersionedStorageCipher(StorageCipherAdapter):
+    """
+    AES-256-GCM with a "<version>:" prefix, e.g. b"v2:" + nonce + ciphertext.
+    The binary layout frames the same nonce + ciphertext behind a single
+    tag byte instead (see version_tag). One AESGCM object is kept for the
+    lifetime of the adapter.
+    """
+    def __init__(self, version: str, key: bytes):
+        self.version = version
+        self.key = key
+        self.prefix = f"{version}:".encode()
+        self.tag = version_tag(version)
+        self.aesgcm = AESGCM(self.key)
 
     @property
     def version_prefix(self) -> bytes:
         return self.prefix
 
     def encrypt(self, plaintext: bytes) -> bytes:
-        aesgcm = AESGCM(self.key)
-        nonce = os.urandom(12)
-        ciphertext = aesgcm.encrypt(nonce, plaintext, None)
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = self.aesgcm.encrypt(nonce, plaintext, None)
         return self.prefix + nonce + ciphertext
 
     def decrypt(self, blob: bytes) -> bytes:
         if not blob.startswith(self.prefix):
-            raise ValueError("Invalid version prefix for V1 adapter")
-        
-        payload = blob[len(self.prefix):]
-        if len(payload) < 12: # At least nonce needs to be there
-             raise ValueError("Invalid V1 payload length")
-             
-        nonce = payload[:12]
-        ciphertext = payload[12:]
-        
-        aesgcm = AESGCM(self.key)
-        return aesgcm.decrypt(nonce, ciphertext, None)
+            raise ValueError(f"Invalid version prefix for {self.version} adapter")
+
+        # Slice through a memoryview so nonce/ciphertext are not copied
+        payload = memoryview(blob)[len(self.prefix):]
+        if len(payload) < NONCE_SIZE: # At least nonce needs to be there
+             raise ValueError(f"Invalid {self.version} payload length")
+
+        return self.aesgcm.decrypt(payload[:NONCE_SIZE], payload[NONCE_SIZE:], None)
+
+    def encrypt_binary(self, plaintext: bytes) -> bytes:
+        if self.tag is None:
+            raise ValueError(f"Storage version {self.version} has no binary tag")
+        nonce = os.urandom(NONCE_SIZE)
+        return bytes((self.tag,)) + nonce + self.aesgcm.encrypt(nonce, plaintext, None)
+
+    def decrypt_binary(self, blob) -> bytes:
+        payload = memoryview(blob)
+        if len(payload) < 1 + NONCE_SIZE or payload[0] != self.tag:
+            raise ValueError(f"Invalid binary payload for {self.version} adapter")
+        return self.aesgcm.decrypt(payload[1:1 + NONCE_SIZE], payload[1 + NONCE_SIZE:], None)
+
+class V1StorageCipher(VersionedStorageCipher):
+    def __init__(self):
+        super().__init__("v1", load_key_from_env("DEK_KEY"))
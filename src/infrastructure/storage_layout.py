@@ -0,0 +1,216 @@
+import os
+import base64
+from .storage_cipher_adapters import version_tag
+from .key_registry import MAX_PREFIX_LEN
+
+LAYOUTS = ("text", "dual", "binary")
+
+# Fixed width of a binary national_id_index (raw HMAC-SHA256 digest)
+INDEX_SIZE = 32
+
+
+def index_to_binary(national_id_index) -> bytes:
+    if isinstance(national_id_index, str):
+        return base64.b64decode(national_id_index)
+    return bytes(national_id_index)
+
+
+def index_to_text(national_id_index) -> str:
+    if isinstance(national_id_index, str):
+        return national_id_index
+    return base64.b64encode(national_id_index).decode('ascii')
+
+
+def blob_to_binary(national_id_blob) -> bytes:
+    """
+    Reframes a text-layout blob (base64 of b"v1:" + nonce + ciphertext) as
+    a binary-layout one (tag byte + nonce + ciphertext). The ciphertext is
+    reused as is; nothing is decrypted.
+    """
+    if not isinstance(national_id_blob, str):
+        return bytes(national_id_blob)
+    raw = base64.b64decode(national_id_blob)
+    end = raw.find(b":", 0, MAX_PREFIX_LEN)
+    tag = version_tag(raw[:end].decode('ascii', 'replace')) if end > 0 else None
+    if tag is None:
+        raise ValueError("Storage blob version has no binary tag")
+    return bytes((tag,)) + raw[end + 1:]
+
+
+def blob_to_text(national_id_blob) -> str:
+    """Inverse of blob_to_binary."""
+    if isinstance(national_id_blob, str):
+        return national_id_blob
+    raw = bytes(national_id_blob)
+    return base64.b64encode(f"v{raw[0]}:".encode() + raw[1:]).decode('ascii')
+
+
+class StorageLayout:
+    """
+    Which user_profiles columns hold the national ID (STORAGE_LAYOUT):
+
+    - text:   base64 VARCHAR columns national_id_blob / national_id_index.
+    - dual:   writes both the text and the BYTEA (*_bin) columns, reads
+              either; used while an online conversion is in progress.
+    - binary: BYTEA only, with a 1-byte version tag and a 32-byte index.
+
+    CryptoService produces str values for text/dual and bytes for binary;
+    this class maps them to columns and SQL for both repositories.
+    """
+    def __init__(self, name: str = "text"):
+        if name not in LAYOUTS:
+            raise ValueError(f"Unknown STORAGE_LAYOUT: {name}")
+        self.name = name
+        self.binary = name == "binary"
+        self.dual = name == "dual"
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("STORAGE_LAYOUT", "text"))
+
+    # --- inserts ------------------------------------------------------
+
+    @property
+    def insert_columns(self) -> str:
+        if self.binary:
+            return "national_id_blob_bin, national_id_index_bin"
+        if self.dual:
+            return "national_id_blob, national_id_index, national_id_blob_bin, national_id_index_bin"
+        return "national_id_blob, national_id_index"
+
+    @property
+    def insert_types(self) -> tuple:
+        if self.binary:
+            return ("bytea", "bytea")
+        if self.dual:
+            return ("varchar", "varchar", "bytea", "bytea")
+        return ("varchar", "varchar")
+
+    def insert_params(self, national_id_blob, national_id_index) -> tuple:
+        if self.binary:
+            return (bytes(national_id_blob), bytes(national_id_index))
+        if self.dual:
+            return (national_id_blob, national_id_index,
+                    blob_to_binary(national_id_blob), index_to_binary(national_id_index))
+        return (national_id_blob, national_id_index)
+
+    @property
+    def on_conflict(self) -> str:
+        if self.binary:
+            return "ON CONFLICT (national_id_index_bin) DO NOTHING"
+        if self.dual:
+            # Either unique index may fire while rows are being converted
+            return "ON CONFLICT DO NOTHING"
+        return "ON CONFLICT (national_id_index) DO NOTHING"
+
+    @property
+    def returning_column(self) -> str:
+        return "national_id_index_bin" if self.binary else "national_id_index"
+
+    def inserted_key(self, value):
+        return bytes(value) if self.binary else value
+
+    # --- lookups ------------------------------------------------------
+
+    @property
+    def lookup_types(self) -> tuple:
+        if self.binary:
+            return ("bytea",)
+        if self.dual:
+            return ("bytea", "varchar")
+        return ("varchar",)
+
+    @property
+    def lookup_sql(self) -> str:
+        if self.binary:
+            return "SELECT id, national_id_blob_bin FROM user_profiles WHERE national_id_index_bin = $1"
+        if self.dual:
+            return ("SELECT id, national_id_blob_bin, national_id_blob FROM user_profiles "
+                    "WHERE national_id_index_bin = $1 OR national_id_index = $2")
+        return "SELECT id, national_id_blob FROM user_profiles WHERE national_id_index = $1"
+
+    def lookup_params(self, national_id_index) -> tuple:
+        if self.binary:
+            return (bytes(national_id_index),)
+        if self.dual:
+            return (index_to_binary(national_id_index), index_to_text(national_id_index))
+        return (national_id_index,)
+
+    def normalize_rows(self, rows) -> list:
+        """(id, blob) rows; binary blobs as bytes, whichever layout the row is in."""
+        if self.binary:
+            return [(row[0], bytes(row[1])) for row in rows]
+        if self.dual:
+            return [(row[0], bytes(row[1]) if row[1] is not None else row[2]) for row in rows]
+        return [tuple(row) for row in rows]
+
+    @property
+    def batch_lookup_sql(self) -> str:
+        """Lookup for many indexes at once; rows are (index, id, blob columns...)."""
+        if self.binary:
+            return ("SELECT national_id_index_bin, id, national_id_blob_bin FROM user_profiles "
+                    "WHERE national_id_index_bin = ANY($1)")
+        if self.dual:
+            # Keyed by the text index, which dual-mode callers pass around
+            return ("SELECT COALESCE(national_id_index, encode(national_id_index_bin, 'base64')), "
+                    "id, national_id_blob_bin, national_id_blob FROM user_profiles "
+                    "WHERE national_id_index_bin = ANY($1) OR national_id_index = ANY($2)")
+        return "SELECT national_id_index, id, national_id_blob FROM user_profiles WHERE national_id_index = ANY($1)"
+
+    def batch_lookup_params(self, indexes) -> tuple:
+        if self.binary:
+            return ([bytes(i) for i in indexes],)
+        if self.dual:
+            return ([index_to_binary(i) for i in indexes], [index_to_text(i) for i in indexes])
+        return (list(indexes),)
+
+    def normalize_batch_rows(self, rows) -> dict:
+        """{index: [(id, blob), ...]} from batch_lookup_sql rows."""
+        found = {}
+        for row in rows:
+            row = tuple(row)
+            found.setdefault(self.inserted_key(row[0]), []).extend(self.normalize_rows([row[1:]]))
+        return found
+
+    # --- scans and rewrites -------------------------------------------
+
+    @property
+    def blob_column(self) -> str:
+        # Rows written in dual mode always carry the text blob too
+        return "national_id_blob_bin" if self.binary else "national_id_blob"
+
+    @property
+    def index_column(self) -> str:
+        return "national_id_index_bin" if self.binary else "national_id_index"
+
+    def index_range_condition(self, bounded: bool) -> str:
+        """
+        WHERE clause for index bytes in [lower, upper) (just >= lower when not
+        bounded). Uses the unique index under the binary layout; base64 text
+        does not sort like the bytes, so text/dual decode and scan.
+        """
+        column = "national_id_index_bin" if self.binary else "decode(national_id_index, 'base64')"
+        return f"{column} >= %s AND {column} < %s" if bounded else f"{column} >= %s"
+
+    @property
+    def update_blobs_sql(self) -> str:
+        """UPDATE ... FROM (VALUES %s) for (id, old_blob, new_blob) rows, guarded on old_blob."""
+        if self.binary:
+            # Drop any leftover text copy so it cannot outlive a key rotation
+            return ("UPDATE user_profiles AS u SET national_id_blob_bin = v.new_blob, national_id_blob = NULL "
+                    "FROM (VALUES %s) AS v(id, old_blob, new_blob) "
+                    "WHERE u.id = v.id AND u.national_id_blob_bin = v.old_blob")
+        if self.dual:
+            return ("UPDATE user_profiles AS u SET national_id_blob = v.new_blob, national_id_blob_bin = v.new_blob_bin "
+                    "FROM (VALUES %s) AS v(id, old_blob, new_blob, new_blob_bin) "
+                    "WHERE u.id = v.id AND u.national_id_blob = v.old_blob")
+        return ("UPDATE user_profiles AS u SET national_id_blob = v.new_blob "
+                "FROM (VALUES %s) AS v(id, old_blob, new_blob) "
+                "WHERE u.id = v.id AND u.national_id_blob = v.old_blob")
+
+    def update_params(self, row_id: int, old_blob, new_blob) -> tuple:
+        if self.binary:
+            return (row_id, bytes(old_blob), bytes(new_blob))
+        if self.dual:
+            return (row_id, old_blob, new_blob, blob_to_binary(new_blob))
+        return (row_id, old_blob, new_blob)
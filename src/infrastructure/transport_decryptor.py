@@ -0,0 +1,214 @@
+import os
+import base64
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.backends import default_backend
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+BACKENDS = ("inline", "thread", "process")
+
+
+class TransportQueueFullError(Exception):
+    """Raised when the decrypt queue stays full for longer than the queue timeout."""
+
+
+def unwrap_transport_key(private_key, encrypted_key_b64: str) -> bytes:
+    """RSA-OAEP decrypts a client-generated AES key."""
+    return private_key.decrypt(base64.b64decode(encrypted_key_b64), OAEP_PADDING)
+
+
+def decrypt_hybrid_payload(private_key, encrypted_data_b64: str, encrypted_key_b64: str, iv_b64: str) -> str:
+    """
+    Decrypts the hybrid encryption payload from Frontend:
+    RSA-OAEP unwraps the AES key, AES-GCM decrypts the data.
+    """
+    encrypted_data = base64.b64decode(encrypted_data_b64)
+    iv = base64.b64decode(iv_b64)
+
+    # 1. Decrypt Symmetric Key using Private Key
+    with METRICS.stage("rsa_unwrap"):
+        symmetric_key = unwrap_transport_key(private_key, encrypted_key_b64)
+
+    # 2. Decrypt Data using Symmetric Key (AES-GCM)
+    # WebCrypto appends the tag to the ciphertext, which is what AESGCM expects.
+    with METRICS.stage("transport_aes_gcm"):
+        aesgcm = AESGCM(symmetric_key)
+        plaintext_bytes = aesgcm.decrypt(iv, encrypted_data, None)
+    return plaintext_bytes.decode('utf-8')
+
+
+# Process-pool workers load the key once in the initializer and keep it here
+_worker_private_key = None
+
+def _init_worker(private_key_pem: bytes):
+    global _worker_private_key
+    _worker_private_key = serialization.load_pem_private_key(
+        private_key_pem,
+        password=None,
+        backend=default_backend()
+    )
+
+def _call_in_worker(fn, *args):
+    return fn(_worker_private_key, *args)
+
+
+class TransportDecryptor:
+    """
+    Execution backend for transport decryption.
+
+    - inline:  run on the calling (request) thread
+    - thread:  thread pool; OpenSSL releases the GIL during RSA work
+    - process: process pool with the private key loaded once per worker
+
+    At most max_queue payloads are in flight (queued or running). Callers
+    wait up to queue_timeout seconds for a slot, then get
+    TransportQueueFullError so overload turns into fast rejections.
+    A decrypt_many() batch holds at most batch_in_flight of those slots
+    at a time, so one large batch cannot starve single submits.
+    """
+    def __init__(self, private_key, backend: str = "inline", workers: int = None,
+                 max_queue: int = None, queue_timeout: float = 1.0, batch_in_flight: int = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown transport decrypt backend: {backend}")
+        self.private_key = private_key
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue or self.workers * 4
+        self.queue_timeout = queue_timeout
+        # Enough to keep every worker busy, leaving the rest of the queue to other requests
+        self.batch_in_flight = min(batch_in_flight or self.workers, self.max_queue)
+
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        if backend == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transport-decrypt")
+        elif backend == "process":
+            pem = private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(pem,)
+            )
+        else:
+            self._executor = None
+        logger.info(f"Transport decryptor using {backend} backend (workers={self.workers}, max_queue={self.max_queue})")
+
+    @classmethod
+    def from_env(cls, private_key):
+        workers = os.getenv("TRANSPORT_DECRYPT_WORKERS")
+        max_queue = os.getenv("TRANSPORT_DECRYPT_MAX_QUEUE")
+        batch_in_flight = os.getenv("TRANSPORT_DECRYPT_BATCH_IN_FLIGHT")
+        return cls(
+            private_key,
+            backend=os.getenv("TRANSPORT_DECRYPT_BACKEND", "inline"),
+            workers=int(workers) if workers else None,
+            max_queue=int(max_queue) if max_queue else None,
+            queue_timeout=float(os.getenv("TRANSPORT_DECRYPT_QUEUE_TIMEOUT", "1.0")),
+            batch_in_flight=int(batch_in_flight) if batch_in_flight else None,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Payloads queued or running."""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Payloads waiting for a free worker."""
+        if self._executor is None:
+            return 0
+        return max(self._in_flight - self.workers, 0)
+
+    def _acquire_slot(self):
+        with METRICS.stage("transport_queue_wait"):
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        if not acquired:
+            raise TransportQueueFullError("Transport decrypt queue is full")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release_slot(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _submit(self, fn, *args) -> Future:
+        # fn takes the private key as its first argument
+        self._acquire_slot()
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(self.private_key, *args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._release_slot()
+            return future
+
+        try:
+            if self.backend == "process":
+                future = self._executor.submit(_call_in_worker, fn, *args)
+            else:
+                future = self._executor.submit(fn, self.private_key, *args)
+        except Exception:
+            self._release_slot()
+            raise
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def submit(self, encrypted_data_b64: str, encrypted_key_b64: str, iv_b64: str) -> Future:
+        return self._submit(decrypt_hybrid_payload, encrypted_data_b64, encrypted_key_b64, iv_b64)
+
+    def unwrap_key(self, encrypted_key_b64: str) -> bytes:
+        """RSA-OAEP unwraps a client symmetric key (transport session handshake)."""
+        return self._submit(unwrap_transport_key, encrypted_key_b64).result()
+
+    def decrypt(self, encrypted_data_b64: str, encrypted_key_b64: str, iv_b64: str) -> str:
+        return self.submit(encrypted_data_b64, encrypted_key_b64, iv_b64).result()
+
+    def decrypt_many(self, payloads) -> list:
+        """
+        Decrypts (encrypted_data_b64, encrypted_key_b64, iv_b64) tuples in
+        parallel. Each result is the plaintext or the exception raised for
+        that payload; TransportQueueFullError aborts the whole call.
+        At most batch_in_flight payloads are submitted at once.
+        """
+        window = deque()
+        results = []
+        for payload in payloads:
+            if len(window) >= self.batch_in_flight:
+                results.append(self._outcome(window.popleft()))
+            window.append(self.submit(*payload))
+        while window:
+            results.append(self._outcome(window.popleft()))
+        return results
+
+    @staticmethod
+    def _outcome(future: Future):
+        try:
+            return future.result()
+        except Exception as e:
+            return e
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -1,32 +1,128 @@
+from typing import List
 from infrastructure.crypto_service import CryptoService
 from infrastructure.repository import Repository
+from infrastructure.metrics import METRICS
+from commands.submit_data import validate_national_id
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SearchQueryHandler:
-    def __init__(self):
-        self.crypto_service = CryptoService()
-        self.repository = Repository()
+    def __init__(self, crypto_service: CryptoService = None, repository: Repository = None):
+        self.crypto_service = crypto_service or CryptoService()
+        self.repository = repository or Repository()
 
     def handle(self, national_id: str):
-        logger.info(f"Handling search for national_id")
+        with METRICS.stage("search"):
+            return self._handle(national_id)
+
+    def _handle(self, national_id: str):
+        logger.info("Handling search for national_id")
         # 1. Compute Hash for Index
-        national_id_index = self.crypto_service.hash_for_index(national_id)
+        with METRICS.stage("hmac_index"):
+            national_id_index = self.crypto_service.hash_for_index(national_id)
 
-        # 2. Query Database
+        # 2. Query Database (db_acquire / db_lookup are timed by the pool and repository)
         results = self.repository.find_by_hash(national_id_index)
 
         # 3. Decrypt Results (Optional - depends on requirement)
         # Assuming we want to verify we can recover the data
-        decrypted_results = []
-        for row in results:
-            id, blob = row
-            plaintext = self.crypto_service.decrypt_from_storage(blob)
-            decrypted_results.append({
-                "id": id,
-                "data": plaintext
-            })
+        blobs = [blob for _, blob in results]
+        with METRICS.stage("storage_decrypt"):
+            plaintexts = self.crypto_service.decrypt_from_storage_many(blobs)
+        if METRICS.enabled:
+            version_of = self.crypto_service.key_registry.version_of
+            for blob in blobs:
+                METRICS.count("storage_decrypt_total", key_version=version_of(blob))
+        decrypted_results = [
+            {"id": id, "data": plaintext}
+            for (id, _), plaintext in zip(results, plaintexts)
+        ]
             
-        logger.info(f"Search returned {len(decrypted_results)} decrypted results")
+        logger.info("Search returned %d decrypted results", len(decrypted_results))
         return decrypted_results
+
+class SearchBatchQueryHandler:
+    """
+    Resolves many national IDs at once: bulk HMAC, one ANY(array) query per
+    chunk of indexes and bulk decryption. Returns one result per input, in
+    order, with status found, not_found, invalid or error.
+    """
+    def __init__(self, crypto_service: CryptoService = None, repository: Repository = None, chunk_size: int = None):
+        self.crypto_service = crypto_service or CryptoService()
+        self.repository = repository or Repository()
+        self.chunk_size = chunk_size or int(os.getenv("SEARCH_BATCH_CHUNK_SIZE", "1000"))
+
+    def handle(self, national_ids: List[str]) -> List[dict]:
+        with METRICS.stage("search_batch"):
+            results, indexes = self.prepare(national_ids)
+            found = self.repository.find_by_hashes(unique_indexes(indexes), self.chunk_size)
+            return self.finish(results, indexes, found)
+
+    def prepare(self, national_ids: List[str]):
+        """
+        CPU-bound first half: validate and hash. Returns (results, indexes)
+        where results holds the invalid items and indexes the blind index
+        of every other position (None where invalid).
+        """
+        results = [None] * len(national_ids)
+        valid = {}  # national_id -> index, each distinct ID hashed once
+        for pos, national_id in enumerate(national_ids):
+            try:
+                validate_national_id(national_id)
+            except ValueError as e:
+                results[pos] = {"status": "invalid", "error": str(e)}
+                continue
+            valid[national_id] = None
+
+        with METRICS.stage("hmac_index"):
+            hashed = self.crypto_service.hash_for_index_many(list(valid))
+        valid = dict(zip(valid, hashed))
+        indexes = [None if result else valid[national_id] for national_id, result in zip(national_ids, results)]
+        return results, indexes
+
+    def finish(self, results: list, indexes: list, found: dict) -> List[dict]:
+        """CPU-bound second half: decrypt the hits and map them back to each input."""
+        rows = [row for index in unique_indexes(indexes) for row in found.get(index, ())]
+        plaintexts = self._decrypt(rows)
+
+        for pos, national_id_index in enumerate(indexes):
+            if national_id_index is None:
+                continue
+            matches = found.get(national_id_index) or []
+            if not matches:
+                results[pos] = {"status": "not_found"}
+            elif any(isinstance(plaintexts[row_id], Exception) for row_id, _ in matches):
+                results[pos] = {"status": "error", "error": "Could not decrypt stored value"}
+            else:
+                results[pos] = {"status": "found",
+                                "matches": [{"id": row_id, "data": plaintexts[row_id]} for row_id, _ in matches]}
+
+        logger.info("Batch search resolved %d items, %d with matches", len(results),
+                    sum(1 for result in results if result["status"] == "found"))
+        return results
+
+    def _decrypt(self, rows) -> dict:
+        """{row id: plaintext}; a row that fails to decrypt maps to its exception."""
+        blobs = [blob for _, blob in rows]
+        with METRICS.stage("storage_decrypt"):
+            try:
+                plaintexts = self.crypto_service.decrypt_from_storage_many(blobs)
+            except Exception:
+                # Find the bad rows without failing the whole batch
+                plaintexts = []
+                for blob in blobs:
+                    try:
+                        plaintexts.append(self.crypto_service.decrypt_from_storage(blob))
+                    except Exception as e:
+                        logger.error("Failed to decrypt stored value: %s", type(e).__name__)
+                        plaintexts.append(e)
+        if METRICS.enabled:
+            version_of = self.crypto_service.key_registry.version_of
+            for blob in blobs:
+                METRICS.count("storage_decrypt_total", key_version=version_of(blob))
+        return {row_id: plaintext for (row_id, _), plaintext in zip(rows, plaintexts)}
+
+def unique_indexes(indexes: list) -> list:
+    return list(dict.fromkeys(index for index in indexes if index is not None))
@@ -0,0 +1,114 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from starlette.testclient import TestClient
+from asgi import create_asgi_app
+from infrastructure.container import ServiceContainer
+
+@pytest.fixture
+def services(crypto_env):
+    return ServiceContainer(repository=MagicMock(index_filter=None, search_cache=None))
+
+@pytest.fixture
+def repository():
+    repo = AsyncMock()
+    repo.search_cache = None
+    return repo
+
+@pytest.fixture
+def client(services, repository):
+    with TestClient(create_asgi_app(services, repository)) as client:
+        yield client
+
+def test_lifespan_opens_and_closes_pool(services, repository):
+    with TestClient(create_asgi_app(services, repository)):
+        repository.open.assert_awaited_once()
+    repository.close.assert_awaited_once()
+
+def test_submit(client, repository, make_transport_payload):
+    resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"))
+
+    assert resp.status_code == 200
+    repository.save_user_profile.assert_awaited_once()
+
+def test_submit_duplicate_is_conflict(client, repository, make_transport_payload):
+    repository.save_user_profile.side_effect = ValueError("National ID already exists")
+
+    resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"))
+
+    assert resp.status_code == 409
+
+def test_retried_submit_is_replayed(client, repository, make_transport_payload):
+    payload = make_transport_payload("1234567890123")
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post('/api/v1/submit-user-profile', json=payload, headers=headers)
+    second = client.post('/api/v1/submit-user-profile', json=payload, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.headers["Idempotent-Replayed"] == "true"
+    repository.save_user_profile.assert_awaited_once()
+
+def test_shared_idempotency_store_is_not_called_on_the_event_loop(services, repository):
+    from infrastructure.idempotency import InMemoryIdempotencyStore, SharedIdempotencyStore
+    services.idempotency = SharedIdempotencyStore(MagicMock())
+
+    app = create_asgi_app(services, repository)
+
+    assert isinstance(app.state.idempotency, InMemoryIdempotencyStore)
+
+def test_submit_batch(client, repository, make_transport_payload):
+    repository.save_user_profiles.side_effect = lambda rows: {i for _, i in rows}
+
+    resp = client.post('/api/v1/submit-user-profiles:batch', json=[make_transport_payload("1234567890123"), {}])
+
+    assert resp.status_code == 200
+    assert resp.json()["summary"] == {"created": 1, "duplicate": 0, "invalid": 1}
+
+def test_search(client, services, repository):
+    blob = services.crypto_service.encrypt_for_storage("1234567890123")
+    repository.find_by_hash.return_value = [(1, blob)]
+
+    resp = client.get('/api/v1/search?nid=1234567890123')
+
+    assert resp.status_code == 200
+    assert resp.json() == [{"id": 1, "data": "1234567890123"}]
+    repository.find_by_hash.assert_awaited_once_with(services.crypto_service.hash_for_index("1234567890123"))
+
+def test_search_batch(client, services, repository):
+    hit = services.crypto_service.hash_for_index("1234567890123")
+    blob = services.crypto_service.encrypt_for_storage("1234567890123")
+    repository.find_by_hashes.side_effect = lambda indexes, chunk_size: {
+        index: [(1, blob)] if index == hit else [] for index in indexes
+    }
+
+    resp = client.post('/api/v1/search:batch', json=["3210987654321", "1234567890123"])
+
+    assert resp.status_code == 200
+    assert resp.json()["results"] == [
+        {"index": 0, "status": "not_found"},
+        {"index": 1, "status": "found", "matches": [{"id": 1, "data": "1234567890123"}]},
+    ]
+
+def test_public_key_conditional(client):
+    etag = client.get('/api/v1/public-key').headers["ETag"]
+
+    resp = client.get('/api/v1/public-key', headers={"If-None-Match": etag})
+
+    assert resp.status_code == 304
+
+def test_server_timing_covers_executor_stages(services, repository, monkeypatch, make_transport_payload):
+    from infrastructure.metrics import METRICS
+    monkeypatch.setenv("METRICS_ENABLED", "1")
+    monkeypatch.setenv("METRICS_SERVER_TIMING", "1")
+    services.repository._pool = None
+    try:
+        with TestClient(create_asgi_app(services, repository)) as client:
+            resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"))
+            metrics = client.get('/metrics')
+    finally:
+        METRICS.configure(enabled=False)
+        METRICS.reset()
+
+    stages = [part.split(";")[0] for part in resp.headers["Server-Timing"].split(", ")]
+    assert {"rsa_unwrap", "validate", "hmac_index", "storage_encrypt", "submit"} <= set(stages)
+    assert metrics.headers["content-type"].startswith("text/plain")
@@ -0,0 +1,216 @@
+import pytest
+from unittest.mock import MagicMock
+from app import create_app
+from infrastructure.container import ServiceContainer
+
+@pytest.fixture
+def services(crypto_env):
+    return ServiceContainer(repository=MagicMock(index_filter=None, search_cache=None))
+
+@pytest.fixture
+def client(services):
+    app = create_app(services)
+    app.testing = True
+    return app.test_client()
+
+def test_public_key_is_cacheable(client, services):
+    resp = client.get('/api/v1/public-key')
+
+    assert resp.status_code == 200
+    assert resp.get_json()["public_key"].startswith("-----BEGIN PUBLIC KEY-----")
+    assert resp.headers["ETag"] == f'"{services.public_key.etag}"'
+    assert "max-age=3600" in resp.headers["Cache-Control"]
+
+def test_public_key_not_modified(client):
+    etag = client.get('/api/v1/public-key').headers["ETag"]
+
+    resp = client.get('/api/v1/public-key', headers={"If-None-Match": etag})
+
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+def test_submit_uses_shared_services(client, services, make_transport_payload):
+    resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"))
+
+    assert resp.status_code == 200
+    services.repository.save_user_profile.assert_called_once()
+
+def test_search_uses_shared_services(client, services):
+    blob = services.crypto_service.encrypt_for_storage("1234567890123")
+    services.repository.find_by_hash.return_value = [(1, blob)]
+
+    resp = client.get('/api/v1/search?nid=1234567890123')
+
+    assert resp.status_code == 200
+    assert resp.get_json() == [{"id": 1, "data": "1234567890123"}]
+
+def test_retried_submit_is_replayed_without_crypto_or_db(client, services, make_transport_payload):
+    payload = make_transport_payload("1234567890123")
+    assert client.post('/api/v1/submit-user-profile', json=payload).status_code == 200
+    services.crypto_service.transport_decryptor = MagicMock()
+
+    resp = client.post('/api/v1/submit-user-profile', json=payload)
+
+    assert resp.status_code == 200
+    assert resp.headers["Idempotent-Replayed"] == "true"
+    services.crypto_service.transport_decryptor.decrypt.assert_not_called()
+    services.repository.save_user_profile.assert_called_once()
+
+def test_idempotency_key_reused_with_other_payload_is_rejected(client, make_transport_payload):
+    headers = {"Idempotency-Key": "order-42"}
+    client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"), headers=headers)
+
+    resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("3210987654321"), headers=headers)
+
+    assert resp.status_code == 422
+
+def test_failed_submit_is_not_replayed(client, services, make_transport_payload):
+    payload = make_transport_payload("1234567890123")
+    services.repository.save_user_profile.side_effect = [RuntimeError("db down"), None]
+
+    assert client.post('/api/v1/submit-user-profile', json=payload).status_code == 500
+    assert client.post('/api/v1/submit-user-profile', json=payload).status_code == 200
+
+def test_submit_over_admission_limit_is_shed_before_any_work(services, monkeypatch, make_transport_payload):
+    monkeypatch.setenv("ADMISSION_LIMITS", "submit=1:0:1")
+    app = create_app(services)
+    client = app.test_client()
+    app.extensions["admission"].admit("submit")  # a submit already running
+
+    resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"))
+    public_key = client.get('/api/v1/public-key')
+
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    services.repository.save_user_profile.assert_not_called()
+    assert public_key.status_code == 200
+    stats = client.get('/api/v1/admission/stats').get_json()
+    assert stats["routes"]["submit"]["shed"]["queue_full"] == 1
+
+def test_client_header_only_trusted_from_configured_proxies(services, monkeypatch):
+    from api.admission import _client_id
+    monkeypatch.setenv("ADMISSION_TRUSTED_PROXIES", "10.0.0.0/8")
+    app = create_app(services)
+
+    with app.test_request_context(headers={"X-Real-IP": "1.2.3.4"}, environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+        assert _client_id() == "1.2.3.4"
+    with app.test_request_context(headers={"X-Real-IP": "1.2.3.4"}, environ_base={"REMOTE_ADDR": "203.0.113.9"}):
+        assert _client_id() == "203.0.113.9"
+
+def test_submit_batch_returns_per_item_results(client, services, make_transport_payload):
+    services.repository.save_user_profiles.side_effect = lambda rows: {i for _, i in rows}
+    items = [make_transport_payload("1234567890123"), {"national_id": "x"}]
+
+    resp = client.post('/api/v1/submit-user-profiles:batch', json=items)
+
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert body["results"] == [
+        {"index": 0, "status": "created"},
+        {"index": 1, "status": "invalid", "error": "Malformed submit item"},
+    ]
+    assert body["summary"] == {"created": 1, "duplicate": 0, "invalid": 1}
+
+def test_submit_batch_rejects_non_array(client):
+    resp = client.post('/api/v1/submit-user-profiles:batch', json={"national_id": "x"})
+
+    assert resp.status_code == 400
+
+def test_search_batch_reports_each_input(client, services):
+    hit = services.crypto_service.hash_for_index("1234567890123")
+    blob = services.crypto_service.encrypt_for_storage("1234567890123")
+    services.repository.find_by_hashes.side_effect = lambda indexes, chunk_size: {
+        index: [(1, blob)] if index == hit else [] for index in indexes
+    }
+
+    resp = client.post('/api/v1/search:batch', json={"national_ids": ["1234567890123", "3210987654321", 42]})
+
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert [r["status"] for r in body["results"]] == ["found", "not_found", "invalid"]
+    assert body["results"][0]["matches"] == [{"id": 1, "data": "1234567890123"}]
+    assert body["summary"] == {"found": 1, "not_found": 1, "invalid": 1, "error": 0}
+
+def test_search_batch_rejects_oversized_batch(client, monkeypatch):
+    monkeypatch.setenv("SEARCH_BATCH_MAX_ITEMS", "2")
+
+    resp = client.post('/api/v1/search:batch', json=["1234567890123"] * 3)
+
+    assert resp.status_code == 413
+
+def test_submit_sheds_load_when_decrypt_queue_full(client, services, make_transport_payload):
+    from infrastructure.transport_decryptor import TransportQueueFullError
+    services.crypto_service.transport_decryptor = MagicMock()
+    services.crypto_service.transport_decryptor.decrypt.side_effect = TransportQueueFullError("full")
+
+    resp = client.post('/api/v1/submit-user-profile', json=make_transport_payload("1234567890123"))
+
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+def test_session_mode_submit_skips_rsa(client, services, rsa_private_key):
+    import base64, os
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from infrastructure.transport_decryptor import OAEP_PADDING
+
+    key = AESGCM.generate_key(bit_length=256)
+    wrapped = rsa_private_key.public_key().encrypt(key, OAEP_PADDING)
+    resp = client.post('/api/v1/transport-session', json={"encrypted_key": base64.b64encode(wrapped).decode()})
+    assert resp.status_code == 201
+    session_id = resp.get_json()["session_id"]
+
+    iv = os.urandom(12)
+    ciphertext = AESGCM(key).encrypt(iv, b"1234567890123", None)
+    services.crypto_service.transport_decryptor = MagicMock()
+    resp = client.post('/api/v1/submit-user-profile', json={
+        "session_id": session_id,
+        "national_id": base64.b64encode(ciphertext).decode(),
+        "iv": base64.b64encode(iv).decode(),
+    })
+
+    assert resp.status_code == 200
+    services.crypto_service.transport_decryptor.decrypt.assert_not_called()
+    services.repository.save_user_profile.assert_called_once()
+
+def test_submit_with_unknown_session_is_unauthorized(client):
+    resp = client.post('/api/v1/submit-user-profile', json={
+        "session_id": "nope", "national_id": "AAAA", "iv": "AAAA"
+    })
+
+    assert resp.status_code == 401
+
+def test_export_is_disabled_by_default(client):
+    assert client.get('/api/v1/export').status_code == 404
+
+def test_export_streams_ndjson(client, services, monkeypatch):
+    monkeypatch.setenv("EXPORT_API_ENABLED", "1")
+    blob = services.crypto_service.encrypt_for_storage("1234567890123")
+    services.repository.iter_export_batches.return_value = iter([[(7, blob, None)]])
+
+    resp = client.get('/api/v1/export?after_id=5&format=ndjson')
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-ndjson"
+    assert resp.data.decode().splitlines() == ['{"id": 7, "national_id": "1234567890123", "created_at": null}']
+    assert client.get('/api/v1/export?format=xml').status_code == 400
+
+def test_metrics_endpoint_and_server_timing(services, monkeypatch):
+    from infrastructure.metrics import METRICS
+    monkeypatch.setenv("METRICS_ENABLED", "1")
+    monkeypatch.setenv("METRICS_SERVER_TIMING", "1")
+    services.repository._pool = None
+    blob = services.crypto_service.encrypt_for_storage("1234567890123")
+    services.repository.find_by_hash.return_value = [(1, blob)]
+    app = create_app(services)
+    try:
+        client = app.test_client()
+        resp = client.get('/api/v1/search?nid=1234567890123')
+        metrics = client.get('/metrics').get_data(as_text=True)
+    finally:
+        METRICS.configure(enabled=False)
+        METRICS.reset()
+
+    assert "hmac_index;dur=" in resp.headers["Server-Timing"]
+    assert 'nid_stage_duration_seconds_count{stage="search"} 1' in metrics
+    assert 'nid_storage_decrypt_total{key_version="v1"} 1' in metrics
+    assert "nid_transport_in_flight 0" in metrics
@@ -0,0 +1,53 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from infrastructure.crypto_service import CryptoService
+from commands.import_profiles import ProfileImporter, read_records, prepare_chunk
+
+@pytest.fixture
+def crypto_service(crypto_env):
+    return CryptoService()
+
+def test_read_records_streams_csv_and_ndjson(tmp_path):
+    csv_path = tmp_path / "legacy.csv"
+    csv_path.write_text("national_id\n1234567890123\n3210987654321\n")
+    ndjson_path = tmp_path / "legacy.ndjson"
+    ndjson_path.write_text('{"national_id": "1234567890123"}\n\nnot json\n')
+
+    assert list(read_records(str(csv_path))) == [
+        (1, {"national_id": "1234567890123"}), (2, {"national_id": "3210987654321"})
+    ]
+    assert list(read_records(str(ndjson_path))) == [(1, {"national_id": "1234567890123"}), (2, {})]
+
+def test_prepare_chunk_decrypts_transport_records(crypto_service, make_transport_payload):
+    records = [(1, make_transport_payload("1234567890123")), (2, {"national_id": "abc"}), (3, {"national_id": "x", "iv": "y"})]
+
+    accepted, rejected = prepare_chunk(records, "transport", crypto_service)
+
+    assert [(no, crypto_service.decrypt_from_storage(blob)) for no, blob, _ in accepted] == [(1, "1234567890123")]
+    assert rejected == [(2, "Missing encrypted_key or iv"), (3, "Missing encrypted_key or iv")]
+
+def test_import_reports_duplicates_and_rejects(crypto_service, tmp_path):
+    existing = crypto_service.hash_for_index("1111111111111")
+    repository = MagicMock()
+    repository.copy_user_profiles.side_effect = lambda rows: {index for _, index in rows if index != existing}
+    records = [
+        (1, {"national_id": "1234567890123"}),
+        (2, {"national_id": "123"}),
+        (3, {"national_id": "1234567890123"}),
+        (4, {"national_id": "1111111111111"}),
+        (5, {}),
+    ]
+    rejects_path = tmp_path / "rejects.ndjson"
+
+    importer = ProfileImporter(repository, crypto_service, workers=0, chunk_size=10, rejects_path=str(rejects_path))
+    stats = importer.run(iter(records))
+
+    assert stats.to_dict()["imported"] == 1
+    assert (stats.read, stats.duplicates, stats.rejected) == (5, 2, 2)
+    [rows] = repository.copy_user_profiles.call_args.args
+    assert len(rows) == 2
+    side = [json.loads(line) for line in rejects_path.read_text().splitlines()]
+    assert sorted((entry["record"], entry["status"]) for entry in side) == [
+        (2, "rejected"), (3, "duplicate"), (4, "duplicate"), (5, "rejected")
+    ]
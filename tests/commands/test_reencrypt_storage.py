@@ -0,0 +1,95 @@
+import os
+import json
+import base64
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from commands.reencrypt_storage import StorageReencryptionMigrator
+from infrastructure.crypto_service import CryptoService
+from infrastructure.storage_cipher_adapters import StorageCipherAdapter
+
+class LegacyStorageCipher(StorageCipherAdapter):
+    """Stands in for a retired DEK version."""
+    def __init__(self):
+        self.aesgcm = AESGCM(AESGCM.generate_key(bit_length=256))
+
+    @property
+    def version_prefix(self) -> bytes:
+        return b"v0:"
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        nonce = os.urandom(12)
+        return b"v0:" + nonce + self.aesgcm.encrypt(nonce, plaintext, None)
+
+    def decrypt(self, blob: bytes) -> bytes:
+        return self.aesgcm.decrypt(blob[3:15], blob[15:], None)
+
+class InMemoryProfiles:
+    def __init__(self, rows):
+        self.rows = dict(rows)
+
+    def iter_profile_batches(self, after_id=0, batch_size=500):
+        ids = sorted(i for i in self.rows if i > after_id)
+        for start in range(0, len(ids), batch_size):
+            yield [(i, self.rows[i]) for i in ids[start:start + batch_size]]
+
+    def update_blobs(self, updates):
+        updated = 0
+        for row_id, old_blob, new_blob in updates:
+            if self.rows[row_id] == old_blob:
+                self.rows[row_id] = new_blob
+                updated += 1
+        return updated
+
+@pytest.fixture
+def crypto_service(crypto_env):
+    service = CryptoService()
+    service.legacy = LegacyStorageCipher()
+    service.key_registry.register(service.legacy)
+    return service
+
+def _legacy_blob(service, plaintext):
+    return base64.b64encode(service.legacy.encrypt(plaintext.encode())).decode()
+
+def test_reencrypts_legacy_rows_only(crypto_service, tmp_path):
+    current = crypto_service.encrypt_for_storage("2222222222222")
+    repo = InMemoryProfiles({
+        1: _legacy_blob(crypto_service, "1111111111111"),
+        2: current,
+        3: _legacy_blob(crypto_service, "3333333333333"),
+    })
+    checkpoint = tmp_path / "ckpt.json"
+
+    progress = StorageReencryptionMigrator(
+        crypto_service, repo, batch_size=2, workers=2, checkpoint_path=str(checkpoint)
+    ).run()
+
+    assert (progress.scanned, progress.reencrypted, progress.skipped, progress.failed) == (3, 2, 1, 0)
+    assert repo.rows[2] == current
+    for row_id in (1, 3):
+        assert base64.b64decode(repo.rows[row_id]).startswith(b"v1:")
+    assert crypto_service.decrypt_from_storage(repo.rows[3]) == "3333333333333"
+    assert json.loads(checkpoint.read_text())["last_id"] == 3
+
+def test_resumes_from_checkpoint(crypto_service, tmp_path):
+    repo = InMemoryProfiles({i: _legacy_blob(crypto_service, "1111111111111") for i in range(1, 5)})
+    checkpoint = tmp_path / "ckpt.json"
+    checkpoint.write_text(json.dumps({"last_id": 2, "scanned": 2, "reencrypted": 2}))
+
+    progress = StorageReencryptionMigrator(
+        crypto_service, repo, batch_size=10, workers=1, checkpoint_path=str(checkpoint)
+    ).run()
+
+    assert progress.scanned == 4
+    assert progress.reencrypted == 4
+    assert base64.b64decode(repo.rows[1]).startswith(b"v0:")
+    assert base64.b64decode(repo.rows[4]).startswith(b"v1:")
+
+def test_undecryptable_rows_are_counted_not_fatal(crypto_service, tmp_path):
+    repo = InMemoryProfiles({1: base64.b64encode(b"v0:" + b"\0" * 40).decode()})
+
+    progress = StorageReencryptionMigrator(
+        crypto_service, repo, checkpoint_path=str(tmp_path / "ckpt.json")
+    ).run()
+
+    assert progress.failed == 1
+    assert progress.reencrypted == 0
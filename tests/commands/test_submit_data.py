@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import MagicMock
+from commands.submit_data import SubmitBatchCommandHandler
+from domain.models import SubmitUserRequestModel
+from infrastructure.crypto_service import CryptoService
+
+@pytest.fixture
+def crypto_service(crypto_env):
+    return CryptoService()
+
+def test_batch_reports_status_per_item(crypto_service, make_transport_payload):
+    repository = MagicMock()
+    existing = crypto_service.hash_for_index("1111111111111")
+    # Everything inserts except the ID that is already stored
+    repository.save_user_profiles.side_effect = lambda rows: {i for _, i in rows if i != existing}
+    commands = [
+        SubmitUserRequestModel(**make_transport_payload("1234567890123")),
+        SubmitUserRequestModel(**make_transport_payload("12345")),
+        SubmitUserRequestModel(**make_transport_payload("1111111111111")),
+        SubmitUserRequestModel(**make_transport_payload("1234567890123")),
+        SubmitUserRequestModel(national_id="bm9wZQ==", encrypted_key="bm9wZQ==", iv="bm9wZQ=="),
+    ]
+
+    results = SubmitBatchCommandHandler(crypto_service, repository).handle(commands)
+
+    assert [r["status"] for r in results] == ["created", "invalid", "duplicate", "duplicate", "invalid"]
+    assert "13 digits" in results[1]["error"]
+    # One multi-row write for the two distinct valid IDs
+    repository.save_user_profiles.assert_called_once()
+    assert len(repository.save_user_profiles.call_args.args[0]) == 2
+
+def test_batch_without_valid_items_skips_db(crypto_service, make_transport_payload):
+    repository = MagicMock()
+
+    results = SubmitBatchCommandHandler(crypto_service, repository).handle(
+        [SubmitUserRequestModel(**make_transport_payload("abc"))]
+    )
+
+    assert results[0]["status"] == "invalid"
+    repository.save_user_profiles.assert_not_called()
+
+def test_submit_rejects_filtered_duplicate_before_storage_encryption(crypto_service, make_transport_payload):
+    from commands.submit_data import SubmitCommandHandler
+    repository = MagicMock()
+    repository.index_filter.might_contain.return_value = True
+    repository.find_by_hash.return_value = [(1, "blob")]
+    crypto_service.encrypt_for_storage = MagicMock()
+
+    with pytest.raises(ValueError, match="already exists"):
+        SubmitCommandHandler(crypto_service, repository).handle(
+            SubmitUserRequestModel(**make_transport_payload("1234567890123"))
+        )
+
+    crypto_service.encrypt_for_storage.assert_not_called()
+    repository.save_user_profile.assert_not_called()
+
+def test_submit_skips_duplicate_check_on_definite_miss(crypto_service, make_transport_payload):
+    from commands.submit_data import SubmitCommandHandler
+    repository = MagicMock()
+    repository.index_filter.might_contain.return_value = False
+
+    SubmitCommandHandler(crypto_service, repository).handle(
+        SubmitUserRequestModel(**make_transport_payload("1234567890123"))
+    )
+
+    repository.find_by_hash.assert_not_called()
+    repository.save_user_profile.assert_called_once()
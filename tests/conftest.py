@@ -0,0 +1,43 @@
+import os
+import base64
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+@pytest.fixture(scope="session")
+def rsa_private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+@pytest.fixture
+def crypto_env(monkeypatch, rsa_private_key):
+    # Full key set for a real CryptoService (transport + storage + index)
+    pem = rsa_private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    monkeypatch.setenv("PRIVATE_KEY_PATH", "does-not-exist.pem")
+    monkeypatch.setenv("PRIVATE_KEY_CONTENT", pem.decode())
+    monkeypatch.setenv("DEK_KEY", "MDEyMzQ1Njc4OTAxMjM0NTY3ODkwMTIzNDU2Nzg5MDE=")
+    monkeypatch.setenv("HMAC_KEY", "NmE0OWM1YjYyMDNmNDYyZDFjMmY0MjAxMGQwYzNiYjU=")
+
+@pytest.fixture
+def make_transport_payload(rsa_private_key):
+    """Builds a client-side hybrid payload the way the frontend does."""
+    public_key = rsa_private_key.public_key()
+
+    def _make(plaintext: str) -> dict:
+        key = AESGCM.generate_key(bit_length=256)
+        iv = os.urandom(12)
+        ciphertext = AESGCM(key).encrypt(iv, plaintext.encode(), None)
+        wrapped = public_key.encrypt(
+            key,
+            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+        )
+        return {
+            "national_id": base64.b64encode(ciphertext).decode(),
+            "encrypted_key": base64.b64encode(wrapped).decode(),
+            "iv": base64.b64encode(iv).decode(),
+        }
+    return _make
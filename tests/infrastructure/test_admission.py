@@ -0,0 +1,88 @@
+import time
+import threading
+import pytest
+from infrastructure.admission import (AdmissionController, AdmissionRejected, ClientRateLimiter, RoutePolicy,
+                                     parse_limits)
+
+def controller(max_concurrent=1, **kwargs):
+    policies = {
+        "search": RoutePolicy("search", 1, 4, 2.0, priority=1),
+        "submit": RoutePolicy("submit", 1, 4, 2.0, priority=2),
+    }
+    return AdmissionController(policies, max_concurrent, **kwargs)
+
+def queue_in_thread(ctrl, name, admitted):
+    def run():
+        ctrl.admit(name)
+        admitted.append(name)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+def test_freed_slot_goes_to_higher_priority_waiter():
+    ctrl = controller()
+    ctrl.admit("submit")
+    admitted = []
+    threads = [queue_in_thread(ctrl, "submit", admitted)]
+    wait_until(lambda: ctrl.describe()["routes"]["submit"]["queued"] == 1)
+    threads.append(queue_in_thread(ctrl, "search", admitted))
+    wait_until(lambda: ctrl.describe()["routes"]["search"]["queued"] == 1)
+
+    ctrl.release("submit", 0.01)
+    wait_until(lambda: admitted)
+    ctrl.release("search", 0.01)
+    for thread in threads:
+        thread.join(2)
+
+    assert admitted == ["search", "submit"]
+
+def test_full_queue_is_shed_immediately_with_retry_after():
+    policies = {"submit": RoutePolicy("submit", 1, 0, 2.0, priority=2)}
+    ctrl = AdmissionController(policies, 4)
+    ctrl.admit("submit")
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as e:
+        ctrl.admit("submit")
+
+    assert time.monotonic() - started < 0.1
+    assert (e.value.reason, e.value.status_code, e.value.retry_after) == ("queue_full", 503, 2)
+    assert ctrl.describe()["routes"]["submit"]["shed"]["queue_full"] == 1
+
+def test_waiter_gives_up_at_deadline_and_slow_routes_are_shed_early():
+    policies = {"submit": RoutePolicy("submit", 1, 4, 0.05, priority=2)}
+    ctrl = AdmissionController(policies, 4)
+    ctrl.admit("submit")
+
+    with pytest.raises(AdmissionRejected, match="timeout"):
+        ctrl.admit("submit")
+    ctrl.release("submit", 1.0)  # average service time now far above max_wait
+    ctrl.admit("submit")
+    with pytest.raises(AdmissionRejected, match="deadline"):
+        ctrl.admit("submit")
+
+    assert ctrl.describe()["routes"]["submit"]["queued"] == 0
+
+def test_client_over_its_rate_gets_429():
+    ctrl = controller(max_concurrent=4, rate_limiter=ClientRateLimiter(rate=1, burst=2))
+    for _ in range(2):
+        ctrl.admit("search", "10.0.0.1")
+        ctrl.release("search", 0.0)
+
+    with pytest.raises(AdmissionRejected) as e:
+        ctrl.admit("search", "10.0.0.1")
+    ctrl.admit("search", "10.0.0.2")
+
+    assert e.value.status_code == 429
+
+def test_limits_override_defaults():
+    policies = parse_limits("submit=2:8:1.5", {"submit": RoutePolicy("submit", 1, 1, 1.0, priority=2)})
+
+    assert (policies["submit"].max_concurrent, policies["submit"].max_queue, policies["submit"].priority) == (2, 8, 2)
+    with pytest.raises(ValueError):
+        parse_limits("submit=2", policies)
@@ -1,6 +1,7 @@
 import pytest
 import os
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 from infrastructure.crypto_service import CryptoService
 
@@ -52,3 +53,46 @@ def test_hash_for_index_deterministic(mock_env_keys, monkeypatch):
         
         assert hash1 == hash2
         assert hash1 != input_text
+
+def test_batch_methods_match_per_item(mock_env_keys, monkeypatch):
+    with patch.object(CryptoService, '_load_private_key'):
+        service = CryptoService()
+
+        values = [f"{i:013d}" for i in range(5)]
+        blobs = service.encrypt_for_storage_many(values)
+
+        assert service.decrypt_from_storage_many(blobs) == values
+        assert [service.decrypt_from_storage(b) for b in blobs] == values
+        assert service.hash_for_index_many(values) == [service.hash_for_index(v) for v in values]
+        assert service.reencrypt_for_storage_many(blobs) == [None] * 5
+
+def test_batch_methods_split_across_threads(mock_env_keys, monkeypatch):
+    monkeypatch.setenv("CRYPTO_BATCH_WORKERS", "3")
+    monkeypatch.setenv("CRYPTO_BATCH_CHUNK_SIZE", "4")
+    with patch.object(CryptoService, '_load_private_key'):
+        service = CryptoService()
+
+        values = [f"{i:013d}" for i in range(10)]
+        blobs = service.encrypt_for_storage_many(values)
+
+        assert service._batch_executor is not None
+        assert service.decrypt_from_storage_many(blobs) == values
+        assert service.hash_for_index_many(values) == [service.hash_for_index(v) for v in values]
+
+        # Concurrent first batches share one executor; shutdown() stops it
+        with patch('infrastructure.crypto_service.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor_cls:
+            service._batch_executor = None
+            with ThreadPoolExecutor(max_workers=8) as callers:
+                list(callers.map(lambda _: service.hash_for_index_many(values), range(8)))
+        assert executor_cls.call_count == 1
+        service.shutdown()
+        assert service._batch_executor is None
+
+def test_transport_backend_only_from_env_when_asked(mock_env_keys, monkeypatch):
+    monkeypatch.setenv("TRANSPORT_DECRYPT_BACKEND", "thread")
+    with patch.object(CryptoService, '_load_private_key'):
+        assert CryptoService().transport_decryptor.backend == "inline"
+        service = CryptoService(transport_from_env=True)
+        assert service._transport_decryptor is None
+        assert service.transport_decryptor.backend == "thread"
+        service.shutdown()
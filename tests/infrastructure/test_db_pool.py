@@ -0,0 +1,90 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import psycopg2
+from psycopg2 import extensions
+from infrastructure.db_pool import ConnectionPool, PoolExhaustedError
+
+def _fake_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+@pytest.fixture
+def mock_connect():
+    with patch('psycopg2.connect', side_effect=lambda *a, **k: _fake_conn()) as connect:
+        yield connect
+
+def test_min_size_opened_on_first_use(mock_connect):
+    pool = ConnectionPool("dsn", min_size=2, max_size=4)
+
+    with pool.connection():
+        pass
+
+    assert mock_connect.call_count == 2
+    assert pool.size == 2
+    assert pool.idle_count == 2
+
+def test_acquire_times_out_when_exhausted(mock_connect):
+    pool = ConnectionPool("dsn", min_size=0, max_size=1, acquire_timeout=0.01)
+    conn = pool.acquire()
+
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+def test_unhealthy_connection_replaced(mock_connect):
+    pool = ConnectionPool("dsn", min_size=0, max_size=1, health_check_interval=0)
+    conn = pool.acquire()
+    conn.raw.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError()
+    pool.release(conn)
+
+    fresh = pool.acquire()
+
+    assert fresh is not conn
+    conn.raw.close.assert_called_once()
+    assert pool.size == 1
+
+def test_expired_connection_recycled_on_release(mock_connect):
+    pool = ConnectionPool("dsn", min_size=0, max_size=1, max_lifetime=0)
+    conn = pool.acquire()
+
+    pool.release(conn)
+
+    conn.raw.close.assert_called_once()
+    assert pool.size == 0
+
+def test_open_transaction_rolled_back_on_release(mock_connect):
+    pool = ConnectionPool("dsn", min_size=0, max_size=1)
+    conn = pool.acquire()
+    conn.raw.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_INERROR
+
+    pool.release(conn)
+
+    conn.raw.rollback.assert_called_once()
+    assert pool.idle_count == 1
+
+def test_operational_error_discards_connection(mock_connect):
+    pool = ConnectionPool("dsn", min_size=0, max_size=1)
+
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError("server closed the connection")
+
+    assert pool.size == 0
+
+def test_failed_fill_releases_reserved_slots():
+    pool = ConnectionPool("dsn", min_size=4, max_size=4, acquire_timeout=0.01)
+    with patch('psycopg2.connect', side_effect=psycopg2.OperationalError("db down")):
+        with pytest.raises(psycopg2.OperationalError):
+            pool.acquire()
+    assert pool.size == 0
+
+    # Once the DB is back the pool refills and every slot is usable
+    with patch('psycopg2.connect', side_effect=lambda *a, **k: _fake_conn()):
+        conns = [pool.acquire() for _ in range(4)]
+    assert pool.size == 4
+    for conn in conns:
+        pool.release(conn)
@@ -0,0 +1,83 @@
+import os
+import base64
+import pytest
+from infrastructure.dek_cache import DekCache, EnvelopeStorageCipher
+from infrastructure.key_providers import LocalKekProvider, KmsKekProvider, KeyProviderError
+from infrastructure.key_registry import KeyRegistry
+from infrastructure.storage_cipher_adapters import VersionedStorageCipher, derive_key
+
+class CountingProvider(LocalKekProvider):
+    def __init__(self, kek):
+        super().__init__(kek)
+        self.unwrapped = []
+
+    def unwrap(self, wrapped, context):
+        key = super().unwrap(wrapped, context)
+        self.unwrapped.append(key)
+        return key
+
+@pytest.fixture
+def provider():
+    return CountingProvider(os.urandom(32))
+
+def test_provider_is_called_once_not_per_record(provider):
+    cache = DekCache(provider)
+    adapter = EnvelopeStorageCipher("v2", provider.wrap(os.urandom(32), "v2"), cache)
+
+    blobs = [adapter.encrypt(b"1234567890123") for _ in range(50)]
+    blobs += [adapter.encrypt_binary(b"1234567890123") for _ in range(50)]
+
+    assert all(adapter.decrypt(b) == b"1234567890123" for b in blobs[:50])
+    assert all(adapter.decrypt_binary(b) == b"1234567890123" for b in blobs[50:])
+    assert len(provider.unwrapped) == 1
+
+def test_expired_and_evicted_keys_are_zeroized(provider):
+    cache = DekCache(provider, ttl=0, max_entries=1)
+    wrapped = {v: provider.wrap(os.urandom(32), v) for v in ("v1", "v2")}
+
+    cache.aead("v1", wrapped["v1"])
+    cache.aead("v1", wrapped["v1"])  # ttl=0: already expired, unwrapped again
+    cache.aead("v2", wrapped["v2"])  # evicts v1
+
+    first, second, third = provider.unwrapped
+    assert first == bytearray(32) and second == bytearray(32)
+    assert third != bytearray(32)
+    cache.clear()
+    assert third == bytearray(32) and len(cache) == 0
+
+def test_wrapped_dek_is_bound_to_its_version(provider):
+    wrapped = provider.wrap(os.urandom(32), "v1")
+
+    with pytest.raises(KeyProviderError):
+        provider.unwrap(wrapped, "v2")
+
+def test_registry_from_wrapped_keys_reads_legacy_blobs(monkeypatch):
+    kek = os.urandom(32)
+    legacy = VersionedStorageCipher("v1", derive_key("old-secret"))
+    provider = LocalKekProvider(kek)
+    monkeypatch.setenv("KEK_KEY", base64.b64encode(kek).decode())
+    monkeypatch.setenv("DEK_WRAPPED_KEYS", ",".join(
+        f"{v}:{base64.b64encode(provider.wrap(key, v)).decode()}"
+        for v, key in (("v1", derive_key("old-secret")), ("v2", os.urandom(32)))
+    ))
+
+    registry = KeyRegistry.from_env()
+    blob = legacy.encrypt(b"1234567890123")
+
+    assert registry.versions == ["v1", "v2"] and registry.active.version == "v2"
+    assert registry.adapter_for(blob).decrypt(blob) == b"1234567890123"
+    assert registry.dek_cache.unwraps == 2
+
+def test_mock_kms_process_round_trip():
+    from infrastructure.mock_kms import start_mock_kms
+    process, address = start_mock_kms({"storage": os.urandom(32)}, b"test-authkey")
+    try:
+        client = KmsKekProvider(address, b"test-authkey")
+        dek = os.urandom(32)
+
+        assert client.unwrap(client.wrap(dek, "v1"), "v1") == dek
+        with pytest.raises(KeyProviderError):
+            KmsKekProvider(address, b"wrong-authkey").wrap(dek, "v1")
+    finally:
+        process.terminate()
+        process.join()
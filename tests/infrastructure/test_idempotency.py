@@ -0,0 +1,51 @@
+import time
+import threading
+from infrastructure.idempotency import (InMemoryIdempotencyStore, SharedIdempotencyStore, IN_FLIGHT, DONE,
+                                        idempotency_key, request_fingerprint, stored_response)
+from infrastructure.search_cache import LocalSharedStore
+
+def test_key_header_wins_over_fingerprint_and_reuse_with_other_payload_is_rejected():
+    first = request_fingerprint({"national_id": "a", "encrypted_key": "k", "iv": "i"})
+    second = request_fingerprint({"national_id": "b", "encrypted_key": "k", "iv": "i"})
+    store = InMemoryIdempotencyStore()
+    key = idempotency_key("submit", "retry-1", first)
+
+    assert store.claim(key, first) is None
+    store.complete(key, first, 200, {"status": "success"})
+
+    assert key == idempotency_key("submit", "retry-1", second)
+    assert stored_response(store.claim(key, first), first) == (200, {"status": "success"})
+    assert stored_response(store.claim(key, second), second)[0] == 422
+
+def test_duplicate_waits_for_in_flight_result():
+    store = InMemoryIdempotencyStore(wait_timeout=5)
+    assert store.claim("k", "fp") is None
+    timer = threading.Timer(0.1, store.complete, ("k", "fp", 200, {"status": "success"}))
+    timer.start()
+
+    record = store.claim_or_wait("k", "fp")
+
+    assert record["state"] == DONE and record["body"] == {"status": "success"}
+
+def test_released_claim_lets_the_duplicate_run():
+    store = InMemoryIdempotencyStore(wait_timeout=5)
+    store.claim("k", "fp")
+    threading.Timer(0.1, store.release, ("k",)).start()
+
+    assert store.claim_or_wait("k", "fp") is None
+    assert store.claim("k", "fp")["state"] == IN_FLIGHT
+
+def test_stale_in_flight_marker_expires():
+    store = InMemoryIdempotencyStore(in_flight_ttl=0.05, wait_timeout=0)
+    store.claim("k", "fp")
+    time.sleep(0.06)
+
+    assert store.claim("k", "fp") is None
+
+def test_shared_store_claims_atomically():
+    store = SharedIdempotencyStore(LocalSharedStore(), wait_timeout=0)
+
+    assert store.claim("k", "fp") is None
+    assert store.claim("k", "fp")["state"] == IN_FLIGHT
+    store.complete("k", "fp", 409, {"error": "National ID already exists"})
+    assert stored_response(store.claim_or_wait("k", "fp"), "fp") == (409, {"error": "National ID already exists"})
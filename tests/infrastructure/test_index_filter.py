@@ -0,0 +1,131 @@
+import os
+import time
+import base64
+import hashlib
+import pytest
+import psycopg2
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from infrastructure.index_filter import BloomFilter, IndexMembershipFilter
+
+def _index(i: int) -> str:
+    return base64.b64encode(hashlib.sha256(str(i).encode()).digest()).decode()
+
+def test_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=2000, fp_rate=0.01)
+    for i in range(2000):
+        bloom.add(_index(i))
+
+    assert all(bloom.might_contain(_index(i)) for i in range(2000))
+    false_positives = sum(bloom.might_contain(_index(i)) for i in range(2000, 12000))
+    assert false_positives < 300  # ~1% expected
+
+def test_snapshot_roundtrip():
+    bloom = BloomFilter(capacity=100)
+    bloom.add(_index(1))
+
+    restored, last_id = BloomFilter.from_bytes(bloom.to_bytes(last_id=42))
+
+    assert last_id == 42
+    assert restored.might_contain(_index(1))
+    assert restored.count == 1
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(b"garbage")
+
+def _repository(rows):
+    repository = MagicMock()
+    repository.iter_index_batches.side_effect = lambda after_id: iter(
+        [[r for r in rows if r[0] > after_id]] if any(r[0] > after_id for r in rows) else []
+    )
+    repository.index_watermark.side_effect = lambda after_id: (
+        max([r[0] for r in rows if r[0] > after_id], default=0), sum(r[0] > after_id for r in rows)
+    )
+    return repository
+
+def test_warm_scans_rows_and_saves_snapshot(tmp_path):
+    rows = [(1, _index(1)), (2, _index(2))]
+    snapshot = tmp_path / "filter.bin"
+    index_filter = IndexMembershipFilter(_repository(rows), capacity=100, snapshot_path=str(snapshot))
+
+    with patch('infrastructure.index_filter.atexit.register'):
+        index_filter.warm()
+
+    assert index_filter.might_contain(_index(1))
+    assert index_filter.last_id == 2
+    assert snapshot.exists()
+
+    # A warm start only scans rows after the snapshot's last id
+    rows.append((3, _index(3)))
+    repository = _repository(rows)
+    restarted = IndexMembershipFilter(repository, capacity=100, snapshot_path=str(snapshot))
+    with patch('infrastructure.index_filter.atexit.register'):
+        restarted.warm()
+    repository.iter_index_batches.assert_called_once_with(2)
+    assert restarted.might_contain(_index(3))
+
+def test_concurrent_snapshot_saves_never_fail_or_corrupt(tmp_path):
+    snapshot = tmp_path / "filter.bin"
+    filters = []
+    for _ in range(4):
+        index_filter = IndexMembershipFilter(_repository([(1, _index(1))]), capacity=100, snapshot_path=str(snapshot))
+        index_filter._scan(0)
+        filters.append(index_filter)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda f: [f.save_snapshot() for _ in range(20)], filters))
+
+    bloom, last_id = BloomFilter.from_bytes(snapshot.read_bytes())
+    assert last_id == 1 and bloom.might_contain(_index(1))
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_unwritable_snapshot_does_not_stop_warm(tmp_path):
+    snapshot = tmp_path / "missing-dir" / "filter.bin"
+    index_filter = IndexMembershipFilter(_repository([(1, _index(1))]), capacity=100,
+                                         snapshot_path=str(snapshot), refresh_interval=0)
+
+    with patch('infrastructure.index_filter.atexit.register'):
+        index_filter.warm()
+
+    assert index_filter.ready and not snapshot.exists()
+
+def test_refresh_skips_rescan_until_the_watermark_moves():
+    rows = [(5, _index(5))]
+    repository = _repository(rows)
+    index_filter = IndexMembershipFilter(repository, capacity=100, refresh_interval=0, refresh_lookback=10)
+    index_filter.warm()
+
+    index_filter.refresh()
+    index_filter.refresh()
+    assert repository.iter_index_batches.call_count == 2  # warm + first refresh
+
+    rows.append((3, _index(3)))  # lower id committed late
+    index_filter.refresh()
+    assert repository.iter_index_batches.call_count == 3
+    assert index_filter.bloom.might_contain(_index(3))
+
+def test_background_refresh_picks_up_other_workers_inserts():
+    rows = []
+    index_filter = IndexMembershipFilter(_repository(rows), capacity=100, refresh_interval=0.02)
+    index_filter.warm()
+    try:
+        rows.append((7, _index(7)))  # inserted by another worker
+        deadline = time.monotonic() + 2
+        while not index_filter.bloom.might_contain(_index(7)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert index_filter.might_contain(_index(7))
+    finally:
+        index_filter.stop()
+
+def test_miss_never_queries_db_and_stale_filter_answers_maybe():
+    repository = _repository([(1, _index(1))])
+    index_filter = IndexMembershipFilter(repository, capacity=100, refresh_interval=60)
+    index_filter.warm()
+    index_filter.stop()
+    repository.iter_index_batches.reset_mock()
+    repository.iter_index_batches.side_effect = psycopg2.OperationalError("server closed the connection")
+
+    assert not index_filter.might_contain(_index(2))
+
+    index_filter._last_refresh -= 3600  # refreshes have been failing
+    assert index_filter.might_contain(_index(2))
+    repository.iter_index_batches.assert_not_called()
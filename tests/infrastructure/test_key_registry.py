@@ -0,0 +1,53 @@
+import pytest
+from infrastructure.key_registry import KeyRegistry
+from infrastructure.storage_cipher_adapters import VersionedStorageCipher
+
+def test_from_env_falls_back_to_single_dek(monkeypatch):
+    monkeypatch.delenv("DEK_KEYS", raising=False)
+    monkeypatch.setenv("DEK_KEY", "secret")
+
+    registry = KeyRegistry.from_env()
+
+    assert registry.versions == ["v1"]
+    assert registry.active.version == "v1"
+
+def test_from_env_loads_multiple_versions(monkeypatch):
+    monkeypatch.setenv("DEK_KEYS", "v1:old-secret, v2:new-secret")
+    monkeypatch.setenv("DEK_ACTIVE_VERSION", "v2")
+
+    registry = KeyRegistry.from_env()
+
+    assert registry.versions == ["v1", "v2"]
+    assert registry.active.version == "v2"
+
+def test_dispatches_by_prefix(monkeypatch):
+    monkeypatch.setenv("DEK_KEYS", "v1:old-secret,v2:new-secret,v10:newest-secret")
+    registry = KeyRegistry.from_env()
+    blobs = {a.version: a.encrypt(b"1234567890123") for a in registry.adapters}
+
+    for version, blob in blobs.items():
+        adapter = registry.adapter_for(blob)
+        assert adapter.version == version
+        assert adapter.decrypt(blob) == b"1234567890123"
+    assert registry.is_active(blobs["v10"])
+    assert not registry.is_active(blobs["v1"])
+
+def test_unknown_version_rejected():
+    registry = KeyRegistry([VersionedStorageCipher("v1", b"k" * 32)])
+
+    with pytest.raises(ValueError, match="Unknown storage encryption version"):
+        registry.adapter_for(b"v9:" + b"\0" * 40)
+    with pytest.raises(ValueError, match="Unknown storage encryption version"):
+        registry.adapter_for(b"\0" * 40)
+
+def test_activate_requires_registered_version():
+    registry = KeyRegistry([VersionedStorageCipher("v1", b"k" * 32)])
+
+    with pytest.raises(ValueError):
+        registry.activate("v2")
+
+def test_malformed_dek_keys_rejected(monkeypatch):
+    monkeypatch.setenv("DEK_KEYS", "v1")
+
+    with pytest.raises(ValueError):
+        KeyRegistry.from_env()
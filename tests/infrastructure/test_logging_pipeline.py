@@ -0,0 +1,63 @@
+import io
+import queue
+import logging
+from infrastructure.logging_pipeline import (
+    PiiMaskingFilter, SamplingFilter, DroppingQueueHandler, configure_logging, shutdown_logging, MASK
+)
+
+def make_record(msg, *args, name="infrastructure.crypto_service", level=logging.INFO, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_masking_redacts_ids_and_sensitive_fields_before_queueing():
+    record = make_record("Lookup %s failed: national_id=%s iv=abc==", "1234567890123", "9876543210987",
+                         plaintext="1234567890123", request_id="r-1")
+
+    assert PiiMaskingFilter().filter(record)
+
+    assert record.args is None
+    assert "1234567890123" not in record.msg and "9876543210987" not in record.msg
+    assert f"national_id={MASK}" in record.msg and f"iv={MASK}" in record.msg
+    assert record.plaintext == MASK
+    assert record.request_id == "r-1"
+
+def test_masking_leaves_other_numbers_alone():
+    record = make_record("Saved %d user profiles after id=%d", 12, 12345678901234)
+
+    PiiMaskingFilter().filter(record)
+
+    assert record.msg == "Saved 12 user profiles after id=12345678901234"
+
+def test_sampling_keeps_every_nth_info_record_per_logger():
+    sampler = SamplingFilter({"infrastructure.crypto_service": 10})
+
+    kept = sum(sampler.filter(make_record("Hashing for index...")) for _ in range(100))
+    other = sum(sampler.filter(make_record("Found 1 profiles", name="infrastructure.repository")) for _ in range(5))
+    warnings = sum(sampler.filter(make_record("failed", level=logging.WARNING)) for _ in range(5))
+
+    assert kept == 10
+    assert other == 5
+    assert warnings == 5
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+
+    handler.emit(make_record("first"))
+    handler.emit(make_record("second"))
+
+    assert handler.dropped == 1
+
+def test_pipeline_writes_masked_lines_from_background_thread():
+    shutdown_logging()
+    stream = io.StringIO()
+    pipeline = configure_logging(stream=stream, level="INFO")
+    try:
+        assert configure_logging() is pipeline
+        logging.getLogger("api.ingress").info("Search for %s", "1103700012345")
+    finally:
+        shutdown_logging()
+
+    output = stream.getvalue()
+    assert "Search for [REDACTED]" in output
+    assert "1103700012345" not in output
@@ -0,0 +1,44 @@
+import pytest
+from infrastructure.metrics import StageMetrics
+
+def test_disabled_metrics_record_nothing():
+    metrics = StageMetrics()
+
+    with metrics.stage("hmac_index"):
+        pass
+    metrics.count("storage_decrypt_total", key_version="v1")
+
+    assert metrics.stage("a") is metrics.stage("b")  # shared no-op
+    assert "nid_stage_duration_seconds_count" not in metrics.render()
+
+def test_stage_histograms_and_error_counters_render_as_prometheus():
+    metrics = StageMetrics(enabled=True)
+
+    with metrics.stage("storage_encrypt", key_version="v2"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.stage("db_insert"):
+            raise ValueError("National ID already exists")
+    metrics.count("storage_decrypt_total", 3, key_version="v1")
+    metrics.set_gauge_source("test", lambda: [("transport_queue_depth", {}, 4)])
+
+    text = metrics.render()
+    assert 'nid_stage_duration_seconds_count{stage="storage_encrypt",key_version="v2"} 1' in text
+    assert 'nid_stage_duration_seconds_bucket{stage="db_insert",le="+Inf"} 1' in text
+    assert 'nid_stage_errors_total{stage="db_insert"} 1' in text
+    assert 'nid_storage_decrypt_total{key_version="v1"} 3' in text
+    assert "nid_transport_queue_depth 4" in text
+
+def test_server_timing_collects_stages_for_one_request():
+    metrics = StageMetrics()
+    metrics.configure(enabled=True, server_timing=True)
+
+    token = metrics.begin_request()
+    with metrics.stage("hmac_index"):
+        pass
+    with metrics.stage("db_lookup"):
+        pass
+    header = metrics.end_request(token)
+
+    assert [part.split(";")[0] for part in header.split(", ")] == ["hmac_index", "db_lookup"]
+    assert metrics.end_request(metrics.begin_request()) is None
@@ -0,0 +1,84 @@
+import pytest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+import psycopg2
+from psycopg2 import extensions
+from infrastructure.db_pool import ConnectionPool, PoolExhaustedError
+from infrastructure.replica_router import ReplicaRouter
+from infrastructure.repository import Repository
+
+class FakePool:
+    def __init__(self, name, fail=False, exhausted=False):
+        self.name = name
+        self.fail = fail
+        self.exhausted = exhausted
+        self.size = 1
+        self.reads = 0
+
+    @contextmanager
+    def connection(self):
+        if self.fail:
+            raise psycopg2.OperationalError("could not connect to server")
+        if self.exhausted:
+            raise PoolExhaustedError("no free connection")
+        self.reads += 1
+        yield self.name
+
+def test_round_robin_spreads_reads_across_replicas():
+    replicas = [FakePool("r1"), FakePool("r2")]
+    router = ReplicaRouter(replicas)
+
+    served = [router.read(lambda conn: conn, FakePool("primary"))[1] for _ in range(4)]
+
+    assert sorted(served) == ["r1", "r1", "r2", "r2"]
+
+def test_least_connections_prefers_idle_replica():
+    router = ReplicaRouter([FakePool("r1"), FakePool("r2")], strategy="least_connections")
+    router.nodes[0].in_flight = 3
+
+    assert [router.read(lambda conn: conn, FakePool("primary"))[1] for _ in range(3)] == ["r2"] * 3
+
+def test_failed_replica_is_skipped_then_falls_back_to_primary():
+    broken, healthy = FakePool("r1", fail=True), FakePool("r2")
+    router = ReplicaRouter([broken, healthy], retry_interval=60)
+
+    assert router.read(lambda conn: conn, FakePool("primary")) == ("replica2", "r2")
+    assert router.nodes[0].failures == 1
+
+    healthy.fail = True
+    assert router.read(lambda conn: conn, FakePool("primary")) == ("primary", "primary")
+
+def test_exhausted_replica_is_skipped_but_not_marked_down():
+    busy = FakePool("r1", exhausted=True)
+    router = ReplicaRouter([busy], retry_interval=60)
+
+    assert router.read(lambda conn: conn, FakePool("primary")) == ("primary", "primary")
+    assert router.nodes[0].failures == 0
+
+    busy.exhausted = False
+    assert router.read(lambda conn: conn, FakePool("primary")) == ("replica1", "r1")
+
+def test_recent_write_is_read_from_primary():
+    router = ReplicaRouter([FakePool("r1")], read_your_writes=30)
+
+    router.note_write("idx-new")
+
+    assert router.read(lambda conn: conn, FakePool("primary"), "idx-new")[0] == "primary"
+    assert router.read(lambda conn: conn, FakePool("primary"), "idx-old")[0] == "replica1"
+
+def test_repository_routes_lookups_and_skips_caching_replica_misses():
+    with patch('psycopg2.connect') as mock_connect:
+        conn = MagicMock()
+        conn.closed = 0
+        conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
+        conn.cursor.return_value.__enter__.return_value.fetchall.return_value = []
+        mock_connect.return_value = conn
+        cache = MagicMock()
+        cache.get.return_value = None
+        repo = Repository("primary-dsn", search_cache=cache,
+                          replicas=ReplicaRouter([ConnectionPool("replica-dsn", min_size=0)]))
+
+        assert repo.find_by_hash("idx") == []
+
+    mock_connect.assert_called_once_with("replica-dsn")
+    cache.set.assert_not_called()
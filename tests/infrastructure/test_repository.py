@@ -1,12 +1,15 @@
 import pytest
 from unittest.mock import MagicMock, patch
 import psycopg2
+from psycopg2 import extensions
 from infrastructure.repository import Repository
 
 @pytest.fixture
 def mock_db_conn():
     with patch('psycopg2.connect') as mock_connect:
         mock_conn = MagicMock()
+        mock_conn.closed = 0
+        mock_conn.get_transaction_status.return_value = extensions.TRANSACTION_STATUS_IDLE
         mock_cursor = MagicMock()
         mock_connect.return_value = mock_conn
         mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
@@ -14,40 +17,140 @@ def mock_db_conn():
 
 def test_save_user_profile_success(mock_db_conn):
     mock_connect, mock_conn, mock_cursor = mock_db_conn
-    
+
     repo = Repository()
     repo.save_user_profile("encrypted_blob", "hashed_index")
-    
-    # Verify execute called twice (CREATE TABLE, INSERT)
+
+    # Verify execute called twice (PREPARE, EXECUTE) and no DDL on the write path
     assert mock_cursor.execute.call_count == 2
+    assert "CREATE TABLE" not in str(mock_cursor.execute.call_args_list)
     # Verify commit called
     mock_conn.commit.assert_called_once()
-    # Verify close called
-    mock_conn.close.assert_called_once()
+    # Connection goes back to the pool instead of being closed
+    mock_conn.close.assert_not_called()
+    assert repo.pool.idle_count == 1
 
 def test_save_user_profile_duplicate(mock_db_conn):
     mock_connect, mock_conn, mock_cursor = mock_db_conn
-    
-    # Simulate UniqueViolation on INSERT (2nd call)
+
+    # Simulate UniqueViolation on EXECUTE (2nd call)
     mock_cursor.execute.side_effect = [None, psycopg2.errors.UniqueViolation("Duplicate")]
-    
+
     repo = Repository()
-    
+
     with pytest.raises(ValueError, match="National ID already exists"):
         repo.save_user_profile("blob", "index")
-        
+
     mock_conn.rollback.assert_called_once()
-    mock_conn.close.assert_called_once()
+    assert repo.pool.idle_count == 1
 
 def test_find_by_hash_success(mock_db_conn):
     mock_connect, mock_conn, mock_cursor = mock_db_conn
-    
+
     # Setup return value
     mock_cursor.fetchall.return_value = [(1, "blob_data")]
-    
+
     repo = Repository()
     result = repo.find_by_hash("some_hash")
-    
+
     assert len(result) == 1
     assert result[0] == (1, "blob_data")
-    mock_conn.close.assert_called_once()
+    mock_conn.close.assert_not_called()
+
+def test_find_by_hashes_runs_one_array_query_per_chunk(mock_db_conn):
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+    mock_cursor.fetchall.side_effect = [[("h1", 1, "blob1")], []]
+
+    repo = Repository()
+    result = repo.find_by_hashes(["h1", "h2", "h3"], chunk_size=2)
+
+    assert result == {"h1": [(1, "blob1")], "h2": [], "h3": []}
+    executes = [c for c in mock_cursor.execute.call_args_list if "EXECUTE find_by_hashes" in c[0][0]]
+    assert [c[0][1] for c in executes] == [(["h1", "h2"],), (["h3"],)]
+    assert "ANY($1)" in str(mock_cursor.execute.call_args_list[0])
+
+def test_connection_and_statements_are_reused(mock_db_conn):
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+
+    repo = Repository()
+    repo.find_by_hash("a")
+    repo.find_by_hash("b")
+
+    mock_connect.assert_called_once()
+    statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    assert sum(s.startswith("PREPARE") for s in statements) == 1
+    assert sum(s.startswith("EXECUTE") for s in statements) == 2
+
+def test_save_user_profiles_returns_inserted_indexes(mock_db_conn):
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+
+    with patch('infrastructure.repository.execute_values', return_value=[("idx1",)]) as mock_execute_values:
+        repo = Repository()
+        inserted = repo.save_user_profiles([("blob1", "idx1"), ("blob2", "idx2")])
+
+    assert inserted == {"idx1"}
+    sql = mock_execute_values.call_args.args[1]
+    assert "ON CONFLICT (national_id_index) DO NOTHING" in sql
+    mock_conn.commit.assert_called_once()
+
+def test_iter_profile_batches_pages_by_keyset(mock_db_conn):
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+    # chunk 1 is full (2 rows), chunk 2 is short so iteration stops
+    mock_cursor.fetchmany.side_effect = [[(1, "a"), (2, "b")], [], [(3, "c")], []]
+
+    repo = Repository()
+    batches = list(repo.iter_profile_batches(after_id=0, batch_size=2, chunk_size=2))
+
+    assert batches == [[(1, "a"), (2, "b")], [(3, "c")]]
+    after_ids = [c.args[1][0] for c in mock_cursor.execute.call_args_list]
+    assert after_ids == [0, 2]
+
+def test_index_watermark_reads_max_id_and_count(mock_db_conn):
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+    mock_cursor.fetchone.return_value = (42, 7)
+
+    assert Repository().index_watermark(after_id=30) == (42, 7)
+    assert mock_cursor.execute.call_args.args[1] == (30,)
+
+def test_find_by_hash_served_from_cache_and_invalidated_on_insert(mock_db_conn):
+    from infrastructure.search_cache import InMemorySearchCache
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+    mock_cursor.fetchall.return_value = []
+
+    # Caching misses is opt-in (single-process deployments)
+    repo = Repository(search_cache=InMemorySearchCache(cache_misses=True))
+    assert repo.find_by_hash("idx") == []
+    assert repo.find_by_hash("idx") == []
+    assert mock_cursor.fetchall.call_count == 1
+
+    repo.save_user_profile("blob", "idx")
+    mock_cursor.fetchall.return_value = [(1, "blob")]
+    assert repo.find_by_hash("idx") == [(1, "blob")]
+
+def test_find_by_hash_short_circuits_definite_miss(mock_db_conn):
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+    index_filter = MagicMock()
+    index_filter.might_contain.return_value = False
+
+    repo = Repository(index_filter=index_filter)
+
+    assert repo.find_by_hash("idx") == []
+    mock_connect.assert_not_called()
+    repo.save_user_profile("blob", "idx")
+    index_filter.add.assert_called_once_with("idx")
+
+def test_binary_layout_uses_bytea_columns(mock_db_conn):
+    from infrastructure.storage_layout import StorageLayout
+    mock_connect, mock_conn, mock_cursor = mock_db_conn
+    mock_cursor.fetchall.return_value = [(1, memoryview(b"\x01blob"))]
+
+    repo = Repository(storage_layout=StorageLayout("binary"))
+    result = repo.find_by_hash(b"\x00" * 32)
+    with patch('infrastructure.repository.execute_values', return_value=[(memoryview(b"\x02" * 32),)]) as mock_execute_values:
+        inserted = repo.save_user_profiles([(b"\x01blob", b"\x02" * 32)])
+
+    assert result == [(1, b"\x01blob")]
+    prepare = mock_cursor.execute.call_args_list[0].args[0]
+    assert "national_id_index_bin = $1" in prepare
+    assert "ON CONFLICT (national_id_index_bin)" in mock_execute_values.call_args.args[1]
+    assert inserted == {b"\x02" * 32}
@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import patch
+from infrastructure.search_cache import InMemorySearchCache, SharedSearchCache, LocalSharedStore
+
+def test_hit_and_miss_counters():
+    cache = InMemorySearchCache()
+
+    assert cache.get("idx") is None
+    cache.set("idx", [(1, "blob")])
+    assert cache.get("idx") == [(1, "blob")]
+
+    assert cache.describe()["hits"] == 1
+    assert cache.describe()["misses"] == 1
+
+def test_entries_expire():
+    cache = InMemorySearchCache(ttl=10)
+    with patch('infrastructure.search_cache.time.monotonic', return_value=100.0):
+        cache.set("idx", [])
+    with patch('infrastructure.search_cache.time.monotonic', return_value=111.0):
+        assert cache.get("idx") is None
+    assert cache.describe()["entries"] == 0
+
+def test_lru_eviction_by_count_and_bytes():
+    cache = InMemorySearchCache(max_entries=2, cache_misses=True)
+    cache.set("a", [])
+    cache.set("b", [])
+    cache.get("a")
+    cache.set("c", [])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == []
+
+    small = InMemorySearchCache(max_bytes=700)
+    small.set("a", [(1, "x" * 100)])
+    small.set("b", [(2, "x" * 100)])
+    small.set("c", [(3, "x" * 100)])
+    assert small.describe()["bytes"] <= 700
+    assert small.get("a") is None
+
+def test_misses_are_not_cached_unless_enabled():
+    cache = InMemorySearchCache()
+    cache.set("idx", [])
+
+    assert cache.get("idx") is None
+    single_process = InMemorySearchCache(cache_misses=True)
+    single_process.set("idx", [])
+    assert single_process.get("idx") == []
+
+def test_invalidation_discards_racing_read():
+    cache = InMemorySearchCache()
+    token = cache.read_token()
+    cache.invalidate("idx")  # insert committed while the DB read was running
+
+    cache.set("idx", [], token)
+
+    assert cache.get("idx") is None
+
+def test_shared_cache_on_local_stand_in():
+    store = LocalSharedStore()
+    writer, reader = SharedSearchCache(store), SharedSearchCache(store)
+
+    writer.set("idx", [(1, "blob")])
+    assert reader.get("idx") == [(1, "blob")]
+    reader.invalidate("idx")
+    assert writer.get("idx") is None
+
+def test_shared_cache_discards_read_that_raced_an_insert():
+    store = LocalSharedStore()
+    reader, writer = SharedSearchCache(store), SharedSearchCache(store)
+    token = reader.read_token("idx")
+    writer.invalidate("idx")  # insert committed in another worker during the DB read
+
+    reader.set("idx", [], token)
+
+    assert reader.get("idx") is None
+    reader.set("idx", [(1, "blob")], reader.read_token("idx"))
+    assert writer.get("idx") == [(1, "blob")]
@@ -0,0 +1,38 @@
+import os
+import pytest
+from unittest.mock import patch
+from infrastructure.session_keys import SessionKeyCache, TransportSessionError
+
+def test_session_roundtrip():
+    cache = SessionKeyCache(ttl=60, max_entries=10)
+    key = os.urandom(32)
+
+    session_id = cache.create(key)
+    aesgcm = cache.get(session_id)
+
+    nonce = os.urandom(12)
+    assert aesgcm.decrypt(nonce, aesgcm.encrypt(nonce, b"data", None), None) == b"data"
+
+def test_expired_session_rejected():
+    cache = SessionKeyCache(ttl=60)
+    with patch('infrastructure.session_keys.time.monotonic', return_value=1000.0):
+        session_id = cache.create(os.urandom(32))
+
+    with patch('infrastructure.session_keys.time.monotonic', return_value=1061.0):
+        with pytest.raises(TransportSessionError):
+            cache.get(session_id)
+    assert len(cache) == 0
+
+def test_oldest_session_evicted_at_capacity():
+    cache = SessionKeyCache(ttl=60, max_entries=2)
+    first = cache.create(os.urandom(32))
+    cache.create(os.urandom(32))
+    cache.create(os.urandom(32))
+
+    assert len(cache) == 2
+    with pytest.raises(TransportSessionError):
+        cache.get(first)
+
+def test_rejects_non_aes_key():
+    with pytest.raises(ValueError):
+        SessionKeyCache().create(b"short")
@@ -0,0 +1,128 @@
+import os
+import base64
+import pytest
+from unittest.mock import MagicMock
+from infrastructure.sharding import ShardMap, ShardMapFile, StaticShardMap, ShardedRepository
+from infrastructure.storage_layout import StorageLayout
+from commands.rebalance_shards import ShardRebalancer
+
+class FakeShard:
+    """Dict-backed shard with the Repository methods sharding and rebalancing use."""
+    def __init__(self):
+        self.storage_layout = StorageLayout("binary")
+        self.rows = {}  # index -> (id, blob, created_at)
+        self.next_id = 1
+
+    def existing_indexes(self, indexes):
+        return {i for i in indexes if i in self.rows}
+
+    def insert_moved_rows(self, rows):
+        inserted = 0
+        for blob, index, created_at in rows:
+            if index not in self.rows:
+                self.rows[index] = (self.next_id, blob, created_at)
+                self.next_id += 1
+                inserted += 1
+        return inserted
+
+    def save_user_profile(self, blob, index):
+        if not self.insert_moved_rows([(blob, index, None)]):
+            raise ValueError("National ID already exists")
+
+    def find_by_hash(self, index):
+        row = self.rows.get(index)
+        return [(row[0], row[1])] if row else []
+
+    def find_by_hashes(self, indexes, chunk_size=1000):
+        return {index: self.find_by_hash(index) for index in indexes}
+
+    def iter_index_range_batches(self, lower, upper, after_id=0, batch_size=1000):
+        rows = sorted((row[0], row[1], index, row[2]) for index, row in self.rows.items()
+                      if index >= lower and (upper is None or index < upper))
+        for i in range(0, len(rows), batch_size):
+            yield rows[i:i + batch_size]
+
+    def delete_rows(self, ids):
+        doomed = [index for index, row in self.rows.items() if row[0] in set(ids)]
+        for index in doomed:
+            del self.rows[index]
+        return len(doomed)
+
+def test_even_map_spreads_random_indexes_evenly():
+    shard_map = ShardMap.even(["s0", "s1", "s2", "s3"], slots=1024)
+    counts = {}
+    for _ in range(20000):
+        owner, source = shard_map.route(os.urandom(32))
+        counts[owner] = counts.get(owner, 0) + 1
+
+    assert source is None
+    assert all(4300 < n < 5700 for n in counts.values())
+
+def test_text_and_binary_indexes_route_the_same():
+    shard_map = ShardMap.even(["s0", "s1", "s2"], slots=256)
+    index = os.urandom(32)
+
+    assert shard_map.route(index) == shard_map.route(base64.b64encode(index).decode())
+
+def test_map_round_trips_through_json_with_migrating_slots():
+    shard_map = ShardMap.even(["s0", "s1"], slots=16).start_move(4, 9, "s1")
+
+    restored = ShardMap.from_dict(shard_map.to_dict())
+
+    assert restored.owners == shard_map.owners
+    assert restored.migrating == {4: "s0", 5: "s0", 6: "s0", 7: "s0"}
+    assert restored.version == 1
+
+def test_lookups_fall_back_and_writes_check_old_shard_while_migrating():
+    s0, s1 = FakeShard(), FakeShard()
+    index = b"\x00" + os.urandom(31)  # slot 0
+    s0.insert_moved_rows([(b"blob", index, None)])
+    shard_map = ShardMap.even(["s0", "s1"], slots=16).start_move(0, 0, "s1")
+    repo = ShardedRepository({"s0": s0, "s1": s1}, StaticShardMap(shard_map))
+
+    assert repo.find_by_hash(index) == [(1, b"blob")]
+    assert repo.find_by_hashes([index, b"\xff" * 32]) == {index: [(1, b"blob")], b"\xff" * 32: []}
+    with pytest.raises(ValueError, match="already exists"):
+        repo.save_user_profile(b"other", index)
+    assert s1.rows == {}
+
+def test_rebalancer_moves_slot_rows_online(tmp_path):
+    s0, s1 = FakeShard(), FakeShard()
+    map_file = ShardMapFile(str(tmp_path / "shard_map.json"), reload_interval=0,
+                            default=ShardMap.even(["s0", "s1"], slots=16))
+    cache = MagicMock()
+    cache.get.return_value = None
+    repo = ShardedRepository({"s0": s0, "s1": s1}, map_file, search_cache=cache)
+    rows = [(os.urandom(16), bytes([prefix]) + os.urandom(31)) for prefix in range(0, 256, 8)]
+    for blob, index in rows:
+        repo.shards[map_file.current().route(index)[0]].save_user_profile(blob, index)
+    on_s0 = len(s0.rows)
+
+    counts = ShardRebalancer(repo, map_file, grace=0).move(0, 3, "s1")
+
+    assert counts["copied"] == counts["deleted"] == 8
+    assert len(s0.rows) == on_s0 - 8
+    shard_map = ShardMapFile(map_file.path).current()
+    assert shard_map.owners[:4] == ["s1"] * 4 and shard_map.migrating == {}
+    assert all(repo.find_by_hash(index)[0][1] == blob for blob, index in rows)
+    assert cache.invalidate.call_count == 8
+
+def test_sharded_app_migrates_every_shard_and_rejects_unsupported_entry_points(crypto_env, monkeypatch):
+    from unittest.mock import patch
+    from app import create_app
+    from asgi import create_asgi_app
+    from infrastructure.container import ServiceContainer
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.setenv("DATABASE_SHARDS", "s0=postgresql://db0/uppass")
+    repo = ShardedRepository({"s0": FakeShard()}, StaticShardMap(ShardMap.even(["s0"], slots=16)))
+    services = ServiceContainer(repository=repo)
+
+    with patch("app.run_migrations") as migrate:
+        create_app(services)
+    migrate.assert_called_once_with(repo)
+
+    monkeypatch.setenv("EXPORT_API_ENABLED", "1")
+    with pytest.raises(ValueError, match="EXPORT_API_ENABLED"):
+        create_app(services)
+    with pytest.raises(ValueError, match="ASGI"):
+        create_asgi_app(services)
@@ -0,0 +1,86 @@
+import os
+import pytest
+import base64
+from unittest.mock import patch, MagicMock
+from infrastructure.crypto_service import CryptoService
+from infrastructure.storage_cipher_adapters import VersionedStorageCipher
+from infrastructure.storage_layout import StorageLayout, blob_to_binary, blob_to_text, index_to_binary
+
+@pytest.fixture
+def service_for(monkeypatch):
+    monkeypatch.setenv("DEK_KEY", "MDEyMzQ1Njc4OTAxMjM0NTY3ODkwMTIzNDU2Nzg5MDE=")
+    monkeypatch.setenv("HMAC_KEY", "NmE0OWM1YjYyMDNmNDYyZDFjMmY0MjAxMGQwYzNiYjU=")
+
+    def _make(layout: str) -> CryptoService:
+        monkeypatch.setenv("STORAGE_LAYOUT", layout)
+        with patch.object(CryptoService, '_load_private_key', return_value=MagicMock()):
+            return CryptoService()
+    return _make
+
+def test_binary_layout_is_compact_and_round_trips(service_for):
+    binary = service_for("binary")
+    text = service_for("text")
+
+    blob = binary.encrypt_for_storage("1234567890123")
+    index = binary.hash_for_index("1234567890123")
+
+    assert isinstance(blob, bytes) and blob[0] == 1
+    assert len(blob) < len(text.encrypt_for_storage("1234567890123"))
+    assert index == index_to_binary(text.hash_for_index("1234567890123"))
+    assert len(index) == 32
+    assert binary.decrypt_from_storage(memoryview(blob)) == "1234567890123"
+
+def test_both_layouts_decrypt_during_conversion(service_for):
+    service = service_for("dual")
+    text_blob = service.encrypt_for_storage("1234567890123")
+    binary_blob = blob_to_binary(text_blob)
+
+    assert blob_to_text(binary_blob) == text_blob
+    assert service.decrypt_from_storage_many([text_blob, binary_blob]) == ["1234567890123"] * 2
+
+def test_reencrypt_keeps_layout(service_for):
+    service = service_for("binary")
+    legacy = blob_to_binary(service_for("text").encrypt_for_storage("1234567890123"))
+    assert service.reencrypt_for_storage(legacy) is None  # already on v1
+
+    service.key_registry.register(VersionedStorageCipher("v2", b"k" * 32))
+    service.key_registry.activate("v2")
+    [rotated] = service.reencrypt_for_storage_many([legacy])
+    assert rotated[0] == 2
+    assert service.decrypt_from_storage(rotated) == "1234567890123"
+
+def test_blob_without_numeric_version_cannot_be_reframed():
+    blob = base64.b64encode(b"legacy:" + b"\x00" * 28).decode()
+    with pytest.raises(ValueError):
+        blob_to_binary(blob)
+
+def test_dual_layout_writes_both_column_sets():
+    layout = StorageLayout("dual")
+    text_blob = base64.b64encode(b"v1:" + b"\x01" * 28).decode()
+    text_index = base64.b64encode(b"\x02" * 32).decode()
+
+    params = layout.insert_params(text_blob, text_index)
+
+    assert params[:2] == (text_blob, text_index)
+    assert params[2] == b"\x01" + b"\x01" * 28
+    assert params[3] == b"\x02" * 32
+    assert layout.lookup_params(text_index) == (b"\x02" * 32, text_index)
+    assert layout.normalize_rows([(1, None, text_blob), (2, memoryview(b"\x01ab"), None)]) == [
+        (1, text_blob), (2, b"\x01ab")
+    ]
+
+def test_batch_lookup_rows_are_keyed_like_the_callers_indexes():
+    index = os.urandom(32)
+    text_index = base64.b64encode(index).decode()
+
+    binary = StorageLayout("binary").normalize_batch_rows([(memoryview(index), 1, memoryview(b"\x01blob"))])
+    dual = StorageLayout("dual").normalize_batch_rows([(text_index, 1, None, "dGV4dA=="),
+                                                       (text_index, 2, b"\x01blob", "dGV4dA==")])
+
+    assert binary == {index: [(1, b"\x01blob")]}
+    assert dual == {text_index: [(1, "dGV4dA=="), (2, b"\x01blob")]}
+    assert StorageLayout("dual").batch_lookup_params([text_index]) == ([index], [text_index])
+
+def test_unknown_layout_is_rejected():
+    with pytest.raises(ValueError, match="Unknown STORAGE_LAYOUT"):
+        StorageLayout("columnar")
@@ -0,0 +1,69 @@
+import threading
+import pytest
+from infrastructure.transport_decryptor import TransportDecryptor, TransportQueueFullError
+
+@pytest.mark.parametrize("backend", ["inline", "thread", "process"])
+def test_backends_decrypt_payload(backend, rsa_private_key, make_transport_payload):
+    payload = make_transport_payload("1234567890123")
+    decryptor = TransportDecryptor(rsa_private_key, backend=backend, workers=2)
+    try:
+        plaintext = decryptor.decrypt(payload["national_id"], payload["encrypted_key"], payload["iv"])
+    finally:
+        decryptor.shutdown()
+
+    assert plaintext == "1234567890123"
+    assert decryptor.in_flight == 0
+
+def test_decrypt_many_reports_failures_per_item(rsa_private_key, make_transport_payload):
+    good = make_transport_payload("1234567890123")
+    bad = dict(good, iv="AAAAAAAAAAAAAAAA")
+    decryptor = TransportDecryptor(rsa_private_key, backend="thread", workers=2)
+    try:
+        results = decryptor.decrypt_many([
+            (good["national_id"], good["encrypted_key"], good["iv"]),
+            (bad["national_id"], bad["encrypted_key"], bad["iv"]),
+        ])
+    finally:
+        decryptor.shutdown()
+
+    assert results[0] == "1234567890123"
+    assert isinstance(results[1], Exception)
+
+def test_full_queue_rejects_fast(rsa_private_key, make_transport_payload):
+    payload = make_transport_payload("1234567890123")
+    decryptor = TransportDecryptor(rsa_private_key, backend="thread", workers=1, max_queue=1, queue_timeout=0.01)
+    gate = threading.Event()
+    decryptor._executor.submit(gate.wait)
+    decryptor.submit(payload["national_id"], payload["encrypted_key"], payload["iv"])
+    try:
+        assert decryptor.in_flight == 1
+        with pytest.raises(TransportQueueFullError):
+            decryptor.submit(payload["national_id"], payload["encrypted_key"], payload["iv"])
+    finally:
+        gate.set()
+        decryptor.shutdown()
+    assert decryptor.in_flight == 0
+
+def test_unknown_backend_rejected(rsa_private_key):
+    with pytest.raises(ValueError):
+        TransportDecryptor(rsa_private_key, backend="gpu")
+
+def test_decrypt_many_leaves_queue_slots_for_others(rsa_private_key, make_transport_payload):
+    payload = make_transport_payload("1234567890123")
+    decryptor = TransportDecryptor(rsa_private_key, backend="thread", workers=2, max_queue=8, batch_in_flight=2)
+    peak = []
+    submit = decryptor.submit
+
+    def tracking_submit(*args):
+        future = submit(*args)
+        peak.append(decryptor.in_flight)
+        return future
+
+    decryptor.submit = tracking_submit
+    try:
+        results = decryptor.decrypt_many([(payload["national_id"], payload["encrypted_key"], payload["iv"])] * 10)
+    finally:
+        decryptor.shutdown()
+
+    assert results == ["1234567890123"] * 10
+    assert max(peak) <= 2
@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+from infrastructure.crypto_service import CryptoService
+from queries.export_profiles import ExportQueryHandler
+from domain.models import ExportProfilesRequestModel
+
+@pytest.fixture
+def handler(crypto_env):
+    crypto_service = CryptoService()
+    created = datetime(2024, 3, 1, 12, 0)
+    repository = MagicMock()
+    repository.iter_export_batches.return_value = iter([
+        [(1, crypto_service.encrypt_for_storage("1234567890123"), created),
+         (2, crypto_service.encrypt_for_storage("3210987654321"), created)],
+        [(3, "bm90LWEtYmxvYg==", None)],
+    ])
+    return ExportQueryHandler(crypto_service, repository)
+
+def test_ndjson_export_streams_one_chunk_per_batch(handler):
+    query = ExportProfilesRequestModel(after_id=0, created_from="2024-01-01", fetch_size=2)
+
+    chunks = list(handler.stream(query))
+
+    assert len(chunks) == 2
+    records = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert records[:2] == [
+        {"id": 1, "national_id": "1234567890123", "created_at": "2024-03-01T12:00:00"},
+        {"id": 2, "national_id": "3210987654321", "created_at": "2024-03-01T12:00:00"},
+    ]
+    # An undecryptable row is reported, not fatal
+    assert records[2] == {"id": 3, "national_id": None, "created_at": None, "error": "undecryptable"}
+    handler.repository.iter_export_batches.assert_called_once_with(
+        0, datetime(2024, 1, 1), None, batch_size=2
+    )
+
+def test_csv_export_has_header_and_rows(handler):
+    body = "".join(handler.stream(ExportProfilesRequestModel(format="csv")))
+
+    rows = list(csv.DictReader(io.StringIO(body)))
+    assert [row["id"] for row in rows] == ["1", "2", "3"]
+    assert rows[0]["national_id"] == "1234567890123"
+    assert rows[2]["error"] == "undecryptable"
@@ -0,0 +1,42 @@
+import pytest
+from unittest.mock import MagicMock
+from infrastructure.crypto_service import CryptoService
+from queries.search_data import SearchBatchQueryHandler
+
+@pytest.fixture
+def crypto_service(crypto_env):
+    return CryptoService()
+
+def test_batch_search_maps_hits_and_misses_back_to_inputs(crypto_service):
+    hit = crypto_service.hash_for_index("1234567890123")
+    repository = MagicMock()
+    repository.find_by_hashes.side_effect = lambda indexes, chunk_size: {
+        index: [(7, crypto_service.encrypt_for_storage("1234567890123"))] if index == hit else []
+        for index in indexes
+    }
+    handler = SearchBatchQueryHandler(crypto_service, repository)
+
+    results = handler.handle(["3210987654321", "1234567890123", "12ab", "1234567890123"])
+
+    assert results == [
+        {"status": "not_found"},
+        {"status": "found", "matches": [{"id": 7, "data": "1234567890123"}]},
+        {"status": "invalid", "error": results[2]["error"]},
+        {"status": "found", "matches": [{"id": 7, "data": "1234567890123"}]},
+    ]
+    # Repeated IDs are hashed and looked up once
+    assert len(repository.find_by_hashes.call_args[0][0]) == 2
+
+def test_undecryptable_row_fails_only_its_item(crypto_service):
+    good, bad = crypto_service.hash_for_index_many(["1234567890123", "3210987654321"])
+    repository = MagicMock()
+    repository.find_by_hashes.return_value = {
+        good: [(1, crypto_service.encrypt_for_storage("1234567890123"))],
+        bad: [(2, "bm90LWEtYmxvYg==")],
+    }
+    handler = SearchBatchQueryHandler(crypto_service, repository)
+
+    results = handler.handle(["1234567890123", "3210987654321"])
+
+    assert results[0]["status"] == "found"
+    assert results[1] == {"status": "error", "error": "Could not decrypt stored value"}